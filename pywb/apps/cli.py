@@ -4,6 +4,8 @@ from argparse import ArgumentParser
 import logging
 import pkg_resources
 
+from pywb.utils.startup import StartupProfile
+
 
 #=============================================================================
 def get_version():
@@ -59,6 +61,8 @@ class BaseCli(object):
                             help='Enable debug mode')
         parser.add_argument('--profile', action='store_true',
                             help='Enable profile mode')
+        parser.add_argument('--startup-profile', action='store_true',
+                            help='Report the import and initialization time of each subsystem')
         parser.add_argument('--live', action='store_true',
                             help='Add live-web handler at /live')
         parser.add_argument('--record', action='store_true',
@@ -95,8 +99,14 @@ class BaseCli(object):
 
         self.extra_config['enable_auto_fetch'] = self.r.enable_auto_fetch
 
+        if self.r.startup_profile:
+            StartupProfile.enable()
+
         self.application = self.load()
 
+        if self.r.startup_profile:
+            StartupProfile.log_report()
+
         if self.r.profile:
             from werkzeug.contrib.profiler import ProfilerMiddleware
             self.application = ProfilerMiddleware(self.application)
@@ -173,10 +183,12 @@ class WarcServerCli(BaseCli):
     """CLI class for starting a WarcServer"""
 
     def load(self):
-        from pywb.warcserver.warcserver import WarcServer
+        with StartupProfile.timed('import warcserver'):
+            from pywb.warcserver.warcserver import WarcServer
 
         super(WarcServerCli, self).load()
-        return WarcServer(custom_config=self.extra_config)
+        with StartupProfile.timed('init WarcServer'):
+            return WarcServer(custom_config=self.extra_config)
 
 
 #=============================================================================
@@ -184,10 +196,12 @@ class WaybackCli(ReplayCli):
     """CLI class for starting the pywb's implementation of the Wayback Machine"""
 
     def load(self):
-        from pywb.apps.frontendapp import FrontEndApp
+        with StartupProfile.timed('import frontendapp'):
+            from pywb.apps.frontendapp import FrontEndApp
 
         super(WaybackCli, self).load()
-        return FrontEndApp(custom_config=self.extra_config)
+        with StartupProfile.timed('init FrontEndApp'):
+            return FrontEndApp(custom_config=self.extra_config)
 
 
 #=============================================================================
@@ -195,12 +209,14 @@ class LiveCli(BaseCli):
     """CLI class for starting pywb in replay server in live mode"""
 
     def load(self):
-        from pywb.apps.frontendapp import FrontEndApp
+        with StartupProfile.timed('import frontendapp'):
+            from pywb.apps.frontendapp import FrontEndApp
 
         self.r.live = True
 
         super(LiveCli, self).load()
-        return FrontEndApp(config_file=None, custom_config=self.extra_config)
+        with StartupProfile.timed('init FrontEndApp'):
+            return FrontEndApp(config_file=None, custom_config=self.extra_config)
 
 
 #=============================================================================
@@ -6,7 +6,6 @@ from six.moves.urllib.parse import urljoin, parse_qsl
 from six import iteritems
 from warcio.utils import to_native_str
 from warcio.timeutils import iso_date_to_timestamp, timestamp_to_iso_date
-from wsgiprox.wsgiprox import WSGIProxMiddleware
 
 from pywb.recorder.multifilewarcwriter import MultiFileWARCWriter
 from pywb.recorder.recorderapp import RecorderApp
@@ -16,10 +15,12 @@ from pywb.recorder.redisindexer import WritableRedisIndexer, RedisPendingCounter
 from pywb.utils.loaders import load_yaml_config
 from pywb.utils.geventserver import GeventServer
 from pywb.utils.io import StreamIter
+from pywb.utils.startup import StartupProfile
 from pywb.utils.wbexception import WbException, AppPageNotFound
 
 from pywb.warcserver.warcserver import WarcServer
 
+from pywb.rewrite.content_rewriter import ManifestRewriter
 from pywb.rewrite.templateview import BaseInsertView
 
 from pywb.apps.static_handler import StaticHandler
@@ -70,8 +71,9 @@ class FrontEndApp(object):
         """
         config_file = config_file or './config.yaml'
         self.handler = self.handle_request
-        self.warcserver = WarcServer(config_file=config_file,
-                                     custom_config=custom_config)
+        with StartupProfile.timed('init WarcServer'):
+            self.warcserver = WarcServer(config_file=config_file,
+                                         custom_config=custom_config)
         self.recorder = None
         self.recorder_path = None
         self.put_custom_record_path = None
@@ -88,7 +90,8 @@ class FrontEndApp(object):
         self.proxy_record = False # indicate if proxy recording
         self.init_proxy(config)
 
-        self.init_recorder(config.get('recorder'))
+        with StartupProfile.timed('init recorder'):
+            self.init_recorder(config.get('recorder'))
 
         self.init_autoindex(config.get('autoindex'))
 
@@ -96,14 +99,16 @@ class FrontEndApp(object):
         self.static_handler = StaticHandler(static_path)
 
         self.cdx_api_endpoint = config.get('cdx_api_endpoint', '/cdx')
+        self.enable_stats = config.get('enable_stats', False)
         self.query_limit = config.get('query_limit')
 
         upstream_paths = self.get_upstream_paths(self.warcserver_server.port)
 
         framed_replay = config.get('framed_replay', True)
-        self.rewriterapp = self.REWRITER_APP_CLS(framed_replay,
-                                                 config=config,
-                                                 paths=upstream_paths)
+        with StartupProfile.timed('init RewriterApp'):
+            self.rewriterapp = self.REWRITER_APP_CLS(framed_replay,
+                                                     config=config,
+                                                     paths=upstream_paths)
 
         self.templates_dir = config.get('templates_dir', 'templates')
         self.static_dir = config.get('static_dir', 'static')
@@ -122,6 +127,9 @@ class FrontEndApp(object):
         self.url_map.add(Rule('/static/<path:filepath>', endpoint=self.serve_static))
         self.url_map.add(Rule('/collinfo.json', endpoint=self.serve_listing))
 
+        if self.enable_stats:
+            self.url_map.add(Rule('/_stats.json', endpoint=self.serve_stats))
+
         if self.is_valid_coll('$root'):
             coll_prefix = ''
         else:
@@ -258,7 +266,10 @@ class FrontEndApp(object):
 
         self.recorder = RecorderApp(self.RECORD_SERVER % str(self.warcserver_server.port), warc_writer,
                                     accept_colls=recorder_config.get('source_filter'),
-                                    create_buff_func=create_buff_func)
+                                    create_buff_func=create_buff_func,
+                                    write_workers=recorder_config.get('write_workers'),
+                                    write_queue_size=recorder_config.get('write_queue_size'),
+                                    stream_to_warc=recorder_config.get('stream_to_warc', False))
 
         recorder_server = GeventServer(self.recorder, port=0)
 
@@ -565,6 +576,24 @@ class FrontEndApp(object):
 
         return WbResponse.json_response(result)
 
+    def serve_stats(self, environ):
+        """Serves the current stats of the recorder write queue and of
+        the caches in use, if enabled with the 'enable_stats' config option
+
+        :param dict environ: The WSGI environment dictionary for the request
+        :return: WbResponse containing the stats
+        :rtype: WbResponse
+        """
+        result = self.warcserver.cache_stats()
+
+        if ManifestRewriter.manifest_cache is not None:
+            result['manifest_cache'] = ManifestRewriter.manifest_cache.stats()
+
+        if self.recorder:
+            result['recorder'] = self.recorder.stats()
+
+        return WbResponse.json_response(result)
+
     def is_valid_coll(self, coll):
         """Determines if the collection name for a request is valid (exists)
 
@@ -744,6 +773,10 @@ class FrontEndApp(object):
 
         self.proxy_coll = proxy_coll
 
+        # wsgiprox, and the certauth and tldextract it imports, only in proxy mode
+        with StartupProfile.timed('import wsgiprox'):
+            from wsgiprox.wsgiprox import WSGIProxMiddleware
+
         self.handler = WSGIProxMiddleware(self.handle_request,
                                           self.proxy_route_request,
                                           proxy_host=proxy_config.get('host', 'pywb.proxy'),
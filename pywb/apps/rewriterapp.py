@@ -1,13 +1,11 @@
-from io import BytesIO
-
 import requests
-from fakeredis import FakeStrictRedis
 from six.moves.urllib.parse import unquote, urlencode, urlsplit, urlunsplit
 from warcio.bufferedreaders import BufferedReader
 from warcio.recordloader import ArcWarcRecordLoader
 from warcio.timeutils import http_date_to_timestamp, timestamp_to_http_date
 
 from pywb.apps.wbrequestresponse import WbResponse
+from pywb.rewrite.content_rewriter import ManifestRewriter
 from pywb.rewrite.cookies import CookieTracker
 from pywb.rewrite.default_rewriter import DefaultRewriter, RewriterWithJSProxy
 from pywb.rewrite.rewriteinputreq import RewriteInputRequest
@@ -17,6 +15,7 @@ from pywb.rewrite.wburl import WbUrl
 from pywb.utils.canonicalize import canonicalize
 from pywb.utils.io import BUFF_SIZE, OffsetLimitReader, no_except_close
 from pywb.utils.memento import MementoUtils
+from pywb.utils.startup import StartupProfile
 from pywb.utils.wbexception import NotFoundException, UpstreamException
 from pywb.warcserver.index.cdxobject import CDXObject
 
@@ -57,10 +56,9 @@ class RewriterApp(object):
 
         self.enable_prefer = self.config.get('enable_prefer', False)
 
-        self.default_rw = DefaultRewriter(replay_mod=self.replay_mod,
-                                          config=config)
-
-        self.js_proxy_rw = RewriterWithJSProxy(replay_mod=self.replay_mod)
+        # the rewriters, and rules of each, are created on first use
+        self._default_rw = None
+        self._js_proxy_rw = None
 
         if not jinja_env:
             jinja_env = JinjaEnv(globals={'static_path': 'static'},
@@ -93,7 +91,7 @@ class RewriterApp(object):
 
         self.use_js_obj_proxy = config.get('use_js_obj_proxy', True)
 
-        self.cookie_tracker = self._init_cookie_tracker()
+        self._cookie_tracker = None
 
         self.enable_memento = self.config.get('enable_memento')
 
@@ -108,6 +106,51 @@ class RewriterApp(object):
         # deprecated: Use X-Forwarded-Proto header instead!
         self.force_scheme = config.get('force_scheme')
 
+        self.live_range_passthrough = config.get('live_range_passthrough', True)
+
+        if 'manifest_cache' in self.config:
+            ManifestRewriter.init_manifest_cache(self.config['manifest_cache'])
+
+    @property
+    def default_rw(self):
+        """The default rewriter, created on first use"""
+        if not self._default_rw:
+            with StartupProfile.timed('DefaultRewriter'):
+                self._default_rw = DefaultRewriter(replay_mod=self.replay_mod,
+                                                   config=self.config)
+
+        return self._default_rw
+
+    @default_rw.setter
+    def default_rw(self, value):
+        self._default_rw = value
+
+    @property
+    def js_proxy_rw(self):
+        """The rewriter for JS object proxy replay, created on first use"""
+        if not self._js_proxy_rw:
+            with StartupProfile.timed('RewriterWithJSProxy'):
+                self._js_proxy_rw = RewriterWithJSProxy(replay_mod=self.replay_mod)
+
+        return self._js_proxy_rw
+
+    @js_proxy_rw.setter
+    def js_proxy_rw(self, value):
+        self._js_proxy_rw = value
+
+    @property
+    def cookie_tracker(self):
+        """The cookie tracker, created on first use"""
+        if not self._cookie_tracker:
+            with StartupProfile.timed('CookieTracker'):
+                self._cookie_tracker = self._init_cookie_tracker()
+
+        return self._cookie_tracker
+
+    @cookie_tracker.setter
+    def cookie_tracker(self, value):
+        self._cookie_tracker = value
+
     def _init_cookie_tracker(self, redis=None):
         """Initialize the CookieTracker
 
@@ -117,6 +160,7 @@ class RewriterApp(object):
         :rtype: CookieTracker
         """
         if redis is None:
+            from fakeredis import FakeStrictRedis
             redis = FakeStrictRedis()
         return CookieTracker(redis)
 
@@ -216,13 +260,29 @@ class RewriterApp(object):
 
         return mod, prefer
 
-    def _check_range(self, inputreq, wb_url):
+    def _is_native_range(self, kwargs):
+        """Returns T/F indicating if range requests should be passed through
+        to the origin as is. This is the case for live collections which
+        are not being recorded, as there is no need to load the full response
+
+        :param dict kwargs: The collection config for the request
+        :return: T/F if range requests are passed through to the origin
+        :rtype: bool
+        """
+        return (self.live_range_passthrough and
+                kwargs.get('index') == '$live' and
+                kwargs.get('type') != 'record')
+
+    def _check_range(self, inputreq, wb_url, native_range=False):
         """Checks the input request if it is a range request returning
         the start and end of the range as well as T/F if the request should
         be skipped as a tuple.
 
         :param RewriteInputRequest inputreq: The input request to check range
         :param WbUrl wb_url: The WbUrl associated with the request
+        :param bool native_range: If true, the Range (and If-Range) header is
+            always forwarded to the origin, and the range is only applied locally
+            if the origin returns the full response
         :return: A tuple with the start, end, and T/F should skip request
         :rtype: tuple[int|None, int|None, bool]
         """
@@ -248,7 +308,8 @@ class RewriterApp(object):
         range_end = end
 
         # if start with 0, load from upstream, but add range after
-        if start == 0:
+        # unless passing range through to origin
+        if start == 0 and not native_range:
             del inputreq.env['HTTP_RANGE']
         else:
             skip_record = True
@@ -259,7 +320,13 @@ class RewriterApp(object):
         if range_end is None and range_start is None:
             return
 
-        if record.http_headers.get_statuscode() != '200':
+        status = record.http_headers.get_statuscode()
+
+        # range already applied by the origin, serve partial content as is
+        if status == '206':
+            return True
+
+        if status != '200':
             return
 
         content_length = (record.http_headers.
@@ -417,9 +484,12 @@ class RewriterApp(object):
 
         inputreq = RewriteInputRequest(environ, urlkey, wb_url.url, content_rw)
 
-        inputreq.include_method_query(wb_url.url)
+        # no fuzzy matching for live, so no need to read the request body
+        inputreq.include_method_query(wb_url.url,
+                                      read_body=kwargs.get('index') != '$live')
 
-        range_start, range_end, skip_record = self._check_range(inputreq, wb_url)
+        range_start, range_end, skip_record = self._check_range(inputreq, wb_url,
+                                                                self._is_native_range(kwargs))
 
         setcookie_headers = None
         cookie_key = None
@@ -712,9 +782,9 @@ class RewriterApp(object):
         return WbResponse.text_response(resp, status=status, content_type='text/html')
 
     def _do_req(self, inputreq, wb_url, kwargs, skip_record):
-        req_data = inputreq.reconstruct_request(wb_url.url)
+        req_stream, req_len = inputreq.reconstruct_request_stream(wb_url.url)
 
-        headers = {'Content-Length': str(len(req_data)),
+        headers = {'Content-Length': str(req_len),
                    'Content-Type': 'application/request'}
 
         headers.update(inputreq.warcserver_headers)
@@ -735,7 +805,7 @@ class RewriterApp(object):
         upstream_url = self.get_upstream_url(wb_url, kwargs, params)
 
         r = requests.post(upstream_url,
-                          data=BytesIO(req_data),
+                          data=req_stream,
                           headers=headers,
                           stream=True)
 
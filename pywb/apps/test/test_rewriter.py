@@ -4,6 +4,7 @@ from pywb.warcserver.test.testutils import LiveServerTests, BaseTestClass
 from pywb.warcserver.test.testutils import FakeRedisTests
 
 from pywb.apps.frontendapp import FrontEndApp
+from pywb.utils.startup import StartupProfile
 
 import os
 import webtest
@@ -36,6 +37,21 @@ class TestRewriterApp(FakeRedisTests, BaseTestClass):
 
         assert '"http://example.com/"' in resp.text
 
+    def test_lazy_init(self):
+        app = FrontEndApp(custom_config=LIVE_CONFIG, config_file=None).rewriterapp
+
+        assert app._default_rw is None
+        assert app._js_proxy_rw is None
+        assert app._cookie_tracker is None
+
+        assert app.default_rw is app.default_rw
+        assert app.js_proxy_rw is not app.default_rw
+        assert app.cookie_tracker is app.cookie_tracker
+
+        assert 'DefaultRewriter' in StartupProfile.timings
+        assert 'CookieTracker' in StartupProfile.timings
+        assert any('DefaultRewriter' in line for line in StartupProfile.report())
+
     #def test_cookie_track_1(self):
     #    resp = self.testapp.get('/live/mp_/https://twitter.com/')
 
@@ -1,6 +1,13 @@
 from gevent.monkey import patch_all; patch_all()
-from pywb.apps.frontendapp import FrontEndApp
+from pywb.utils.startup import StartupProfile
 
-application = FrontEndApp()
+with StartupProfile.timed('import frontendapp'):
+    from pywb.apps.frontendapp import FrontEndApp
+
+with StartupProfile.timed('init FrontEndApp'):
+    application = FrontEndApp()
+
+if StartupProfile.enabled:
+    StartupProfile.log_report()
 
 
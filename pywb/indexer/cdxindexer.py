@@ -1,5 +1,12 @@
 import os
 import sys
+import heapq
+import tempfile
+
+from contextlib import closing
+from multiprocessing import Pool
+
+from gevent.monkey import is_anything_patched
 
 # Use ujson if available
 try:
@@ -31,6 +38,9 @@ from argparse import ArgumentParser, RawTextHelpFormatter
 from six import StringIO
 
 from pywb.indexer.archiveindexer import DefaultRecordParser
+from pywb.utils.io import atomic_write
+from pywb.warcserver.index.indexfilter import IndexFilter
+from pywb.warcserver.index.digestindex import DigestIndex
 import codecs
 import six
 
@@ -155,8 +165,21 @@ class CDX11(object):
 
 #=================================================================
 class SortedCDXWriter(BaseCDXWriter):
+    """ Sorts all cdx lines before writing them out.
+
+    Lines are sorted in memory until more than MAX_SORT_SIZE characters
+    are buffered, then written out to a sorted temp run file. The runs
+    are merged on exit, combining runs whenever there are more than
+    MAX_RUNS of them, to keep the number of open files bounded.
+    """
+    MAX_SORT_SIZE = 64 * 1024 * 1024
+
+    MAX_RUNS = 64
+
     def __enter__(self):
         self.sortlist = []
+        self.sort_size = 0
+        self.runs = []
         res = super(SortedCDXWriter, self).__enter__()
         self.actual_out = self.out
         return res
@@ -167,13 +190,67 @@ class SortedCDXWriter(BaseCDXWriter):
         line = self.out.getvalue()
         if line:
             self.sortlist.append(line)
+            self.sort_size += len(line)
+            if self.sort_size >= self.MAX_SORT_SIZE:
+                self._write_run()
 
-    def __exit__(self, *args):
+    def _write_run(self):
         self.sortlist.sort()
-        self.actual_out.write(''.join(self.sortlist))
+        run = tempfile.TemporaryFile()
+        run.write(''.join(self.sortlist).encode('utf-8'))
+        run.seek(0)
+
+        self.sortlist = []
+        self.sort_size = 0
+
+        self.runs.append(run)
+        if len(self.runs) > self.MAX_RUNS:
+            self.runs = [merge_runs(self.runs)]
+
+    def __exit__(self, *args):
+        if not self.runs:
+            self.sortlist.sort()
+            self.actual_out.write(''.join(self.sortlist))
+            return False
+
+        try:
+            if self.sortlist:
+                self._write_run()
+
+            for line in heapq.merge(*self.runs):
+                self.actual_out.write(line.decode('utf-8'))
+        finally:
+            for run in self.runs:
+                run.close()
+
         return False
 
 
+#=================================================================
+def iter_run_lines(fh):
+    """ yield lines of a cdx run, skipping the cdx header
+    """
+    for line in fh:
+        if not line.startswith(b' CDX'):
+            yield line
+
+
+#=================================================================
+def merge_runs(runs):
+    """ merge and close sorted binary run files,
+    return a new temp file with the merged lines
+    """
+    merged = tempfile.TemporaryFile()
+    try:
+        merged.writelines(heapq.merge(*[iter_run_lines(run) for run in runs]))
+    finally:
+        for run in runs:
+            run.close()
+
+    merged.seek(0)
+    return merged
+
+
 #=================================================================
 ALLOWED_EXT = ('.arc', '.arc.gz', '.warc', '.warc.gz')
 
@@ -262,19 +339,37 @@ def get_cdx_writer_cls(options):
 def write_multi_cdx_index(output, inputs, **options):
     recurse = options.get('recurse', False)
     rel_root = options.get('rel_root')
+    workers = options.pop('workers', None) or 1
+
+    # a worker pool may deadlock in a process patched by gevent,
+    # so index in process instead
+    if is_anything_patched():
+        workers = 1
 
     # write one cdx per dir
     if output != '-' and os.path.isdir(output):
+        jobs = []
         for fullpath, filename in iter_file_or_dir(inputs,
                                                    recurse,
                                                    rel_root):
             outpath = cdx_filename(filename)
             outpath = os.path.join(output, outpath)
+            jobs.append((fullpath, filename, outpath, options))
 
-            with open(outpath, 'wb') as outfile:
-                with open(fullpath, 'rb') as infile:
-                    writer = write_cdx_index(outfile, infile, filename,
-                                             **options)
+        if workers > 1:
+            # only the last input for each output file is kept, as when
+            # indexing one at a time
+            jobs = list(dict((job[2], job) for job in jobs).values())
+
+            with closing(Pool(workers)) as pool:
+                for _ in pool.imap_unordered(_index_to_file_job, jobs):
+                    pass
+
+            return None
+
+        writer = None
+        for job in jobs:
+            writer = _index_to_file(job)
 
         return writer
 
@@ -285,10 +380,38 @@ def write_multi_cdx_index(output, inputs, **options):
                 outfile = sys.stdout.buffer
             else:
                 outfile = sys.stdout
-        else:
-            outfile = open(output, 'wb')
 
-        writer_cls = get_cdx_writer_cls(options)
+            return _write_index(outfile, inputs, recurse, rel_root,
+                                workers, options)
+
+        # replaced once written, as the index may be in use
+        with atomic_write(output) as outfile:
+            writer = _write_index(outfile, inputs, recurse, rel_root,
+                                  workers, options)
+
+        if options.get('bloom'):
+            IndexFilter.write_for_index(output)
+
+        if options.get('digest_index'):
+            DigestIndex.write_for_index(output)
+
+        return writer
+
+
+#=================================================================
+def _write_index(outfile, inputs, recurse, rel_root, workers, options):
+    writer_cls = get_cdx_writer_cls(options)
+
+    if workers > 1:
+        with writer_cls(outfile) as writer:
+            _write_parallel_index(outfile,
+                                  iter_file_or_dir(inputs,
+                                                   recurse,
+                                                   rel_root),
+                                  workers,
+                                  options)
+
+    else:
         record_iter = DefaultRecordParser(**options)
 
         with writer_cls(outfile) as writer:
@@ -301,7 +424,103 @@ def write_multi_cdx_index(output, inputs, **options):
                     for entry in entry_iter:
                         writer.write(entry, filename)
 
-        return writer
+    return writer
+
+
+#=================================================================
+def _index_to_file(job):
+    fullpath, filename, outpath, options = job
+
+    with atomic_write(outpath) as outfile:
+        with open(fullpath, 'rb') as infile:
+            writer = write_cdx_index(outfile, infile, filename,
+                                     **options)
+
+    if options.get('bloom'):
+        IndexFilter.write_for_index(outpath)
+
+    if options.get('digest_index'):
+        DigestIndex.write_for_index(outpath)
+
+    return writer
+
+
+#=================================================================
+def _index_to_file_job(job):
+    _index_to_file(job)
+
+
+#=================================================================
+def _index_to_run(job):
+    fullpath, filename, options = job
+
+    with tempfile.NamedTemporaryFile(prefix='cdx-run-', delete=False) as outfile:
+        with open(fullpath, 'rb') as infile:
+            write_cdx_index(outfile, infile, filename, **options)
+
+    return outfile.name
+
+
+#=================================================================
+def _write_parallel_index(outfile, files, workers, options):
+    """ index each file in a worker process into a temp run, sorted
+    if 'sort' is set, and write the runs to outfile, either merged in
+    sorted order or concatenated in input order
+    """
+    jobs = [(fullpath, filename, options) for fullpath, filename in files]
+    run_names = []
+    runs = []
+
+    try:
+        with closing(Pool(workers)) as pool:
+            if not options.get('sort'):
+                for run_name in pool.imap(_index_to_run, jobs):
+                    run_names.append(run_name)
+                    with open(run_name, 'rb') as run:
+                        outfile.writelines(iter_run_lines(run))
+
+                return
+
+            for run_name in pool.imap_unordered(_index_to_run, jobs):
+                run_names.append(run_name)
+                runs.append(open(run_name, 'rb'))
+                if len(runs) > SortedCDXWriter.MAX_RUNS:
+                    runs = [merge_runs(runs)]
+
+        outfile.writelines(heapq.merge(*[iter_run_lines(run) for run in runs]))
+
+    finally:
+        for run in runs:
+            run.close()
+
+        for run_name in run_names:
+            os.remove(run_name)
+
+
+#=================================================================
+def write_zipnum_index(summary_file, inputs, lines_per_block=None,
+                       num_parts=None, **options):
+    """ index inputs into the ZipNum cluster with the given summary
+    (.idx) file, merging into the cluster if it already exists
+    """
+    from pywb.indexer.zipnumindexer import ZipNumWriter
+
+    options['sort'] = True
+    workers = options.get('workers')
+
+    out_dir = os.path.dirname(os.path.abspath(summary_file))
+    fd, temp_file = tempfile.mkstemp(dir=out_dir, suffix='.tmp')
+    os.close(fd)
+
+    try:
+        write_multi_cdx_index(temp_file, inputs, **options)
+
+        writer = ZipNumWriter(summary_file, lines_per_block, num_parts, workers)
+        writer.write([temp_file])
+    finally:
+        os.remove(temp_file)
+
+    return writer
 
 
 #=================================================================
@@ -373,6 +592,30 @@ POST append (-p) option
 Output CDX JSON format per line, with url timestamp first,
 followed by a json dict for all other fields:
 url timestamp { ... }
+"""
+
+    workers_help = """
+Index input files in parallel with this many worker processes.
+Sorted output is merged from the sorted index of each file, with
+memory use bounded by the sort buffer of each worker
+"""
+
+    bloom_help = """
+Also write a .bloom filter file next to each output index, used
+to skip index files which can not contain a url when looking up
+captures in a directory of indexes
+"""
+
+    digest_index_help = """
+Also write a .digests file next to each output index, mapping each
+payload digest to its original capture, used to resolve revisit
+records without another index lookup
+"""
+
+    zipnum_help = """
+Write a ZipNum cluster of gzip compressed blocks instead of a cdx file.
+The output is the path of the cluster summary (.idx) file. If the
+cluster exists, the new lines are merged into it
 """
 
     output_help = """
@@ -451,6 +694,29 @@ instead of current working directory
                         action='store_true',
                         help=minimal_json_help)
 
+    parser.add_argument('-w', '--workers',
+                        type=int,
+                        default=1,
+                        help=workers_help)
+
+    parser.add_argument('-b', '--bloom',
+                        action='store_true',
+                        help=bloom_help)
+
+    parser.add_argument('-g', '--digest-index',
+                        action='store_true',
+                        help=digest_index_help)
+
+    parser.add_argument('-z', '--zipnum',
+                        action='store_true',
+                        help=zipnum_help)
+
+    parser.add_argument('--zipnum-lines', type=int,
+                        help='Number of lines per ZipNum block')
+
+    parser.add_argument('--zipnum-parts', type=int,
+                        help='Number of ZipNum part files')
+
     parser.add_argument('-o', '--output',
                         default='-', help=output_help)
 
@@ -458,6 +724,25 @@ instead of current working directory
 
     cmd = parser.parse_args(args=args)
 
+    if cmd.zipnum:
+        if cmd.output == '-' or os.path.isdir(cmd.output):
+            parser.error('--zipnum requires the summary file as output')
+
+        write_zipnum_index(cmd.output, cmd.inputs,
+                           lines_per_block=cmd.zipnum_lines,
+                           num_parts=cmd.zipnum_parts,
+                           surt_ordered=not cmd.unsurt,
+                           include_all=cmd.allrecords,
+                           append_post=cmd.postappend,
+                           recurse=cmd.recurse,
+                           rel_root=cmd.dir_root,
+                           verify_http=cmd.verify,
+                           cdx09=cmd.cdx09,
+                           cdxj=cmd.cdxj,
+                           minimal=cmd.minimal_cdxj,
+                           workers=cmd.workers)
+        return
+
     write_multi_cdx_index(cmd.output, cmd.inputs,
                           sort=cmd.sort,
                           surt_ordered=not cmd.unsurt,
@@ -468,7 +753,10 @@ instead of current working directory
                           verify_http=cmd.verify,
                           cdx09=cmd.cdx09,
                           cdxj=cmd.cdxj,
-                          minimal=cmd.minimal_cdxj)
+                          minimal=cmd.minimal_cdxj,
+                          workers=cmd.workers,
+                          bloom=cmd.bloom,
+                          digest_index=cmd.digest_index)
 
 
 if __name__ == '__main__':
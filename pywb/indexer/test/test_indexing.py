@@ -246,6 +246,31 @@ def test_sorted_warc_gz():
     assert_cdx_match('dupes.cdx', 'dupes.warc.gz', sort=True)
     assert_cdx_match('iana.cdx', 'iana.warc.gz', sort=True)
 
+def test_sorted_warc_gz_spill_runs():
+    from pywb.indexer.cdxindexer import SortedCDXWriter
+    from mock import patch
+
+    with patch.object(SortedCDXWriter, 'MAX_SORT_SIZE', 1000), patch.object(SortedCDXWriter, 'MAX_RUNS', 4):
+        assert_cdx_match('iana.cdx', 'iana.warc.gz', sort=True)
+        assert_cdx_match('example.cdx', 'example.warc.gz', sort=True)
+
+def test_parallel_workers():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        def index(*args):
+            output = os.path.join(tmp_dir, 'out.cdxj')
+            main(list(args) + ['-o', output, TEST_WARC_DIR])
+            with open(output, 'rb') as fh:
+                return fh.read()
+
+        for args in (['-s', '-j'], ['-s'], ['-j']):
+            res = index(*args)
+            assert res.count(b'\n') > 100
+            assert index('-w', '3', *args) == res
+
+    finally:
+        shutil.rmtree(tmp_dir)
+
 def cli_lines(cmds):
     buff = BytesIO()
     orig = sys.stdout.buffer if hasattr(sys.stdout, 'buffer') else None
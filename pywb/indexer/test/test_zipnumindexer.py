@@ -0,0 +1,163 @@
+import os
+
+from mock import patch
+
+from pywb import get_test_dir
+from pywb.indexer import zipnumindexer
+from pywb.indexer.cdxindexer import main
+from pywb.indexer.zipnumindexer import ZipNumWriter
+from pywb.warcserver.index.aggregator import SimpleAggregator
+from pywb.warcserver.index.indexsource import FileIndexSource
+from pywb.warcserver.index.zipnum import LocMapResolver, ZipNumIndexSource
+
+
+TEST_CDX_DIR = get_test_dir() + 'cdxj/'
+TEST_WARC_DIR = get_test_dir() + 'warcs/'
+
+
+# ============================================================================
+def load_lines(source, **params):
+    res, errs = SimpleAggregator({'source': source})(params)
+    assert errs == {}
+    return [cdx.to_cdxj() for cdx in res]
+
+
+def zipnum_lines(summary, **params):
+    return load_lines(ZipNumIndexSource(summary, {'block_cache_size': 0}), **params)
+
+
+def merged_lines(cdx_files):
+    return b''.join(zipnumindexer.iter_merged_lines(cdx_files))
+
+
+def cluster_lines(summary):
+    writer = ZipNumWriter(summary)
+    locs = writer.load_loc()
+    lines = b''
+    for key, part, offset, length in writer.load_summary():
+        raw = writer._read_block(locs, part, offset, length)
+        lines += zipnumindexer.gzip_decompressor().decompress(raw)
+
+    return lines
+
+
+# ============================================================================
+def test_zipnum_write(tmpdir):
+    iana = TEST_CDX_DIR + 'iana.cdxj'
+    summary = os.path.join(str(tmpdir), 'index.idx')
+
+    count = ZipNumWriter(summary, lines_per_block=20, num_parts=3).write([iana])
+    assert count > 5
+
+    writer = ZipNumWriter(summary)
+    blocks = writer.load_summary()
+    assert len(blocks) == count
+    assert len(set(part for key, part, offset, length in blocks)) == 3
+    assert len(writer.load_loc()) == 3
+
+    assert cluster_lines(summary) == merged_lines([iana])
+
+    flat = FileIndexSource(iana)
+    for params in [dict(url='http://www.iana.org/'),
+                   dict(url='http://www.iana.org/_css/2013.1/fonts/opensans-bold.ttf'),
+                   dict(url='iana.org', matchType='domain'),
+                   dict(url='http://www.iana.org/domains/', matchType='prefix')]:
+        res = zipnum_lines(summary, **params)
+        assert res
+        assert res == load_lines(flat, **params)
+
+
+def test_zipnum_incremental(tmpdir):
+    iana = TEST_CDX_DIR + 'iana.cdxj'
+    new_indexes = [TEST_CDX_DIR + 'example2.cdxj', TEST_CDX_DIR + 'dupes.cdxj']
+
+    summary = os.path.join(str(tmpdir), 'index.idx')
+    ZipNumWriter(summary, lines_per_block=20, num_parts=2).write([iana])
+    old_parts = set(os.listdir(str(tmpdir)))
+
+    compressed = []
+    orig_compress_block = zipnumindexer.compress_block
+
+    def compress_block(buff):
+        compressed.append(buff)
+        return orig_compress_block(buff)
+
+    with patch('pywb.indexer.zipnumindexer.compress_block', compress_block):
+        count = ZipNumWriter(summary, lines_per_block=20, num_parts=2).write(new_indexes)
+
+    # only blocks around the new lines are compressed again
+    assert 0 < len(compressed) < count
+
+    assert cluster_lines(summary) == merged_lines([iana] + new_indexes)
+
+    # parts of the previous build kept until the next build
+    files = set(os.listdir(str(tmpdir)))
+    assert old_parts <= files
+    assert len([name for name in files if name.endswith('.cdx.gz')]) == 4
+
+    res = zipnum_lines(summary, url='http://example.com/', matchType='prefix')
+    assert len(res) == len(load_lines(FileIndexSource(TEST_CDX_DIR + 'example2.cdxj'), url='http://example.com/', matchType='prefix') +
+                           load_lines(FileIndexSource(TEST_CDX_DIR + 'dupes.cdxj'), url='http://example.com/', matchType='prefix'))
+
+    # parts of older builds removed
+    ZipNumWriter(summary, lines_per_block=20, num_parts=2).write([TEST_CDX_DIR + 'example.cdxj'])
+
+    files = set(os.listdir(str(tmpdir)))
+    assert not (old_parts - set(['index.idx', 'index.loc'])) & files
+    assert len([name for name in files if name.endswith('.cdx.gz')]) == 4
+    assert len(ZipNumWriter(summary).load_loc()) == 4
+
+
+def test_zipnum_read_while_rebuilt(tmpdir):
+    iana = TEST_CDX_DIR + 'iana.cdxj'
+    summary = os.path.join(str(tmpdir), 'index.idx')
+
+    ZipNumWriter(summary, lines_per_block=20).write([iana])
+
+    writer = ZipNumWriter(summary)
+    old_blocks = writer.load_summary()
+    old_lines = cluster_lines(summary)
+
+    resolver = LocMapResolver(summary, None)
+
+    ZipNumWriter(summary, lines_per_block=20).write([TEST_CDX_DIR + 'example2.cdxj'])
+
+    # blocks of the previous summary can still be read
+    locs = writer.load_loc()
+    lines = b''
+    for key, part, offset, length in old_blocks:
+        raw = writer._read_block(locs, part, offset, length)
+        lines += zipnumindexer.gzip_decompressor().decompress(raw)
+
+    assert lines == old_lines
+
+    # parts of the new summary found by a resolver loaded before
+    for key, part, offset, length in writer.load_summary():
+        assert os.path.isfile(resolver(part, None)[0])
+
+
+def test_zipnum_workers(tmpdir):
+    iana = TEST_CDX_DIR + 'iana.cdxj'
+
+    one = os.path.join(str(tmpdir), 'one.idx')
+    two = os.path.join(str(tmpdir), 'two.idx')
+
+    ZipNumWriter(one, lines_per_block=10).write([iana])
+    ZipNumWriter(two, lines_per_block=10, workers=2).write([iana])
+
+    assert cluster_lines(one) == cluster_lines(two)
+
+
+def test_cdx_indexer_zipnum(tmpdir):
+    summary = os.path.join(str(tmpdir), 'cluster.idx')
+
+    main(['-j', '-z', '--zipnum-lines', '10', '-o', summary, TEST_WARC_DIR + 'iana.warc.gz'])
+    main(['-j', '-z', '--zipnum-lines', '10', '-o', summary, TEST_WARC_DIR + 'example.warc.gz'])
+
+    lines = cluster_lines(summary)
+    assert b'"filename": "iana.warc.gz"' in lines
+    assert b'"filename": "example.warc.gz"' in lines
+    assert lines.splitlines() == sorted(lines.splitlines())
+
+    # no temp files left
+    assert sorted(os.listdir(str(tmpdir)))[-2:] == ['cluster.idx', 'cluster.loc']
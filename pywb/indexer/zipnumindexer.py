@@ -0,0 +1,337 @@
+import heapq
+import logging
+import os
+import zlib
+
+from contextlib import closing
+from multiprocessing import Pool
+
+from gevent.monkey import is_anything_patched
+from warcio.bufferedreaders import gzip_decompressor
+from warcio.timeutils import timestamp20_now
+
+from pywb.indexer.cdxindexer import iter_run_lines
+from pywb.utils.io import atomic_write
+
+
+#=================================================================
+def compress_block(buff):
+    """ compress a block of cdx lines as a single gzip member
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS + 16)
+    return compressor.compress(buff) + compressor.flush()
+
+
+#=================================================================
+def line_key(line):
+    """ the urlkey and timestamp of a cdx line, as stored in the summary
+    """
+    return b' '.join(line.split(b' ', 2)[:2])
+
+
+#=================================================================
+def iter_merged_lines(cdx_files):
+    """ yield the lines of sorted cdx files in sorted order,
+    skipping cdx headers, blank and duplicate lines
+    """
+    indexes = [open(cdx_file, 'rb') for cdx_file in cdx_files]
+    try:
+        last_line = None
+        for line in heapq.merge(*[iter_run_lines(index) for index in indexes]):
+            if not line.endswith(b'\n'):
+                line += b'\n'
+
+            if line != last_line and line.strip():
+                yield line
+                last_line = line
+    finally:
+        for index in indexes:
+            index.close()
+
+
+#=================================================================
+class ZipNumWriter(object):
+    """ Builds a ZipNum cluster from sorted cdx or cdxj index files.
+
+    The lines are written in gzip blocks of about 'lines_per_block'
+    lines, spread over 'num_parts' part files. The summary file
+    (<name>.idx) lists the first key, part, offset and length of each
+    block, and the <name>.loc file maps each part to its file.
+
+    If the cluster already exists, the new lines are merged into it.
+    Existing blocks which receive no new lines are copied as is,
+    without being decompressed, so that only the blocks around the
+    new lines are compressed again. Blocks are compressed in 'workers'
+    processes, a batch at a time.
+
+    Part files are always written with new names, and the summary and
+    loc are replaced atomically, so the cluster may be read while it is
+    being rebuilt. The parts of the previous build are kept, and listed
+    in the loc, until the next build, so that readers still using the
+    previous summary can read them.
+    """
+    DEFAULT_LINES_PER_BLOCK = 3000
+    DEFAULT_NUM_PARTS = 1
+
+    # blocks compressed per worker in each batch
+    BATCH_BLOCKS = 16
+
+    PART_EXT = '.cdx.gz'
+
+    def __init__(self, summary_file, lines_per_block=None, num_parts=None,
+                 workers=None):
+        self.summary_file = summary_file
+        self.dir = os.path.dirname(os.path.abspath(summary_file))
+        self.name = os.path.splitext(os.path.basename(summary_file))[0]
+        self.loc_file = os.path.join(self.dir, self.name + '.loc')
+
+        self.lines_per_block = lines_per_block or self.DEFAULT_LINES_PER_BLOCK
+        self.num_parts = num_parts or self.DEFAULT_NUM_PARTS
+        self.workers = workers or 1
+
+        # a worker pool may deadlock in a process patched by gevent
+        if is_anything_patched():
+            self.workers = 1
+
+    def write(self, cdx_files):
+        """ merge the lines of the sorted cdx_files into the cluster,
+        return the number of blocks written
+        """
+        old_blocks = self.load_summary()
+        old_locs = self.load_loc()
+
+        num_lines = 0
+        for cdx_file in cdx_files:
+            with open(cdx_file, 'rb') as fh:
+                num_lines += sum(1 for _ in fh)
+
+        total_blocks = len(old_blocks) + num_lines // self.lines_per_block + 1
+        blocks_per_part = total_blocks // self.num_parts + 1
+
+        build = timestamp20_now()
+        new_locs = []
+
+        summary_temp = self.summary_file + '.tmp.' + build
+
+        blocks = self._iter_blocks(iter_merged_lines(cdx_files),
+                                   old_blocks, old_locs)
+
+        count = 0
+        out = None
+
+        try:
+            with open(summary_temp, 'wb') as summary:
+                for key, data in self._compress_blocks(blocks):
+                    if not out or (count % blocks_per_part == 0 and
+                                   len(new_locs) < self.num_parts):
+                        if out:
+                            out.close()
+
+                        part = '{0}-{1}-{2:02d}'.format(self.name, build, len(new_locs))
+                        filename = part + self.PART_EXT
+                        new_locs.append((part, filename))
+                        out = open(os.path.join(self.dir, filename), 'wb')
+
+                    offset = out.tell()
+                    out.write(data)
+                    count += 1
+
+                    summary.write(b'\t'.join([key,
+                                              part.encode('utf-8'),
+                                              str(offset).encode('utf-8'),
+                                              str(len(data)).encode('utf-8'),
+                                              str(count).encode('utf-8')]) + b'\n')
+
+        except:
+            if out:
+                out.close()
+
+            for part, filename in new_locs:
+                os.remove(os.path.join(self.dir, filename))
+
+            os.remove(summary_temp)
+            raise
+
+        if out:
+            out.close()
+
+        # parts of the previous build are still read with the previous
+        # summary, those of older builds are no longer read
+        prev_parts = set(part for key, part, offset, length in old_blocks)
+
+        prev_loc_list = [(part, '\t'.join(paths)) for part, paths in old_locs.items()
+                         if part in prev_parts]
+
+        self._write_loc(new_locs + prev_loc_list)
+        os.rename(summary_temp, self.summary_file)
+
+        for part in old_locs:
+            if part in prev_parts:
+                continue
+
+            try:
+                os.remove(self._part_path(old_locs, part))
+            except (IOError, OSError):
+                pass
+
+        logging.debug('Wrote {0} blocks in {1} parts to {2}'.format(
+                      count, len(new_locs), self.summary_file))
+
+        return count
+
+    def load_summary(self):
+        """ return list of (key, part, offset, length) for
+        each block of the existing cluster
+        """
+        blocks = []
+        if not os.path.isfile(self.summary_file):
+            return blocks
+
+        with open(self.summary_file, 'rb') as fh:
+            for line in fh:
+                parts = line.rstrip().split(b'\t')
+                if len(parts) < 4:
+                    continue
+
+                blocks.append((parts[0],
+                               parts[1].decode('utf-8'),
+                               int(parts[2]),
+                               int(parts[3])))
+
+        return blocks
+
+    def load_loc(self):
+        """ return dict of part -> list of paths of the existing cluster
+        """
+        locs = {}
+        if not os.path.isfile(self.loc_file):
+            return locs
+
+        with open(self.loc_file, 'r') as fh:
+            for line in fh:
+                parts = line.rstrip().split('\t')
+                if len(parts) > 1:
+                    locs[parts[0]] = parts[1:]
+
+        return locs
+
+    def _write_loc(self, locs):
+        with atomic_write(self.loc_file, 'w') as fh:
+            for part, filename in locs:
+                fh.write(part + '\t' + filename + '\n')
+
+    def _part_path(self, locs, part):
+        for path in locs.get(part, []):
+            if '://' in path:
+                continue
+
+            path = os.path.join(self.dir, path)
+            if os.path.isfile(path):
+                return path
+
+        raise IOError('No local file found for part: ' + part)
+
+    def _read_block(self, locs, part, offset, length):
+        with open(self._part_path(locs, part), 'rb') as fh:
+            fh.seek(offset)
+            return fh.read(length)
+
+    def _iter_blocks(self, new_lines, old_blocks, old_locs):
+        """ yield (key, lines, raw) for each block of the new cluster,
+        where 'raw' is the compressed data of an unchanged existing block
+        and 'lines' is the uncompressed data of a new block
+        """
+        pending = []
+
+        def add_line(line):
+            # only split blocks between different keys, so that all
+            # lines of a block sort before the key of the next block
+            if (len(pending) >= self.lines_per_block and
+                line_key(line) != line_key(pending[-1])):
+                block = (line_key(pending[0]), b''.join(pending), None)
+                del pending[:]
+                pending.append(line)
+                return block
+
+            pending.append(line)
+            return None
+
+        # next new line, not yet added
+        head = [next(new_lines, None)]
+
+        for i, (key, part, offset, length) in enumerate(old_blocks):
+            next_key = old_blocks[i + 1][0] if i + 1 < len(old_blocks) else None
+
+            raw = self._read_block(old_locs, part, offset, length)
+
+            # no new lines before the next block, keep block as is
+            if head[0] is None or (next_key is not None and head[0] >= next_key):
+                if pending:
+                    yield (line_key(pending[0]), b''.join(pending), None)
+                    del pending[:]
+
+                yield (key, None, raw)
+                continue
+
+            # merge the new lines before the next block with this block
+            old_lines = gzip_decompressor().decompress(raw).splitlines(True)
+
+            last_line = None
+            for line in heapq.merge(old_lines, self._iter_until(new_lines, head, next_key)):
+                if line != last_line:
+                    block = add_line(line)
+                    if block:
+                        yield block
+
+                    last_line = line
+
+        for line in self._iter_until(new_lines, head, None):
+            block = add_line(line)
+            if block:
+                yield block
+
+        if pending:
+            yield (line_key(pending[0]), b''.join(pending), None)
+
+    @staticmethod
+    def _iter_until(lines, head, end_key):
+        """ yield head[0] and the following lines which sort before end_key,
+        leaving the first line not yielded in head[0]
+        """
+        while head[0] is not None and (end_key is None or head[0] < end_key):
+            yield head[0]
+            head[0] = next(lines, None)
+
+    def _compress_blocks(self, blocks):
+        """ yield (key, compressed data) for each block, compressing
+        a batch of blocks at a time in the worker pool
+        """
+        if self.workers > 1:
+            with closing(Pool(self.workers)) as pool:
+                for res in self._iter_batches(blocks, pool.map):
+                    yield res
+        else:
+            for res in self._iter_batches(blocks, lambda func, bufs: [func(buff) for buff in bufs]):
+                yield res
+
+    def _iter_batches(self, blocks, map_func):
+        batch_size = self.workers * self.BATCH_BLOCKS
+        batch = []
+
+        def flush():
+            compressed = iter(map_func(compress_block,
+                                       [lines for key, lines, raw in batch if raw is None]))
+
+            for key, lines, raw in batch:
+                yield key, raw if raw is not None else next(compressed)
+
+        for block in blocks:
+            batch.append(block)
+            if len(batch) >= batch_size:
+                for res in flush():
+                    yield res
+
+                batch = []
+
+        for res in flush():
+            yield res
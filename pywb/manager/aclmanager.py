@@ -4,6 +4,7 @@ import sys
 
 from pywb.manager.manager import CollectionsManager
 from pywb.utils.canonicalize import canonicalize
+from pywb.utils.io import atomic_write
 from pywb.warcserver.access_checker import AccessChecker
 from pywb.warcserver.index.cdxobject import CDXObject
 
@@ -122,10 +123,12 @@ class ACLManager(CollectionsManager):
             pass
 
         try:
-            with open(self.acl_file, 'wb') as fh:
+            with atomic_write(self.acl_file) as fh:
                 for acl in self.rules:
                     fh.write(acl.to_cdxj().encode('utf-8'))
 
+            self._notify_changed()
+
         except Exception as e:
             print('Error Saving ACL Rules: ' + str(e))
 
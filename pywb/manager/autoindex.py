@@ -1,18 +1,43 @@
 import gevent
+import json
 import time
 import re
 import os
 import logging
 
 from pywb.manager.manager import CollectionsManager
+from pywb.utils.io import atomic_write
+from pywb.warcserver.index.dirwatcher import INotify
 
 
 #=============================================================================
 class AutoIndexer(object):
+    """ Indexes new and growing archive files of all collections into
+    a tiered 'autoindex.cdxj' index in each collection.
+
+    The offset up to which each archive file has been indexed is
+    checkpointed in 'autoindex.cdxj.offsets', so that only the records
+    appended since are indexed, into a new index segment. The last
+    record of a file is only indexed once the file has not grown for
+    SETTLE_TIME seconds, as it may still be being written.
+
+    If inotify is available, archive dirs are watched and changed dirs
+    are checked within MIN_CHECK_INTERVAL seconds, while all archive
+    dirs are checked every 'interval' seconds.
+    """
     EXT_RX = re.compile('.*\.w?arc(\.gz)?$')
     AUTO_INDEX_FILE = 'autoindex.cdxj'
+    LAST_INDEXED_EXT = '.last'
+    OFFSETS_EXT = '.offsets'
+
+    SETTLE_TIME = 1.0
+
+    MIN_CHECK_INTERVAL = 1.0
+
+    WATCH_MASK = INotify.WATCH_MASK | INotify.IN_MODIFY | INotify.IN_CLOSE_WRITE
 
-    def __init__(self, colls_dir=None, interval=30, keep_running=True):
+    def __init__(self, colls_dir=None, interval=30, keep_running=True,
+                 use_inotify=True):
         self.manager = CollectionsManager('', colls_dir=colls_dir, must_exist=False)
 
         self.root_path = self.manager.colls_dir
@@ -21,6 +46,20 @@ class AutoIndexer(object):
 
         self.interval = interval
 
+        self.inotify = INotify.create() if use_inotify else None
+
+        # dir -> wd, wd -> dir
+        self.watched = {}
+        self.watches = {}
+
+        # dirs with records waiting to settle
+        self.pending_dirs = set()
+
+        # index file -> {path relative to archive dir: [offset, size]}
+        self.offsets = {}
+
+        self.last_full_check = 0
+
         self.last_size = {}
 
     def is_newer_than(self, path1, path2, track=False):
@@ -43,12 +82,76 @@ class AutoIndexer(object):
 
         return newer
 
-    def do_index(self, files):
-        logging.info('Auto-Indexing... ' + str(files))
-        self.manager.index_merge(files, self.AUTO_INDEX_FILE)
+    def do_index(self, tails):
+        logging.info('Auto-Indexing... ' + str([tail[0] for tail in tails]))
+        offsets = self.manager.index_segment_tails(tails, self.AUTO_INDEX_FILE)
         logging.info('...Done')
+        return offsets
+
+    def do_compact(self):
+        # merge in a thread, to keep serving requests while merging
+        # large segments
+        if gevent.get_hub().threadpool.apply(self.manager.compact_segments,
+                                              (self.AUTO_INDEX_FILE,)):
+            logging.info('Compacted Auto-Index')
+
+    def has_index(self, index_file):
+        return (os.path.isfile(index_file) or
+                bool(self.manager.list_segments(self.AUTO_INDEX_FILE)) or
+                self.manager.has_zipnum())
+
+    def get_last_indexed_file(self, index_file):
+        """ Return the file whose mtime is the last time the collection
+        was auto-indexed before offsets were checkpointed: the marker
+        file touched after each new segment, falling back to the index
+        file if there is no marker
+        """
+        marker_file = index_file + self.LAST_INDEXED_EXT
+
+        if os.path.isfile(marker_file):
+            return marker_file
+
+        return index_file
+
+    def load_offsets(self, index_file):
+        """ Return the checkpointed offsets for the index, and the last
+        indexed file if there are no checkpoints yet, in which case
+        files not newer than it are considered already indexed
+        """
+        offsets = self.offsets.get(index_file)
+        if offsets is not None:
+            return offsets, None
+
+        last_indexed_file = None
+
+        try:
+            with open(index_file + self.OFFSETS_EXT, 'r') as fh:
+                offsets = json.load(fh)
+        except (IOError, OSError, ValueError):
+            offsets = {}
+            if self.has_index(index_file):
+                last_indexed_file = self.get_last_indexed_file(index_file)
+
+        self.offsets[index_file] = offsets
+        return offsets, last_indexed_file
+
+    def save_offsets(self, index_file):
+        with atomic_write(index_file + self.OFFSETS_EXT, 'w') as fh:
+            json.dump(self.offsets[index_file], fh)
 
     def check_path(self):
+        now = time.time()
+
+        full_check = (not self.inotify or
+                      now - self.last_full_check >= self.interval)
+
+        changed_dirs, overflow = self._read_changes()
+        if overflow:
+            full_check = True
+
+        if full_check:
+            self.last_full_check = now
+
         for coll in os.listdir(self.root_path):
             coll_dir = os.path.join(self.root_path, coll)
             if not os.path.isdir(coll_dir):
@@ -69,20 +172,165 @@ class AutoIndexer(object):
                 except Exception as e:
                     pass
 
-            logging.info('Checking Collection: ' + coll)
-            to_index = []
-            for dirpath, dirnames, filenames in os.walk(archive_dir):
-                for filename in filenames:
-                    if not self.EXT_RX.match(filename):
-                        continue
+            coll_full_check = full_check
+
+            # no index, so index everything again
+            if not self.has_index(index_file):
+                self.offsets[index_file] = {}
+                coll_full_check = True
+
+            files = []
+            if coll_full_check:
+                logging.info('Checking Collection: ' + coll)
+                self._scan_dir(archive_dir, files, True)
+            else:
+                for the_dir in changed_dirs:
+                    if the_dir == archive_dir or the_dir.startswith(archive_dir + os.path.sep):
+                        self._scan_dir(the_dir, files, False)
+
+            offsets, last_indexed_file = self.load_offsets(index_file)
+            changed = last_indexed_file is not None
+
+            if coll_full_check:
+                rel_paths = set(os.path.relpath(path, archive_dir) for path in files)
+                for rel_path in list(offsets):
+                    if rel_path not in rel_paths:
+                        del offsets[rel_path]
+                        changed = True
+
+            tails = []
+            for path in files:
+                tail = self._get_tail(path, os.path.relpath(path, archive_dir),
+                                      offsets, last_indexed_file, now)
+                if tail:
+                    tails.append(tail)
+
+            if tails:
+                new_offsets = self.do_index(tails)
+
+                for path, offset, complete in tails:
+                    new_offset = new_offsets[path]
+                    offsets[os.path.relpath(path, archive_dir)][0] = new_offset
+                    if not complete:
+                        self.pending_dirs.add(os.path.dirname(path))
+
+                changed = True
 
-                    full_filename = os.path.join(dirpath, filename)
+            if changed:
+                self.save_offsets(index_file)
+
+            if tails or coll_full_check:
+                self.do_compact()
+
+    def _get_tail(self, path, rel_path, offsets, last_indexed_file, now):
+        """ Return (path, offset, complete) for the records of the file
+        not yet indexed, or None if there are none
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        size = stat.st_size
+        offset, last_size = offsets.get(rel_path, (None, None))
+
+        if offset is None:
+            if last_indexed_file and not self.is_newer_than(path, last_indexed_file):
+                offsets[rel_path] = [size, size]
+                return None
+
+            offset = 0
+
+        # file replaced, index again
+        elif size < offset:
+            offset = 0
+
+        offsets[rel_path] = [offset, size]
+
+        if size == offset:
+            return None
+
+        complete = (size == last_size or now - stat.st_mtime >= self.SETTLE_TIME)
+        return (path, offset, complete)
+
+    def _scan_dir(self, the_dir, files, recurse):
+        """ Add the archive files in the_dir to files, and those in its
+        subdirs if 'recurse' is set or they are not watched yet
+        """
+        # watch before listing, so that no change is missed
+        self._watch(the_dir)
+
+        try:
+            filenames = sorted(os.listdir(the_dir))
+        except OSError:
+            return
+
+        for filename in filenames:
+            full_filename = os.path.join(the_dir, filename)
+            if os.path.isdir(full_filename):
+                if recurse or full_filename not in self.watched:
+                    self._scan_dir(full_filename, files, recurse)
+
+            elif self.EXT_RX.match(filename):
+                files.append(full_filename)
+
+    def _watch(self, the_dir):
+        if not self.inotify or the_dir in self.watched:
+            return
+
+        wd = self.inotify.add_watch(the_dir, self.WATCH_MASK)
+        if wd is not None:
+            self.watched[the_dir] = wd
+            self.watches[wd] = the_dir
+
+    def _read_changes(self):
+        """ Return the dirs changed since the last check, and whether
+        inotify events were lost
+        """
+        changed_dirs = self.pending_dirs
+        self.pending_dirs = set()
+
+        overflow = False
+
+        if not self.inotify:
+            return changed_dirs, overflow
+
+        for wd, mask in self.inotify.read_events():
+            if mask & INotify.IN_Q_OVERFLOW:
+                overflow = True
+                continue
+
+            the_dir = self.watches.get(wd)
+            if not the_dir:
+                continue
+
+            changed_dirs.add(the_dir)
+
+            if mask & INotify.IN_IGNORED:
+                self.watches.pop(wd, None)
+                self.watched.pop(the_dir, None)
+
+        return changed_dirs, overflow
+
+    def wait(self):
+        """ Wait until archive files change, or until 'interval' seconds
+        have passed, or SETTLE_TIME if records are waiting to settle
+        """
+        timeout = self.interval
+        if self.pending_dirs:
+            timeout = min(timeout, self.SETTLE_TIME)
+
+        if not self.inotify:
+            time.sleep(timeout)
+            return
 
-                    if self.is_newer_than(full_filename, index_file, True):
-                        to_index.append(full_filename)
+        start = time.time()
+        self.inotify.wait(timeout)
 
-            if to_index:
-                self.do_index(to_index)
+        # check changes made in quick succession together
+        delay = min(self.MIN_CHECK_INTERVAL, timeout) - (time.time() - start)
+        if delay > 0:
+            time.sleep(delay)
 
     def run(self):
         try:
@@ -99,7 +347,7 @@ class AutoIndexer(object):
                 if not self.interval:
                     break
 
-                time.sleep(self.interval)
+                self.wait()
         except KeyboardInterrupt:  # pragma: no cover
             return
 
@@ -43,6 +43,11 @@ directory structure expected by pywb
     """
     DEF_INDEX_FILE = 'index.cdxj'
 
+    # number of segments per level of a tiered index before merging
+    SEGMENT_FANOUT = 4
+
+    DEF_ZIPNUM_FILE = 'index.idx'
+
     COLL_RX = re.compile('^[\w][-\w]*$')
 
     COLLS_DIR = 'collections'
@@ -109,6 +114,8 @@ directory structure expected by pywb
         self._create_dir(self._get_root_dir('static_path'))
         self._create_dir(self._get_root_dir('templates_dir'))
 
+        self._notify_changed()
+
     def _assert_coll_exists(self):
         if not os.path.isdir(self.curr_coll_dir):
             msg = ('Collection {0} does not exist. ' +
@@ -129,23 +136,42 @@ directory structure expected by pywb
 
         self._index_merge_warcs(full_paths, self.DEF_INDEX_FILE)
 
-    def reindex(self):
+    def reindex(self, workers=None):
         cdx_file = os.path.join(self.indexes_dir, self.DEF_INDEX_FILE)
         logging.info('Indexing ' + self.archive_dir + ' to ' + cdx_file)
-        self._cdx_index(cdx_file, [self.archive_dir])
+        self._cdx_index(cdx_file, [self.archive_dir], workers=workers)
+        self._index_updated(cdx_file)
 
-    def _cdx_index(self, out, input_, rel_root=None):
+    def _cdx_index(self, out, input_, rel_root=None, workers=None):
         from pywb.indexer.cdxindexer import write_multi_cdx_index
 
         options = dict(append_post=True,
                        cdxj=True,
                        sort=True,
                        recurse=True,
-                       rel_root=rel_root)
+                       rel_root=rel_root,
+                       workers=workers)
 
         write_multi_cdx_index(out, input_, **options)
 
     def index_merge(self, filelist, index_file):
+        filtered_warcs, abs_archive_dir = self._filter_warcs(filelist)
+
+        self._index_merge_warcs(filtered_warcs, index_file, abs_archive_dir)
+
+    def index_segment(self, filelist, index_file):
+        """ Index files into a new level 0 segment of a tiered index,
+        without rewriting the existing index. If there is no index yet,
+        the files are indexed into the base index file.
+
+        The segments are stored next to the base index file and
+        read together with it by the directory index source
+        """
+        filtered_warcs, abs_archive_dir = self._filter_warcs(filelist)
+
+        self._index_segment_warcs(filtered_warcs, index_file, abs_archive_dir)
+
+    def _filter_warcs(self, filelist):
         wrongdir = 'Skipping {0}, must be in {1} archive directory'
         notfound = 'Skipping {0}, file not found'
 
@@ -165,7 +191,7 @@ directory structure expected by pywb
             else:
                 filtered_warcs.append(abs_filepath)
 
-        self._index_merge_warcs(filtered_warcs, index_file, abs_archive_dir)
+        return filtered_warcs, abs_archive_dir
 
     def _index_merge_warcs(self, new_warcs, index_file, rel_root=None):
         cdx_file = os.path.join(self.indexes_dir, index_file)
@@ -176,23 +202,280 @@ directory structure expected by pywb
         # no existing file, so just make it the new file
         if not os.path.isfile(cdx_file):
             shutil.move(temp_file, cdx_file)
+            self._index_updated(cdx_file)
+            return
+
+        self._merge_cdx_files([cdx_file, temp_file], cdx_file)
+        os.remove(temp_file)
+
+    def _index_segment_warcs(self, new_warcs, index_file, rel_root=None):
+        cdx_file = os.path.join(self.indexes_dir, index_file)
+
+        if not os.path.isfile(cdx_file) and not self.list_segments(index_file):
+            self._index_merge_warcs(new_warcs, index_file, rel_root)
+            return
+
+        segment_file = self._segment_filename(index_file, 0)
+
+        temp_file = segment_file + '.tmp'
+        self._cdx_index(temp_file, new_warcs, rel_root)
+
+        shutil.move(temp_file, segment_file)
+        self._index_updated(segment_file)
+
+    def index_segment_tails(self, tails, index_file):
+        """ Index the records of archive files starting at the given
+        offsets into a new level 0 segment of a tiered index, or into
+        the base index file if there is no index yet.
+
+        'tails' is a list of (path, offset, complete). The last record
+        of a file is only indexed if 'complete' is set, as it may still
+        be being written.
+
+        Return dict of path -> offset after the last record indexed
+        """
+        from pywb.indexer.cdxindexer import get_cdx_writer_cls
+
+        abs_archive_dir = os.path.abspath(self.archive_dir)
+        cdx_file = os.path.join(self.indexes_dir, index_file)
+
+        temp_file = cdx_file + '.tmp.' + timestamp20_now()
+
+        options = dict(append_post=True,
+                       cdxj=True,
+                       sort=True)
+
+        writer_cls = get_cdx_writer_cls(options)
+
+        offsets = {}
+
+        try:
+            with open(temp_file, 'wb') as out:
+                with writer_cls(out) as writer:
+                    for path, offset, complete in tails:
+                        offsets[path] = self._index_tail(writer, path,
+                                                         abs_archive_dir,
+                                                         offset, complete,
+                                                         options)
+        except:
+            os.remove(temp_file)
+            raise
+
+        if not os.path.getsize(temp_file):
+            os.remove(temp_file)
+            return offsets
+
+        if not os.path.isfile(cdx_file) and not self.list_segments(index_file):
+            output = cdx_file
+        else:
+            output = self._segment_filename(index_file, 0)
+
+        shutil.move(temp_file, output)
+        self._index_updated(output)
+        return offsets
+
+    def _index_tail(self, writer, path, rel_root, offset, complete, options):
+        from pywb.indexer.archiveindexer import DefaultRecordParser
+        from pywb.indexer.cdxindexer import _resolve_rel_path
+
+        filename = _resolve_rel_path(path, rel_root)
+
+        last_entry = None
+        end = None
+
+        # records are read from a file seeked to 'offset',
+        # so entry offsets are from the start of the file
+        with open(path, 'rb') as fh:
+            fh.seek(offset)
+            try:
+                for entry in DefaultRecordParser(**options)(fh):
+                    if last_entry:
+                        writer.write(last_entry, filename)
+                        offset = int(last_entry['offset']) + int(last_entry['length'])
+
+                    last_entry = entry
+
+                end = fh.tell()
+
+            except Exception as e:
+                # a partially written record
+                logging.debug('Stopped indexing {0} at {1}: {2}'.format(path, offset, e))
+
+        if not complete:
+            return offset
+
+        if last_entry:
+            writer.write(last_entry, filename)
+            offset = int(last_entry['offset']) + int(last_entry['length'])
+
+        # skip any records after the last entry which are not indexed,
+        # eg. a trailing request record, if the whole file was read
+        if end is not None:
+            offset = max(offset, end)
+
+        return offset
+
+    def _segment_filename(self, index_file, level):
+        name = index_file.rsplit('.', 1)[0]
+        segment = '{0}.L{1}.{2}.cdxj'.format(name, level, timestamp20_now())
+        return os.path.join(self.indexes_dir, segment)
+
+    def list_segments(self, index_file):
+        """ Return dict of level -> sorted list of the segment files
+        of a tiered index
+        """
+        name = index_file.rsplit('.', 1)[0]
+        rx = re.compile(re.escape(name) + r'\.L(\d+)\.(\d+)\.cdxj$')
+
+        levels = {}
+
+        try:
+            filenames = os.listdir(self.indexes_dir)
+        except OSError:
+            return levels
+
+        for filename in filenames:
+            m = rx.match(filename)
+            if m:
+                levels.setdefault(int(m.group(1)), []).append(filename)
+
+        for level in levels:
+            levels[level] = [os.path.join(self.indexes_dir, filename)
+                             for filename in sorted(levels[level])]
+
+        return levels
+
+    def compact_segments(self, index_file):
+        """ Merge the segments of a tiered index, once a level has
+        SEGMENT_FANOUT segments. The segments are merged into one
+        segment of the next level, or into the base index file if
+        they are at least 1/SEGMENT_FANOUT of its size, so that each
+        line is only rewritten a logarithmic number of times.
+
+        Return True if any segments were merged
+        """
+        cdx_file = os.path.join(self.indexes_dir, index_file)
+        compacted = False
+
+        while True:
+            levels = self.list_segments(index_file)
+
+            to_merge = None
+            for level in sorted(levels):
+                if len(levels[level]) >= self.SEGMENT_FANOUT:
+                    to_merge = level
+                    break
+
+            if to_merge is None:
+                return compacted
+
+            segments = levels[to_merge]
+            size = sum(os.path.getsize(segment) for segment in segments)
+
+            try:
+                base_size = os.path.getsize(cdx_file)
+            except OSError:
+                base_size = 0
+
+            if size * self.SEGMENT_FANOUT >= base_size:
+                if base_size:
+                    segments.append(cdx_file)
+
+                output = cdx_file
+            else:
+                output = self._segment_filename(index_file, to_merge + 1)
+
+            logging.debug('Compacting {0} into {1}'.format(segments, output))
+
+            self._merge_cdx_files(segments, output)
+
+            # merged lines are in the new file, so may be seen twice
+            # until the old segments are removed, but never missed
+            for segment in segments:
+                if segment != output:
+                    self._remove_index(segment)
+
+            self._notify_changed()
+            compacted = True
+
+    def zipnum(self, lines_per_block=None, num_parts=None, workers=None):
+        """ Compact all cdx and cdxj indexes of the collection, including
+        the segments of tiered indexes, into the collection's ZipNum
+        cluster, then remove them. If the cluster exists, only the
+        blocks receiving new lines are rewritten
+        """
+        from pywb.indexer.zipnumindexer import ZipNumWriter
+        from pywb.warcserver.index.indexsource import FileIndexSource
+
+        cdx_files = sorted(os.path.join(self.indexes_dir, filename)
+                           for filename in os.listdir(self.indexes_dir)
+                           if filename.endswith(FileIndexSource.CDX_EXT))
+
+        summary_file = os.path.join(self.indexes_dir, self.DEF_ZIPNUM_FILE)
+
+        if not cdx_files:
+            logging.info('No new indexes to add to ' + summary_file)
             return
 
-        merged_file = temp_file + '.merged'
+        logging.info('Compacting {0} into {1}'.format(cdx_files, summary_file))
+
+        writer = ZipNumWriter(summary_file, lines_per_block, num_parts, workers)
+        writer.write(cdx_files)
+
+        for cdx_file in cdx_files:
+            self._remove_index(cdx_file)
+
+        self._notify_changed()
+
+    def has_zipnum(self):
+        return os.path.isfile(os.path.join(self.indexes_dir, self.DEF_ZIPNUM_FILE))
+
+    def _merge_cdx_files(self, cdx_files, output):
+        merged_file = output + '.tmp.' + timestamp20_now() + '.merged'
 
         last_line = None
 
-        with open(cdx_file, 'rb') as orig_index:
-            with open(temp_file, 'rb') as new_index:
-                with open(merged_file, 'w+b') as merged:
-                    for line in heapq.merge(orig_index, new_index):
-                        if last_line != line:
-                            merged.write(line)
-                            last_line = line
+        indexes = [open(cdx_file, 'rb') for cdx_file in cdx_files]
+        try:
+            with open(merged_file, 'w+b') as merged:
+                for line in heapq.merge(*indexes):
+                    if last_line != line:
+                        merged.write(line)
+                        last_line = line
+        finally:
+            for index in indexes:
+                index.close()
+
+        shutil.move(merged_file, output)
+        #os.rename(merged_file, output)
+
+        self._index_updated(output)
+
+    def _remove_index(self, cdx_file):
+        from pywb.warcserver.index.indexfilter import IndexFilter
+        from pywb.warcserver.index.digestindex import DigestIndex
+
+        for filename in (cdx_file + IndexFilter.EXT,
+                         cdx_file + DigestIndex.EXT,
+                         cdx_file):
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
 
-        shutil.move(merged_file, cdx_file)
-        #os.rename(merged_file, cdx_file)
-        os.remove(temp_file)
+    def _index_updated(self, cdx_file):
+        from pywb.warcserver.index.indexfilter import IndexFilter
+        from pywb.warcserver.index.digestindex import DigestIndex
+
+        IndexFilter.write_for_index(cdx_file)
+        DigestIndex.write_for_index(cdx_file)
+        self._notify_changed()
+
+    def _notify_changed(self):
+        # pick up changes immediately if running in the same process as warcserver
+        from pywb.warcserver.index.dirwatcher import DirWatcher
+
+        DirWatcher.notify_changed()
 
     def set_metadata(self, namevalue_pairs):
         metadata_yaml = os.path.join(self.curr_coll_dir, 'metadata.yaml')
@@ -377,13 +660,31 @@ Create manage file based web archive collections
     # Reindex All
     def do_reindex(r):
         m = CollectionsManager(r.coll_name)
-        m.reindex()
+        m.reindex(workers=r.workers)
 
     reindex_help = 'Re-Index entire collection'
     reindex = subparsers.add_parser('reindex', help=reindex_help)
     reindex.add_argument('coll_name')
+    reindex.add_argument('-w', '--workers', type=int, default=1,
+                         help='Number of worker processes to index with')
     reindex.set_defaults(func=do_reindex)
 
+    # ZipNum
+    def do_zipnum(r):
+        m = CollectionsManager(r.coll_name)
+        m.zipnum(lines_per_block=r.lines, num_parts=r.parts, workers=r.workers)
+
+    zipnum_help = 'Compact all indexes of the collection into a ZipNum cluster'
+    zipnum = subparsers.add_parser('zipnum', help=zipnum_help)
+    zipnum.add_argument('coll_name')
+    zipnum.add_argument('--lines', type=int,
+                        help='Number of lines per compressed block')
+    zipnum.add_argument('--parts', type=int,
+                        help='Number of part files')
+    zipnum.add_argument('-w', '--workers', type=int, default=1,
+                        help='Number of worker processes to compress with')
+    zipnum.set_defaults(func=do_zipnum)
+
     # Index warcs
     def do_index(r):
         m = CollectionsManager(r.coll_name)
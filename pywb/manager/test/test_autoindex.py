@@ -0,0 +1,269 @@
+import json
+import os
+import time
+
+import pytest
+
+from pywb import get_test_dir
+from pywb.manager.autoindex import AutoIndexer
+from pywb.manager.manager import CollectionsManager
+from pywb.warcserver.index.dirwatcher import INotify
+
+
+TEST_WARC_DIR = get_test_dir() + 'warcs/'
+
+INDEX_FILE = AutoIndexer.AUTO_INDEX_FILE
+
+
+# ============================================================================
+class FakeINotify(object):
+    def __init__(self):
+        self.wds = {}
+        self.events = []
+
+    def add_watch(self, path, mask=None):
+        return self.wds.setdefault(path, len(self.wds) + 1)
+
+    def read_events(self):
+        events = self.events
+        self.events = []
+        return iter(events)
+
+
+# ============================================================================
+@pytest.fixture
+def manager(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    manager = CollectionsManager('test', must_exist=False)
+    manager.add_collection()
+    return manager
+
+
+def make_indexer(manager):
+    indexer = AutoIndexer(colls_dir=manager.colls_dir, interval=0,
+                          use_inotify=False)
+
+    # records written by the tests are only complete when marked so
+    indexer.SETTLE_TIME = 60
+    return indexer
+
+
+def read_warc(name):
+    with open(TEST_WARC_DIR + name, 'rb') as fh:
+        return fh.read()
+
+
+def write_file(path, buff, settled=False):
+    with open(path, 'ab') as fh:
+        fh.write(buff)
+
+    if settled:
+        set_settled(path)
+
+
+def set_settled(path):
+    mtime = time.time() - 120
+    os.utime(path, (mtime, mtime))
+
+
+def read_lines(*cdx_files):
+    lines = []
+    for cdx_file in cdx_files:
+        with open(cdx_file, 'rb') as fh:
+            lines.extend(fh.readlines())
+
+    return lines
+
+
+def index_lines(manager):
+    cdx_file = os.path.join(manager.indexes_dir, INDEX_FILE)
+    cdx_files = [cdx_file] if os.path.isfile(cdx_file) else []
+    for level, segments in sorted(manager.list_segments(INDEX_FILE).items()):
+        cdx_files.extend(segments)
+
+    return sorted(read_lines(*cdx_files))
+
+
+def full_index_lines(manager, name='full.cdxj'):
+    warcs = sorted(os.path.join(the_dir, filename)
+                   for the_dir, _, filenames in os.walk(manager.archive_dir)
+                   for filename in filenames)
+
+    cdx_file = os.path.join(manager.indexes_dir, name)
+    manager.index_merge(warcs, name)
+    try:
+        return read_lines(cdx_file)
+    finally:
+        manager._remove_index(cdx_file)
+
+
+def load_offsets(manager):
+    with open(os.path.join(manager.indexes_dir, INDEX_FILE + AutoIndexer.OFFSETS_EXT)) as fh:
+        return json.load(fh)
+
+
+# ============================================================================
+def test_growing_warc(manager):
+    indexer = make_indexer(manager)
+
+    buff = read_warc('iana.warc.gz')
+    path = os.path.join(manager.archive_dir, 'iana.warc.gz')
+
+    # cut in the middle of a record
+    write_file(path, buff[:len(buff) // 2])
+    indexer.check_path()
+
+    offset = load_offsets(manager)['iana.warc.gz'][0]
+    assert 0 < offset < len(buff) // 2
+
+    partial_lines = index_lines(manager)
+    assert partial_lines
+
+    write_file(path, buff[len(buff) // 2:], settled=True)
+    indexer.check_path()
+
+    assert load_offsets(manager)['iana.warc.gz'] == [len(buff), len(buff)]
+
+    # each record indexed once
+    lines = index_lines(manager)
+    assert lines == full_index_lines(manager)
+    assert len(lines) == len(set(lines))
+    assert set(partial_lines) < set(lines)
+
+
+def test_last_record_held_back(manager):
+    indexer = make_indexer(manager)
+
+    buff = read_warc('example.warc.gz')
+    path = os.path.join(manager.archive_dir, 'example.warc.gz')
+
+    write_file(path, buff)
+    indexer.check_path()
+
+    full_lines = full_index_lines(manager)
+
+    # complete file, but last record may still be being written
+    offset, size = load_offsets(manager)['example.warc.gz']
+    assert 0 < offset < size == len(buff)
+    assert len(index_lines(manager)) == len(full_lines) - 1
+    assert indexer.pending_dirs == set([manager.archive_dir])
+
+    # indexed once the file has not grown since the last check
+    indexer.check_path()
+
+    assert load_offsets(manager)['example.warc.gz'] == [size, size]
+    assert index_lines(manager) == full_lines
+    assert indexer.pending_dirs == set()
+
+
+def test_last_record_settled(manager):
+    indexer = make_indexer(manager)
+
+    path = os.path.join(manager.archive_dir, 'example.warc.gz')
+    write_file(path, read_warc('example.warc.gz'), settled=True)
+
+    indexer.check_path()
+
+    assert index_lines(manager) == full_index_lines(manager)
+    assert indexer.pending_dirs == set()
+
+
+def test_replaced_warc(manager):
+    indexer = make_indexer(manager)
+
+    path = os.path.join(manager.archive_dir, 'example.warc.gz')
+    write_file(path, read_warc('iana.warc.gz'), settled=True)
+
+    indexer.check_path()
+
+    old_lines = index_lines(manager)
+
+    # replaced by a smaller file, so indexed again from the start
+    buff = read_warc('example.warc.gz')
+    assert len(buff) < os.path.getsize(path)
+
+    os.remove(path)
+    write_file(path, buff, settled=True)
+
+    indexer.check_path()
+
+    assert load_offsets(manager)['example.warc.gz'] == [len(buff), len(buff)]
+
+    new_lines = full_index_lines(manager)
+    assert index_lines(manager) == sorted(old_lines + new_lines)
+
+
+def test_migrate_last_indexed_marker(manager):
+    old_path = os.path.join(manager.archive_dir, 'example.warc.gz')
+    write_file(old_path, read_warc('example.warc.gz'), settled=True)
+
+    # indexed before offsets were checkpointed
+    manager.index_merge([old_path], INDEX_FILE)
+
+    cdx_file = os.path.join(manager.indexes_dir, INDEX_FILE)
+    marker_file = cdx_file + AutoIndexer.LAST_INDEXED_EXT
+    with open(marker_file, 'w'):
+        pass
+
+    mtime = time.time() - 60
+    os.utime(marker_file, (mtime, mtime))
+
+    # only files newer than the marker are indexed
+    new_path = os.path.join(manager.archive_dir, 'iana.warc.gz')
+    write_file(new_path, read_warc('iana.warc.gz'))
+    os.utime(new_path, (mtime + 1, mtime + 1))
+
+    indexer = make_indexer(manager)
+    indexer.SETTLE_TIME = 1
+
+    indexer.check_path()
+
+    offsets = load_offsets(manager)
+    size = os.path.getsize(old_path)
+    assert offsets['example.warc.gz'] == [size, size]
+
+    size = os.path.getsize(new_path)
+    assert offsets['iana.warc.gz'] == [size, size]
+
+    lines = index_lines(manager)
+    assert lines == full_index_lines(manager)
+    assert len(lines) == len(set(lines))
+
+    # offsets used from now on, even if older files are touched
+    os.utime(old_path, None)
+    indexer = make_indexer(manager)
+    indexer.check_path()
+
+    assert index_lines(manager) == lines
+
+
+def test_inotify_overflow_full_check(manager):
+    indexer = make_indexer(manager)
+    indexer.inotify = FakeINotify()
+    indexer.interval = 3600
+
+    write_file(os.path.join(manager.archive_dir, 'iana.warc.gz'),
+               read_warc('iana.warc.gz'), settled=True)
+
+    # first check is a full check, watching the archive dirs
+    indexer.check_path()
+    assert manager.archive_dir in indexer.watched
+
+    lines = index_lines(manager)
+    assert lines
+
+    # change not reported, so not seen until the next full check
+    sub_dir = os.path.join(manager.archive_dir, 'sub')
+    os.makedirs(sub_dir)
+    write_file(os.path.join(sub_dir, 'example.warc.gz'),
+               read_warc('example.warc.gz'), settled=True)
+
+    indexer.check_path()
+    assert index_lines(manager) == lines
+
+    # events lost, so all archive dirs are checked
+    indexer.inotify.events.append((-1, INotify.IN_Q_OVERFLOW))
+    indexer.check_path()
+
+    assert sub_dir in indexer.watched
+    assert index_lines(manager) == full_index_lines(manager)
@@ -0,0 +1,241 @@
+import os
+import shutil
+
+import pytest
+
+from pywb import get_test_dir
+from pywb.manager.autoindex import AutoIndexer
+from pywb.manager.manager import CollectionsManager
+
+
+TEST_WARC_DIR = get_test_dir() + 'warcs/'
+
+INDEX_FILE = 'autoindex.cdxj'
+
+
+# ============================================================================
+@pytest.fixture
+def manager(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    manager = CollectionsManager('test', must_exist=False)
+    manager.add_collection()
+    return manager
+
+
+def add_warcs(manager, *names):
+    paths = []
+    for name in names:
+        shutil.copy2(TEST_WARC_DIR + name, manager.archive_dir)
+        paths.append(os.path.join(manager.archive_dir, name))
+
+    return paths
+
+
+def write_segment(manager, level, lines):
+    segment = manager._segment_filename(INDEX_FILE, level)
+    with open(segment, 'wb') as fh:
+        fh.write(b''.join(sorted(lines)))
+
+    return segment
+
+
+def read_lines(*cdx_files):
+    lines = []
+    for cdx_file in cdx_files:
+        with open(cdx_file, 'rb') as fh:
+            lines.extend(fh.readlines())
+
+    return lines
+
+
+def index_lines(manager):
+    """ all lines of the tiered index, base file first
+    """
+    cdx_file = os.path.join(manager.indexes_dir, INDEX_FILE)
+    cdx_files = [cdx_file] if os.path.isfile(cdx_file) else []
+    for level, segments in sorted(manager.list_segments(INDEX_FILE).items()):
+        cdx_files.extend(segments)
+
+    return read_lines(*cdx_files)
+
+
+def full_index_lines(manager, name='full.cdxj'):
+    warcs = sorted(os.path.join(manager.archive_dir, filename)
+                   for filename in os.listdir(manager.archive_dir))
+
+    manager.index_merge(warcs, name)
+    return read_lines(os.path.join(manager.indexes_dir, name))
+
+
+def make_lines(prefix, count):
+    return ['{0} 2014{1:010d} {{}}\n'.format(prefix, i).encode('utf-8')
+            for i in range(count)]
+
+
+# ============================================================================
+def test_index_segment_level_0(manager):
+    cdx_file = os.path.join(manager.indexes_dir, INDEX_FILE)
+
+    # no index yet, so indexed into the base file
+    manager.index_segment(add_warcs(manager, 'example.warc.gz'), INDEX_FILE)
+    assert os.path.isfile(cdx_file)
+    assert manager.list_segments(INDEX_FILE) == {}
+
+    base_lines = read_lines(cdx_file)
+
+    manager.index_segment(add_warcs(manager, 'iana.warc.gz'), INDEX_FILE)
+    manager.index_segment(add_warcs(manager, 'dupes.warc.gz'), INDEX_FILE)
+
+    # base file not rewritten
+    assert read_lines(cdx_file) == base_lines
+
+    segments = manager.list_segments(INDEX_FILE)
+    assert list(segments) == [0]
+    assert len(segments[0]) == 2
+
+    assert sorted(index_lines(manager)) == full_index_lines(manager)
+
+
+def test_compact_below_fanout(manager):
+    for i in range(manager.SEGMENT_FANOUT - 1):
+        write_segment(manager, 0, make_lines('com,example)/' + str(i), 2))
+
+    segments = manager.list_segments(INDEX_FILE)
+
+    assert manager.compact_segments(INDEX_FILE) is False
+    assert manager.list_segments(INDEX_FILE) == segments
+
+
+def test_compact_into_next_level(manager):
+    fanout = manager.SEGMENT_FANOUT
+
+    cdx_file = os.path.join(manager.indexes_dir, INDEX_FILE)
+    base_lines = make_lines('com,example)/base', 1000)
+    with open(cdx_file, 'wb') as fh:
+        fh.write(b''.join(base_lines))
+
+    all_lines = list(base_lines)
+    for i in range(fanout):
+        lines = make_lines('com,example)/' + str(i), 2)
+        write_segment(manager, 0, lines)
+        all_lines.extend(lines)
+
+    assert manager.compact_segments(INDEX_FILE) is True
+
+    # small segments merged into one level 1 segment, base file unchanged
+    segments = manager.list_segments(INDEX_FILE)
+    assert list(segments) == [1]
+    assert len(segments[1]) == 1
+
+    assert read_lines(cdx_file) == base_lines
+    assert read_lines(segments[1][0]) == sorted(set(all_lines) - set(base_lines))
+
+    # further level 0 segments fan out in turn, until the level 1
+    # segments are merged into a level 2 segment
+    for j in range(fanout - 1):
+        for i in range(fanout):
+            lines = make_lines('com,example)/{0}-{1}'.format(j, i), 2)
+            write_segment(manager, 0, lines)
+            all_lines.extend(lines)
+
+        manager.compact_segments(INDEX_FILE)
+
+    segments = manager.list_segments(INDEX_FILE)
+    assert list(segments) == [2]
+    assert len(segments[2]) == 1
+
+    assert sorted(index_lines(manager)) == sorted(all_lines)
+
+
+def test_compact_into_base(manager):
+    fanout = manager.SEGMENT_FANOUT
+
+    cdx_file = os.path.join(manager.indexes_dir, INDEX_FILE)
+    base_lines = make_lines('com,example)/base', 4)
+    with open(cdx_file, 'wb') as fh:
+        fh.write(b''.join(base_lines))
+
+    all_lines = list(base_lines)
+    for i in range(fanout):
+        lines = make_lines('com,example)/' + str(i), 4)
+        write_segment(manager, 0, lines)
+        all_lines.extend(lines)
+
+    # segments at least 1/fanout of the base file are merged into it
+    assert manager.compact_segments(INDEX_FILE) is True
+
+    assert manager.list_segments(INDEX_FILE) == {}
+    assert read_lines(cdx_file) == sorted(all_lines)
+
+
+def test_compact_removes_segments_after_merge(manager):
+    segments = [write_segment(manager, 0, make_lines('com,example)/' + str(i), 2))
+                for i in range(manager.SEGMENT_FANOUT)]
+
+    cdx_file = os.path.join(manager.indexes_dir, INDEX_FILE)
+    all_lines = sorted(read_lines(*segments))
+
+    merge_cdx_files = manager._merge_cdx_files
+    remove_index = manager._remove_index
+
+    events = []
+
+    def merge(cdx_files, output):
+        # all segments still readable while merging
+        assert all(os.path.isfile(segment) for segment in segments)
+        merge_cdx_files(cdx_files, output)
+        events.append(('merge', output))
+
+    def remove(segment):
+        # merged lines are already in the output when removed
+        assert read_lines(cdx_file) == all_lines
+        remove_index(segment)
+        events.append(('remove', segment))
+
+    manager._merge_cdx_files = merge
+    manager._remove_index = remove
+
+    assert manager.compact_segments(INDEX_FILE) is True
+
+    assert events[0] == ('merge', cdx_file)
+    assert sorted(events[1:]) == [('remove', segment) for segment in segments]
+    assert not any(os.path.exists(segment) for segment in segments)
+
+
+def test_full_reindex_when_index_removed(manager):
+    add_warcs(manager, 'example.warc.gz', 'iana.warc.gz')
+
+    indexer = AutoIndexer(colls_dir=manager.colls_dir, interval=0,
+                          use_inotify=False)
+
+    indexer.check_path()
+
+    cdx_file = os.path.join(manager.indexes_dir, INDEX_FILE)
+    assert os.path.isfile(cdx_file)
+    full_lines = full_index_lines(manager)
+    os.remove(os.path.join(manager.indexes_dir, 'full.cdxj'))
+
+    add_warcs(manager, 'dupes.warc.gz')
+    indexer.check_path()
+
+    assert manager.list_segments(INDEX_FILE)
+    full_lines = full_index_lines(manager)
+    os.remove(os.path.join(manager.indexes_dir, 'full.cdxj'))
+    assert sorted(index_lines(manager)) == full_lines
+
+    # index and all segments removed, so all files are indexed again,
+    # even with checkpointed offsets
+    for segments in manager.list_segments(INDEX_FILE).values():
+        for segment in segments:
+            os.remove(segment)
+
+    os.remove(cdx_file)
+
+    assert os.path.isfile(cdx_file + AutoIndexer.OFFSETS_EXT)
+
+    # and with offsets loaded by a new indexer
+    indexer = AutoIndexer(colls_dir=manager.colls_dir, interval=0,
+                          use_inotify=False)
+    indexer.check_path()
+
+    assert sorted(index_lines(manager)) == full_lines
@@ -136,6 +136,14 @@ class MultiFileWARCWriter(BaseWARCWriter):
         params = params or {}
         self._do_write_req_resp(None, record, params)
 
+    def _write_warc_record(self, out, record):
+        # record recorded with a StreamingRecordBuffer
+        streamed = getattr(record, 'streamed', None)
+        if streamed:
+            streamed.write_record(out)
+        else:
+            super(MultiFileWARCWriter, self)._write_warc_record(out, record)
+
     def _copy_header(self, from_rec, to_rec, name):
         header = from_rec.rec_headers.get_header(name)
         if header:
@@ -155,10 +163,18 @@ class MultiFileWARCWriter(BaseWARCWriter):
         def write_callback(out, filename):
             #url = resp.rec_headers.get_header('WARC-Target-URI')
             #print('Writing req/resp {0} to {1} '.format(url, filename))
+            records = []
+
+            offset = out.tell()
             self._write_warc_record(out, resp)
+            records.append((resp, offset, out.tell() - offset))
 
             if req and self._is_write_req(req, params):
+                offset = out.tell()
                 self._write_warc_record(out, req)
+                records.append((req, offset, out.tell() - offset))
+
+            return records
 
         return self._write_to_file(params, write_callback)
 
@@ -193,20 +209,35 @@ class MultiFileWARCWriter(BaseWARCWriter):
             is_new = True
 
         try:
+            # appended at the end, whatever was last read from the file
+            out.seek(0, 2)
             start = out.tell()
 
-            write_callback(out, filename)
+            try:
+                records = write_callback(out, filename)
+
+                out.flush()
 
-            out.flush()
+                new_size = out.tell()
 
-            new_size = out.tell()
+            except Exception:
+                # roll back a partially written record
+                try:
+                    out.seek(start)
+                    out.truncate()
+                except Exception:
+                    pass
 
-            out.seek(start)
+                raise
 
+            # the records are fully written, and are kept
+            # even if they can not be indexed
             if self.dedup_index:
-                self.dedup_index.add_urls_to_index(out, params,
-                                                   filename,
-                                                   new_size - start)
+                try:
+                    out.seek(start)
+                    self._add_to_index(out, params, filename, start, new_size, records)
+                except Exception:
+                    traceback.print_exc()
 
             return True
 
@@ -230,6 +261,18 @@ class MultiFileWARCWriter(BaseWARCWriter):
                     portalocker.lock(out, portalocker.LOCK_EX | portalocker.LOCK_NB)
                 self.fh_cache[dir_key] = (out, filename)
 
+    def _add_to_index(self, out, params, filename, start, new_size, records):
+        # index from the written records if possible, without reading
+        # them back from the WARC
+        add_records = getattr(self.dedup_index, 'add_records_to_index', None)
+        if records and add_records:
+            if add_records(records, params, filename) is not None:
+                return
+
+        self.dedup_index.add_urls_to_index(out, params,
+                                           filename,
+                                           new_size - start)
+
     def iter_open_files(self):
         for n, v in list(self.fh_cache.items()):
             out, filename = v
@@ -1,15 +1,19 @@
 import json
+import shutil
 import tempfile
 import traceback
 
 import gevent
+import gevent.event
 import gevent.queue
+import gevent.threadpool
 import requests
 import six
 from six.moves.urllib.parse import parse_qsl
 from warcio.recordloader import ArcWarcRecordLoader
 
 from pywb.recorder.filters import CollectionFilter, SkipRangeRequestFilter
+from pywb.recorder.streamingrecord import StreamingRecordBuffer
 from pywb.utils.format import ParamFormatter
 from pywb.utils.io import BUFF_SIZE, StreamIter, no_except_close
 from pywb.warcserver.inputrequest import DirectWSGIInputRequest
@@ -17,6 +21,31 @@ from pywb.warcserver.inputrequest import DirectWSGIInputRequest
 
 # ==============================================================================
 class RecorderApp(object):
+    """ Records requests proxied to the upstream host to WARCs.
+
+    Recorded responses are queued in 'write_queue', bounded by
+    'write_queue_size' entries, so that responses are delayed instead
+    of spooling without limit while writing falls behind. The records
+    are parsed, compressed and written in 'write_workers' threads of
+    a gevent threadpool, so that writing does not block the hub. Writes
+    are sharded by the writer dir_key, so that the records of each open
+    WARC are written in order by one worker. If 'write_workers' is 0,
+    records are written in the hub.
+
+    The recorded buffers are only read by the workers, and are finished
+    and closed in the hub, as they may be redis pending counter buffers
+    whose connection can not be used from another thread.
+
+    If 'stream_to_warc' is set, responses are digested and compressed
+    as they are read, with a :class:`StreamingRecordBuffer`, instead
+    of being buffered and parsed again to be written.
+    """
+    DEFAULT_WRITE_WORKERS = 1
+    DEFAULT_WRITE_QUEUE_SIZE = 256
+
+    # writes waiting for each worker, after write_queue
+    SHARD_QUEUE_SIZE = 4
+
     def __init__(self, upstream_host, writer, skip_filters=None, **kwargs):
         self.upstream_host = upstream_host
 
@@ -26,7 +55,31 @@ class RecorderApp(object):
 
         self.create_buff_func = kwargs.get('create_buff_func') or self.default_create_buffer
 
-        self.write_queue = gevent.queue.Queue()
+        self.stream_to_warc = kwargs.get('stream_to_warc', False)
+
+        write_workers = kwargs.get('write_workers')
+        if write_workers is None:
+            write_workers = self.DEFAULT_WRITE_WORKERS
+
+        self.write_workers = int(write_workers)
+        self.write_queue_size = int(kwargs.get('write_queue_size') or
+                                    self.DEFAULT_WRITE_QUEUE_SIZE)
+
+        self.written = 0
+        self.write_errors = 0
+        self.writing = 0
+
+        self.write_pool = None
+        self.shard_queues = []
+
+        if self.write_workers > 0:
+            self.write_pool = gevent.threadpool.ThreadPool(self.write_workers)
+            for _ in range(self.write_workers):
+                shard_queue = gevent.queue.Queue(self.SHARD_QUEUE_SIZE)
+                self.shard_queues.append(shard_queue)
+                gevent.spawn(self._shard_write_loop, shard_queue)
+
+        self.write_queue = gevent.queue.Queue(self.write_queue_size)
         gevent.spawn(self._write_loop)
 
         if not skip_filters:
@@ -48,39 +101,93 @@ class RecorderApp(object):
     def default_create_buffer(params, name):
         return tempfile.SpooledTemporaryFile(max_size=512 * 1024)
 
+    def create_streaming_buffer(self, params, name):
+        return StreamingRecordBuffer(self.writer, self.create_buff_func(params, name))
+
+    def stats(self):
+        shard_queued = sum(shard_queue.qsize() for shard_queue in self.shard_queues)
+        return {'queued': self.write_queue.qsize() + shard_queued,
+                'max_queued': self.write_queue_size,
+                'writing': self.writing,
+                'written': self.written,
+                'errors': self.write_errors,
+                'workers': self.write_workers}
+
     def _write_loop(self):
         while True:
             try:
-                self._write_one()
+                entry = self.write_queue.get()
+                params = entry[-1]
+                self._shard_write(params, None, self._write_entry, entry)
             except Exception:
                 traceback.print_exc()
 
-    def _write_one(self):
-        req_pay = None
-        resp_pay = None
+    def _run_write(self, func, *args):
+        """ call func in a write worker, or in the hub if there are none
+        """
+        if self.write_pool is not None:
+            return self.write_pool.apply(func, args)
+
+        return func(*args)
+
+    def _get_shard_queue(self, params):
+        dir_key = self.writer.get_dir_key(params)
+        return self.shard_queues[hash(dir_key) % len(self.shard_queues)]
+
+    def _shard_write(self, params, result, func, *args):
+        """ call func in the hub, in order with the other writes for the
+        params dir_key, setting the AsyncResult 'result', if any, to its
+        return value
+        """
+        if self.write_pool is None:
+            self._do_write(result, func, args)
+            return
+
+        self._get_shard_queue(params).put((result, func, args))
+
+    def _shard_write_loop(self, shard_queue):
+        while True:
+            result, func, args = shard_queue.get()
+            self._do_write(result, func, args)
+
+    def _do_write(self, result, func, args):
+        self.writing += 1
         try:
-            result = self.write_queue.get()
+            value = func(*args)
+            self.written += 1
+        except Exception:
+            traceback.print_exc()
+            self.write_errors += 1
+            value = None
+        finally:
+            self.writing -= 1
 
-            req_head, req_pay, resp_head, resp_pay, params = result
+        if result:
+            result.set(value)
 
-            resp_length = resp_pay.tell()
-            resp_pay.seek(0)
-            resp = ArcWarcRecordLoader().parse_record_stream(resp_pay)
+    def _apply_write(self, params, func, *args):
+        """ call func in the worker for the params dir_key and wait
+        for its return value, keeping writes to each WARC in order
+        """
+        result = gevent.event.AsyncResult()
+        self._shard_write(params, result, self._run_write, func, *args)
+        return result.get()
 
-            if resp.rec_type == 'response':
-                uri = resp.rec_headers.get_header('WARC-Target-Uri')
-                req_length = req_pay.tell()
-                req_pay.seek(0)
-                req = self.writer.create_warc_record(uri=uri,
-                                                     record_type='request',
-                                                     payload=req_pay,
-                                                     length=req_length,
-                                                     warc_headers_dict=req_head)
+    def _write_one(self):
+        self._write_entry(self.write_queue.get())
 
-                self.writer.write_request_response_pair(req, resp, params)
+    def _write_entry(self, entry):
+        req_head, req_pay, resp_head, resp_pay, params = entry
+        try:
+            resp = None
+            if isinstance(resp_pay, StreamingRecordBuffer):
+                # the end of the payload is written to the buffer
+                resp = resp_pay.make_record()
+                if not resp:
+                    return
 
-            else:
-                self.writer.write_record(resp, params)
+            self._run_write(self._write_pair, req_head, req_pay,
+                            resp, resp_pay, params)
 
         finally:
             try:
@@ -92,6 +199,26 @@ class RecorderApp(object):
             except Exception as e:
                 traceback.print_exc()
 
+    def _write_pair(self, req_head, req_pay, resp, resp_pay, params):
+        if not resp:
+            resp_pay.seek(0)
+            resp = ArcWarcRecordLoader().parse_record_stream(resp_pay)
+
+        if resp.rec_type == 'response':
+            uri = resp.rec_headers.get_header('WARC-Target-Uri')
+            req_length = req_pay.tell()
+            req_pay.seek(0)
+            req = self.writer.create_warc_record(uri=uri,
+                                                 record_type='request',
+                                                 payload=req_pay,
+                                                 length=req_length,
+                                                 warc_headers_dict=req_head)
+
+            self.writer.write_request_response_pair(req, resp, params)
+
+        else:
+            self.writer.write_record(resp, params)
+
     def send_error(self, exc, start_response):
         return self.send_message({'error': repr(exc)},
                                  '400 Bad Request',
@@ -109,10 +236,20 @@ class RecorderApp(object):
                     headers, params, start_response):
 
         if record_type == 'stream':
-            if self.writer.write_stream_to_file(params, input_buff):
-                msg = {'success': 'true'}
-            else:
-                msg = {'error_message': 'upload_error'}
+            # read the input in the hub, only the copy to the WARC is
+            # done by the writer
+            stream = self.create_buff_func(params, 'stream')
+            try:
+                shutil.copyfileobj(input_buff, stream)
+                stream.seek(0)
+
+                if self._apply_write(params, self.writer.write_stream_to_file,
+                                     params, stream):
+                    msg = {'success': 'true'}
+                else:
+                    msg = {'error_message': 'upload_error'}
+            finally:
+                no_except_close(stream)
 
             return self.send_message(msg, '200 OK',
                                      start_response)
@@ -141,7 +278,7 @@ class RecorderApp(object):
                                                     warc_content_type=content_type,
                                                     warc_headers_dict=req_stream.headers)
 
-            self.writer.write_record(record, params)
+            self._apply_write(params, self.writer.write_record, record, params)
 
             msg = {'success': 'true',
                    'WARC-Date': record.rec_headers.get_header('WARC-Date')}
@@ -228,13 +365,18 @@ class RecorderApp(object):
                            for x in self.skip_filters)
 
         if not skipping:
+            if self.stream_to_warc:
+                create_func = self.create_streaming_buffer
+            else:
+                create_func = self.create_buff_func
+
             resp_stream = RespWrapper(res.raw,
                                       res.headers,
                                       req_stream,
                                       params,
                                       self.write_queue,
                                       path,
-                                      self.create_buff_func)
+                                      create_func)
 
         else:
             resp_stream = res.raw
@@ -1,13 +1,19 @@
+from gevent.monkey import get_original
 from warcio.timeutils import iso_date_to_timestamp
 
 from io import BytesIO
 import os
 import tempfile
+import traceback
 
-from pywb.utils.canonicalize import calc_search_range
-from pywb.utils.format import res_template
+from pywb.utils.canonicalize import calc_search_range, canonicalize
+from pywb.utils.format import ParamFormatter, res_template
+from pywb.utils.lrucache import LRUCache
 
-from pywb.indexer.cdxindexer import write_cdx_index
+from pywb.indexer.archiveindexer import DefaultRecordParser
+from pywb.indexer.cdxindexer import write_cdx_index, get_cdx_writer_cls
+
+from pywb.warcserver.inputrequest import MethodQueryCanonicalizer
 
 from pywb.warcserver.index.cdxobject import CDXObject
 from pywb.warcserver.index.indexsource import RedisIndexSource
@@ -16,8 +22,26 @@ from pywb.warcserver.index.aggregator import SimpleAggregator
 from pywb.recorder.filters import WriteRevisitDupePolicy
 
 
+# the thread id, even if the thread module is patched by gevent
+get_thread_ident = get_original('_thread', 'get_ident')
+
+
 #==============================================================================
 class WritableRedisIndexer(RedisIndexSource):
+    """ Redis index of recorded records, used for dedup lookups.
+
+    The cdx lines of each written request/response pair are added in
+    one pipelined batch. The last non-revisit capture for each url and
+    digest written or looked up is kept in a local LRU cache, so that
+    duplicates of recently recorded payloads are found without a query.
+
+    If created from a 'redis_url', each thread, such as the recorder
+    write workers, uses its own redis client, as with gevent the
+    connections of a client may only be used by the thread which
+    opened them.
+    """
+    DIGEST_CACHE_SIZE = 10000
+
     def __init__(self, *args, **kwargs):
         redis_url = kwargs.get('redis_url')
         redis = kwargs.get('redis')
@@ -29,12 +53,36 @@ class WritableRedisIndexer(RedisIndexSource):
 
         name = kwargs.get('name', 'recorder')
         self.cdx_lookup = SimpleAggregator({name: self})
+        self.source_name = name
 
         self.rel_path_template = kwargs.get('rel_path_template', '')
         self.file_key_template = kwargs.get('file_key_template', '')
         self.full_warc_prefix = kwargs.get('full_warc_prefix', '')
         self.dupe_policy = kwargs.get('dupe_policy', WriteRevisitDupePolicy())
 
+        self.digest_cache_size = kwargs.get('digest_cache_size', self.DIGEST_CACHE_SIZE)
+        self.digest_cache = LRUCache(self.digest_cache_size)
+
+    @property
+    def redis(self):
+        ident = get_thread_ident()
+        redis = self.thread_redis.get(ident)
+        if redis is None:
+            if self.redis_url:
+                redis, _ = self.parse_redis_url(self.redis_url)
+            else:
+                redis = self.thread_redis[None]
+
+            self.thread_redis[ident] = redis
+
+        return redis
+
+    @redis.setter
+    def redis(self, redis):
+        # client for the creating thread, and for all threads if
+        # no redis_url is set
+        self.thread_redis = {get_thread_ident(): redis, None: redis}
+
     def _get_rel_or_base_name(self, filename, params):
         rel_path = res_template(self.rel_path_template, params)
         try:
@@ -66,15 +114,120 @@ class WritableRedisIndexer(RedisIndexSource):
                         cdxj=True, append_post=True,
                         writer_cls=params.get('writer_cls'))
 
-        z_key = res_template(self.redis_key_template, params)
+        cdx_list = cdxout.getvalue().rstrip().split(b'\n')
+
+        self._add_cdx_lines(cdx_list, params)
+
+        return cdx_list
+
+    def add_records_to_index(self, records, params, filename):
+        """ Add the records just written to 'filename', as a list of
+        (record, offset, length), from the records instead of reading
+        them back from the WARC.
+
+        Return the cdx lines, or None if a request body needed for the
+        index can not be read again from its record
+        """
+        base_filename = self._get_rel_or_base_name(filename, params)
+
+        options = dict(cdxj=True, append_post=True)
+        parser = DefaultRecordParser(**options)
+
+        entries = []
+        for record, offset, length in records:
+            # indexed with default http headers when read back
+            if not record.http_headers:
+                return None
+
+            if record.http_headers.get_statuscode() == '-':
+                continue
+
+            entry = parser.parse_warc_record(record)
+
+            if entry.get('url') and not entry.get('urlkey'):
+                entry['urlkey'] = canonicalize(entry['url'])
+
+            if record.rec_type == 'request':
+                body = self._get_request_body(record)
+                if body is None:
+                    return None
+
+                method = record.http_headers.protocol
+                len_ = record.http_headers.get_header('Content-Length')
+
+                entry['_post_query'] = MethodQueryCanonicalizer(method,
+                                                                entry.get('_content_type'),
+                                                                len_,
+                                                                body)
+
+            entry.record = record
+            entry.set_rec_info(offset, length)
+            entries.append(entry)
+
+        cdxout = BytesIO()
+
+        writer_cls = get_cdx_writer_cls(dict(cdxj=True,
+                                             writer_cls=params.get('writer_cls')))
+
+        with writer_cls(cdxout) as writer:
+            for entry in parser.join_request_records(entries):
+                if entry.record.rec_type not in ('request', 'warcinfo'):
+                    writer.write(entry, base_filename)
 
         cdx_list = cdxout.getvalue().rstrip().split(b'\n')
 
+        self._add_cdx_lines(cdx_list, params)
+
+        return cdx_list
+
+    @staticmethod
+    def _get_request_body(record):
+        """ return the request body as a stream, or None if it has
+        already been read and can not be read again
+        """
+        method = record.http_headers.protocol.upper()
+        if method not in ('POST', 'PUT'):
+            return BytesIO()
+
+        try:
+            stream = record.raw_stream
+            stream.seek(stream.tell() - record.payload_length)
+            return stream
+        except Exception:
+            return None
+
+    def _add_cdx_lines(self, cdx_list, params):
+        z_key = res_template(self.redis_key_template, params)
+
+        pipe = self.redis.pipeline(transaction=False)
+
         for cdx in cdx_list:
             if cdx:
-                self.redis.zadd(z_key, 0, cdx)
+                pipe.zadd(z_key, 0, cdx)
 
-        return cdx_list
+                try:
+                    self._cache_capture(z_key, CDXObject(cdx))
+                except Exception:
+                    traceback.print_exc()
+
+        pipe.execute()
+
+    def _cache_capture(self, z_key, cdx):
+        # only captures found by a lookup of the url
+        if cdx.get('mime') == 'warc/revisit' or cdx.get('method'):
+            return
+
+        digest = cdx.get('digest', '-')
+
+        self._cache_put((z_key, cdx['url'], None), cdx)
+        if digest != '-':
+            self._cache_put((z_key, cdx['url'], digest), cdx)
+
+    def _cache_put(self, key, cdx):
+        self.digest_cache.put(key, cdx)
+
+    def _cache_get(self, key):
+        return self.digest_cache.get(key)
 
     def lookup_revisit(self, lookup_params, digest, url, iso_dt):
         params = {}
@@ -82,15 +235,30 @@ class WritableRedisIndexer(RedisIndexSource):
             if param.startswith('param.'):
                 params[param] = lookup_params[param]
 
+        if digest and digest != '-':
+            digest = digest.split(':')[-1]
+        else:
+            digest = None
+
+        # key resolved as by the lookup, for this source
+        z_key = ParamFormatter(params, self.source_name).format(self.redis_key_template)
+        cache_key = (z_key, url, digest)
+
         params['url'] = url
         params['closest'] = iso_date_to_timestamp(iso_dt)
 
+        cdx = self._cache_get(cache_key)
+        if cdx is not None:
+            res = self.dupe_policy(cdx, params)
+            if res:
+                return res
+
         filters = []
 
         filters.append('!mime:warc/revisit')
 
-        if digest and digest != '-':
-            filters.append('digest:' + digest.split(':')[-1])
+        if digest:
+            filters.append('digest:' + digest)
 
         params['filter'] = filters
 
@@ -99,6 +267,7 @@ class WritableRedisIndexer(RedisIndexSource):
         for cdx in cdx_iter:
             res = self.dupe_policy(cdx, params)
             if res:
+                self._cache_put(cache_key, cdx)
                 return res
 
         return None
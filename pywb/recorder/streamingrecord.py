@@ -0,0 +1,308 @@
+import logging
+import re
+import shutil
+import struct
+import zlib
+
+from io import BytesIO
+
+from warcio.recordloader import ArcWarcRecordLoader
+
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+def _gf2_matrix_times(mat, vec):
+    total = 0
+    i = 0
+    while vec:
+        if vec & 1:
+            total ^= mat[i]
+        vec >>= 1
+        i += 1
+
+    return total
+
+
+def _gf2_matrix_square(mat):
+    return [_gf2_matrix_times(mat, mat[n]) for n in range(32)]
+
+
+def crc32_combine(crc1, crc2, len2):
+    """ return the crc32 of two buffers from the crc32 of each,
+    and the length of the second, as zlib crc32_combine()
+
+    >>> crc32_combine(zlib.crc32(b'some'), zlib.crc32(b' data'), 5) == zlib.crc32(b'some data')
+    True
+    """
+    if len2 <= 0:
+        return crc1
+
+    # operator for one zero bit
+    odd = [0xedb88320] + [1 << n for n in range(31)]
+
+    # operators for two and four zero bits
+    even = _gf2_matrix_square(odd)
+    odd = _gf2_matrix_square(even)
+
+    # apply len2 zero bytes to crc1
+    while True:
+        even = _gf2_matrix_square(odd)
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+
+        len2 >>= 1
+        if not len2:
+            break
+
+        odd = _gf2_matrix_square(even)
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+
+        len2 >>= 1
+        if not len2:
+            break
+
+    return crc1 ^ crc2
+
+
+# ============================================================================
+class StreamingRecordBuffer(object):
+    """ Buffer for a recorded response record, which is written to as
+    the response is read by the client.
+
+    The WARC and HTTP headers are parsed as soon as they are read,
+    after which the payload is digested and compressed as it is
+    read, into the 'out' buffer. When the record is written, only the
+    final record headers are compressed, and the compressed payload is
+    copied to the WARC as is, as part of the same gzip member.
+
+    The payload is not parsed again, compressed again or digested again.
+    """
+    HEADERS_END_RX = re.compile(b'\r?\n\r?\n')
+
+    # headers larger than this are not recorded
+    MAX_HEADERS_SIZE = 1024 * 1024
+
+    GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+    COMPRESS_LEVEL = 6
+
+    def __init__(self, writer, out):
+        self.writer = writer
+        self.out = out
+
+        self.head = b''
+        self.received = 0
+        self.failed = False
+
+        self.record = None
+        self.remaining = None
+        self.payload_length = 0
+
+        self.block_digester = None
+        self.payload_digester = None
+
+        if writer.gzip:
+            self.compressor = zlib.compressobj(self.COMPRESS_LEVEL, zlib.DEFLATED,
+                                               -zlib.MAX_WBITS)
+        else:
+            self.compressor = None
+
+        self.crc = 0
+        self.size = 0
+
+    def write(self, buff):
+        self.received += len(buff)
+
+        if self.failed:
+            return
+
+        if not self.record:
+            self.head += buff
+            buff = self._parse_head(False)
+            if not buff:
+                return
+
+        self._write_payload(buff)
+
+    def tell(self):
+        return self.received
+
+    def close(self):
+        self.out.close()
+
+    def _parse_head(self, at_end):
+        """ parse the record and http headers once fully read, or all
+        that was read if 'at_end', and return the start of the payload
+        """
+        m = self.HEADERS_END_RX.search(self.head)
+        if not m and not at_end:
+            if len(self.head) > self.MAX_HEADERS_SIZE:
+                logger.warning('Not recording, record headers too large')
+                self.failed = True
+                self.head = b''
+
+            return None
+
+        try:
+            return self._load_record(m, at_end)
+        except Exception as e:
+            logger.warning('Not recording, invalid record headers: ' + repr(e))
+            self.failed = True
+            self.head = b''
+            return None
+
+    def _load_record(self, m, at_end):
+        loader = ArcWarcRecordLoader()
+
+        end = len(self.head)
+        if m:
+            rec = loader.parse_record_stream(BytesIO(self.head[:m.end()]),
+                                             no_record_parse=True)
+
+            uri = rec.rec_headers.get_header('WARC-Target-URI') or ''
+
+            if (rec.rec_type in loader.HTTP_RECORDS and rec.length != 0 and
+                uri.startswith(loader.HTTP_SCHEMES)):
+                m = self.HEADERS_END_RX.search(self.head, m.end())
+                if m:
+                    end = m.end()
+                elif not at_end:
+                    return None
+            else:
+                end = m.end()
+
+        stream = BytesIO(self.head[:end])
+        self.record = loader.parse_record_stream(stream)
+
+        payload = self.head[end:]
+        self.head = b''
+
+        record = self.record
+
+        if record.http_headers:
+            record.http_headers.compute_headers_buffer(self.writer.header_filter)
+
+        if not record.rec_headers.get_header('WARC-Block-Digest'):
+            self.block_digester = self.writer._create_digester()
+            if record.http_headers:
+                self.block_digester.update(record.http_headers.headers_buff)
+
+        if (not record.rec_headers.get_header('WARC-Payload-Digest') and
+            record.rec_type not in self.writer.NO_PAYLOAD_DIGEST_TYPES):
+            self.payload_digester = self.writer._create_digester()
+
+        if record.http_headers:
+            if record.payload_length >= 0:
+                self.remaining = record.payload_length
+
+        elif record.length is not None:
+            self.remaining = record.length
+
+        # an empty payload is not written
+        return payload or None
+
+    def _write_payload(self, buff):
+        if self.remaining is not None:
+            buff = buff[:self.remaining]
+            self.remaining -= len(buff)
+
+        if not buff:
+            return
+
+        if self.block_digester:
+            self.block_digester.update(buff)
+
+        if self.payload_digester:
+            self.payload_digester.update(buff)
+
+        self.payload_length += len(buff)
+        self._compress(buff)
+
+    def _compress(self, buff):
+        if self.compressor:
+            self.crc = zlib.crc32(buff, self.crc)
+            self.size += len(buff)
+            buff = self.compressor.compress(buff)
+
+        self.out.write(buff)
+
+    def make_record(self):
+        """ return the recorded record, to be written by the writer,
+        or None if the record was not fully read.
+
+        The end of the payload is written to 'out', so this is called
+        in the hub, as for all other writes to 'out'. Only
+        :meth:`write_record` may be called from a write worker.
+        """
+        if self.failed:
+            return None
+
+        if not self.record:
+            payload = self._parse_head(True)
+            if payload:
+                self._write_payload(payload)
+
+        if not self.record or self.remaining:
+            return None
+
+        record = self.record
+
+        if record.rec_type == 'revisit':
+            # only headers are written
+            record.raw_stream = BytesIO()
+            return record
+
+        self._compress(b'\r\n\r\n')
+
+        if self.compressor:
+            self.out.write(self.compressor.flush())
+
+        if self.block_digester:
+            record.rec_headers.replace_header('WARC-Block-Digest', str(self.block_digester))
+
+        if self.payload_digester:
+            record.rec_headers.replace_header('WARC-Payload-Digest', str(self.payload_digester))
+
+        record.payload_length = self.payload_length
+        record.length = self.payload_length
+        if record.http_headers:
+            record.length += len(record.http_headers.headers_buff)
+
+        record.rec_headers.replace_header('Content-Length', str(record.length))
+
+        record.raw_stream = None
+        record.streamed = self
+        return record
+
+    def write_record(self, out):
+        """ write the record to the WARC 'out', compressing only the
+        headers and copying the compressed payload
+        """
+        head = self.record.rec_headers.to_bytes(encoding='utf-8')
+        if self.record.http_headers:
+            head += self.record.http_headers.headers_buff
+
+        self.out.seek(0)
+
+        if not self.compressor:
+            out.write(head)
+            shutil.copyfileobj(self.out, out)
+            out.flush()
+            return
+
+        # the headers end at a byte boundary with a sync flush, so the
+        # separately compressed payload can follow in the same member
+        compressor = zlib.compressobj(self.COMPRESS_LEVEL, zlib.DEFLATED,
+                                      -zlib.MAX_WBITS)
+
+        out.write(self.GZIP_HEADER)
+        out.write(compressor.compress(head) + compressor.flush(zlib.Z_SYNC_FLUSH))
+
+        shutil.copyfileobj(self.out, out)
+
+        crc = crc32_combine(zlib.crc32(head), self.crc, self.size)
+        out.write(struct.pack('<II', crc, (len(head) + self.size) & 0xffffffff))
+        out.flush()
@@ -11,10 +11,12 @@ import pytest
 from fakeredis import FakeStrictRedis
 
 from pywb.recorder.recorderapp import RecorderApp
-from pywb.recorder.redisindexer import WritableRedisIndexer
+from pywb.recorder.redisindexer import WritableRedisIndexer, RedisPendingCounterTempBuffer
+from pywb.recorder.redisindexer import get_thread_ident
 from pywb.recorder.multifilewarcwriter import PerRecordWARCWriter, MultiFileWARCWriter
 from pywb.recorder.filters import ExcludeSpecificHeaders, ExcludeHttpOnlyCookieHeaders
 from pywb.recorder.filters import SkipDupePolicy, WriteDupePolicy, WriteRevisitDupePolicy
+from pywb.recorder.streamingrecord import StreamingRecordBuffer
 
 from pywb.utils.memento import MementoUtils
 
@@ -29,6 +31,7 @@ from pywb.indexer.cdxindexer import write_cdx_index
 
 from six.moves.urllib.parse import quote, unquote, urlencode
 from io import BytesIO
+import gzip
 import time
 import json
 
@@ -424,6 +427,36 @@ class TestRecorder(LiveServerTests, HttpBinLiveTests, FakeRedisTests, TempDirTes
 
         assert len(writer.fh_cache) == 0
 
+    def test_record_revisit_digest_cache(self):
+        warc_path = to_path(self.root_dir + '/warcs/{coll}/')
+
+        dedup_index = self._get_dedup_index(user=False)
+
+        recorder_app = RecorderApp(self.upstream_url,
+                        PerRecordWARCWriter(warc_path, dedup_index=dedup_index))
+
+        resp = self._test_warc_write(recorder_app, 'httpbin.org', '/get?cache=1',
+                                     '&param.recorder.coll=CACHE')
+        assert b'"cache": "1"' in resp.body
+
+        assert len(dedup_index.digest_cache) == 2
+
+        # second capture found in cache, not queried
+        def cdx_lookup(params):
+            raise AssertionError('cdx lookup not expected')
+
+        dedup_index.cdx_lookup = cdx_lookup
+
+        resp = self._test_warc_write(recorder_app, 'httpbin.org', '/get?cache=1',
+                                     '&param.recorder.coll=CACHE')
+        assert b'"cache": "1"' in resp.body
+
+        r = FakeStrictRedis.from_url('redis://localhost/2')
+        res = r.zrangebylex('CACHE:cdxj', '[org,httpbin)/', '(org,httpbin,')
+
+        mimes = [CDXObject(x)['mime'] for x in res]
+        assert sorted(mimes) == ['application/json', 'warc/revisit']
+
     # Keep Open
     def test_record_file_warc_keep_open(self):
         path = to_path(self.root_dir + '/warcs/A.warc.gz')
@@ -607,6 +640,187 @@ class TestRecorder(LiveServerTests, HttpBinLiveTests, FakeRedisTests, TempDirTes
         writer.close()
         assert len(writer.fh_cache) == 0
 
+    def test_record_index_error_keeps_record(self):
+        warc_path = to_path(self.root_dir + '/warcs/index_error/')
+
+        dedup_index = self._get_dedup_index(user=False)
+        writer = MultiFileWARCWriter(warc_path, dedup_index=dedup_index)
+
+        def add_records_to_index(records, params, filename):
+            raise Exception('index error')
+
+        dedup_index.add_records_to_index = add_records_to_index
+
+        params = {'param.recorder.coll': 'IDX'}
+        for data in (b'first', b'second'):
+            record = writer.create_warc_record('custom://example.com/' + data.decode('utf-8'),
+                                               'resource',
+                                               payload=BytesIO(data),
+                                               length=len(data))
+
+            writer.write_record(record, params)
+
+        # a failed write callback is rolled back
+        def write_callback(out, filename):
+            out.write(b'partial record')
+            raise Exception('write error')
+
+        assert writer._write_to_file(params, write_callback) is False
+
+        writer.close()
+
+        # records written but not indexed are kept
+        files, coll_dir = self._test_all_warcs('/warcs/index_error/', 1)
+        with open(os.path.join(coll_dir, files[0]), 'rb') as fh:
+            records = [(record.rec_type, record.content_stream().read())
+                       for record in ArchiveIterator(fh)]
+
+        assert records == [('resource', b'first'), ('resource', b'second')]
+
+    def test_record_write_pool(self):
+        warc_path = to_path(self.root_dir + '/warcs/pool/{coll}/')
+
+        writer = MultiFileWARCWriter(warc_path)
+        recorder_app = RecorderApp(self.upstream_url, writer,
+                                   write_workers=2, write_queue_size=2)
+
+        assert len(recorder_app.shard_queues) == 2
+
+        testapp = webtest.TestApp(recorder_app)
+        for coll in ('A', 'B', 'A', 'B'):
+            for path in ('/get?foo=bar', '/get?foo=baz'):
+                req_url = '/live/resource/postreq?url=http://httpbin.org' + path + '&param.recorder.coll=' + coll
+                testapp.post(req_url, general_req_data.format(host='httpbin.org', path=path).encode('utf-8'))
+
+        # written in the pool, not by this greenlet
+        for _ in range(100):
+            stats = recorder_app.stats()
+            if stats['written'] == 8:
+                break
+
+            gevent.sleep(0.05)
+
+        assert stats == {'queued': 0,
+                         'max_queued': 2,
+                         'writing': 0,
+                         'written': 8,
+                         'errors': 0,
+                         'workers': 2}
+
+        writer.close()
+
+        # records written to each WARC in order
+        for coll in ('A', 'B'):
+            files, coll_dir = self._test_all_warcs('/warcs/pool/' + coll + '/', 1)
+            with open(os.path.join(coll_dir, files[0]), 'rb') as fh:
+                urls = [record.rec_headers.get_header('WARC-Target-URI')
+                        for record in ArchiveIterator(fh)
+                        if record.rec_type == 'response']
+
+            assert urls == ['http://httpbin.org/get?foo=bar',
+                            'http://httpbin.org/get?foo=baz'] * 2
+
+    def test_record_dedup_write_pool(self):
+        warc_path = to_path(self.root_dir + '/warcs/pool_dedup/')
+
+        dedup_index = self._get_dedup_index(user=False)
+        writer = MultiFileWARCWriter(warc_path, dedup_index=dedup_index)
+
+        closed_in = []
+
+        class PendingBuffer(RedisPendingCounterTempBuffer):
+            def close(self):
+                closed_in.append(get_thread_ident())
+                super(PendingBuffer, self).close()
+
+        def create_buff(params, name):
+            return PendingBuffer(512 * 1024, 'redis://localhost/2/{coll}:pending', params, name)
+
+        recorder_app = RecorderApp(self.upstream_url, writer,
+                                   create_buff_func=create_buff,
+                                   write_workers=1, stream_to_warc=True)
+
+        testapp = webtest.TestApp(recorder_app)
+        req_url = '/live/resource/postreq?url=http://httpbin.org/get?foo=bar&param.recorder.coll=DEDUP'
+        for _ in range(2):
+            testapp.post(req_url, general_req_data.format(host='httpbin.org', path='/get?foo=bar').encode('utf-8'))
+
+        for _ in range(100):
+            if recorder_app.stats()['written'] == 2:
+                break
+
+            gevent.sleep(0.05)
+
+        assert recorder_app.stats()['errors'] == 0
+
+        # buffers closed in the hub, so the pending count is updated there
+        assert closed_in == [get_thread_ident()] * 4
+
+        r = FakeStrictRedis.from_url('redis://localhost/2')
+        assert r.get('DEDUP:pending') == b'0'
+
+        # redis client of the write worker
+        assert len(set(id(client) for client in dedup_index.thread_redis.values())) == 2
+
+        writer.close()
+
+        files, coll_dir = self._test_all_warcs('/warcs/pool_dedup/', 1)
+        with open(os.path.join(coll_dir, files[0]), 'rb') as fh:
+            rec_types = [record.rec_type for record in ArchiveIterator(fh)]
+
+        assert rec_types == ['response', 'request', 'revisit', 'request']
+
+    def test_record_stream_to_warc(self):
+        base_path = to_path(self.root_dir + '/warcs/streamed/')
+
+        writer = MultiFileWARCWriter(base_path, header_filter=ExcludeHttpOnlyCookieHeaders())
+        recorder_app = RecorderApp(self.upstream_url, writer, accept_colls='live',
+                                   write_workers=0, stream_to_warc=True)
+
+        resp = self._test_warc_write(recorder_app, 'httpbin.org', '/get?foo=bar')
+        assert b'"foo": "bar"' in resp.body
+
+        resp = self._test_warc_write(recorder_app, 'httpbin.org', '/cookies/set%3Fname%3Dvalue%26foo%3Dbar')
+
+        writer.close()
+
+        files, coll_dir = self._test_all_warcs('/warcs/streamed/', 1)
+
+        with open(os.path.join(coll_dir, files[0]), 'rb') as fh:
+            # crc and length of each gzip member verified
+            assert b'"foo": "bar"' in gzip.decompress(fh.read())
+
+            fh.seek(0)
+
+            records = []
+            for record in ArchiveIterator(fh, check_digests='raise'):
+                content = record.content_stream().read()
+                assert record.digest_checker.passed is not False
+                records.append((record.rec_type, record.rec_headers, record.http_headers, content))
+
+        assert [rec_type for rec_type, _, _, _ in records] == ['response', 'request'] * 2
+
+        rec_type, rec_headers, http_headers, content = records[0]
+        assert rec_headers.get_header('WARC-Payload-Digest').startswith('sha1:')
+        assert rec_headers.get_header('WARC-Block-Digest').startswith('sha1:')
+        assert b'"foo": "bar"' in content
+
+        # header filter applied to streamed records
+        rec_type, rec_headers, http_headers, content = records[2]
+        assert ('Set-Cookie', 'name=value; Path=/') in http_headers.headers
+
+    def test_record_stream_to_warc_interrupted(self):
+        writer = MultiFileWARCWriter(to_path(self.root_dir + '/warcs/streamed2/'))
+        buff = StreamingRecordBuffer(writer, BytesIO())
+
+        buff.write(b'WARC/1.0\r\nWARC-Type: response\r\nWARC-Target-URI: http://example.com/\r\n')
+        buff.write(b'Content-Length: 100\r\n\r\nHTTP/1.0 200 OK\r\nContent-Length: 200\r\n\r\nsome data')
+
+        # not fully read, not written
+        assert buff.make_record() is None
+        assert buff.payload_length == len(b'some data')
+        assert buff.remaining > 0
+
     #@pytest.mark.skipif(os.environ.get('CI') is not None, reason='Skip Test on CI')
     @pytest.mark.skip
     def test_record_video_metadata(self):
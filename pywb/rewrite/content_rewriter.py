@@ -3,6 +3,7 @@ import json
 import re
 import tempfile
 from contextlib import closing
+from io import BytesIO
 
 import webencodings
 from warcio.bufferedreaders import BufferedReader, ChunkedDataReader
@@ -10,6 +11,7 @@ from warcio.utils import to_native_str
 
 from pywb.utils.io import BUFF_SIZE, StreamIter, no_except_close
 from pywb.utils.loaders import load_py_name, load_yaml_config
+from pywb.utils.lrucache import LRUCache
 
 WORKER_MODS = {"wkr_", "sw_"}  # type: Set[str]
 
@@ -313,6 +315,148 @@ class BufferedRewriter(object):
         return max_resolution, max_bandwidth
 
 
+# ============================================================================
+class ManifestCache(LRUCache):
+    """ LRU cache of rewritten adaptive streaming manifests, shared by
+    all manifest rewriters and bounded by total size in bytes.
+
+    A manifest is cached by url, the ETag or payload digest of the
+    upstream response, and the adaptive max resolution and bandwidth it
+    was filtered for. Live manifests are requested again every few
+    seconds by each viewer, so are only kept for a short 'ttl'.
+    """
+    DEFAULT_MAX_SIZE = 4 * 1024 * 1024
+    DEFAULT_TTL = 5
+
+    def __init__(self, max_size=None, ttl=None):
+        max_size = max_size if max_size is not None else self.DEFAULT_MAX_SIZE
+        ttl = ttl if ttl is not None else self.DEFAULT_TTL
+
+        super(ManifestCache, self).__init__(max_size, ttl, sizeof=len,
+                                            max_entry_size=max_size // 8)
+
+    @classmethod
+    def init_from_config(cls, config):
+        if not isinstance(config, dict):
+            # manifests not cached
+            config = {'max_size': 0} if config is False else {}
+
+        return cls(config.get('max_size'), config.get('ttl'))
+
+    def put(self, key, buff):
+        if not self.ttl:
+            return
+
+        super(ManifestCache, self).put(key, buff)
+
+    def cache_results(self, key, gen):
+        """ wrap the rewritten manifest, caching it if it is read to the end
+        """
+        buffs = []
+        size = 0
+
+        for buff in gen:
+            if buffs is not None:
+                size += len(buff)
+                if size <= self.max_entry_size:
+                    buffs.append(buff)
+                else:
+                    buffs = None
+
+            yield buff
+
+        if buffs is not None:
+            self.put(key, b''.join(buffs))
+
+
+# ============================================================================
+class ManifestRewriter(BufferedRewriter):
+    """ Base for rewriters of adaptive streaming manifests.
+
+    Instead of buffering the whole manifest first, the manifest is
+    filtered as it is read, by rewrite_iter(), which yields the
+    rewritten manifest as strings. The result is kept in the shared
+    manifest_cache.
+    """
+
+    # ManifestCache shared by all manifest rewriters, see init_manifest_cache()
+    manifest_cache = None
+
+    @staticmethod
+    def init_manifest_cache(config=None):
+        """ set the cache of rewritten manifests, config False disables caching
+        """
+        ManifestRewriter.manifest_cache = ManifestCache.init_from_config(config)
+
+    def __call__(self, rwinfo):
+        if ManifestRewriter.manifest_cache is None:
+            ManifestRewriter.init_manifest_cache()
+
+        cache = ManifestRewriter.manifest_cache
+
+        key = self._get_cache_key(rwinfo)
+        if key:
+            buff = cache.get(key)
+            if buff is not None:
+                no_except_close(rwinfo.content_stream)
+                return StreamIter(BytesIO(buff))
+
+        gen = self._iter_rewrite(rwinfo.content_stream, rwinfo)
+        if key:
+            gen = cache.cache_results(key, gen)
+
+        return gen
+
+    def rewrite_iter(self, stream, rwinfo):
+        raise NotImplemented('implement in subclass')
+
+    def rewrite_stream(self, stream, rwinfo):
+        buff_io = BytesIO()
+        for buff in self._iter_rewrite(stream, rwinfo):
+            buff_io.write(buff)
+
+        buff_io.seek(0)
+        return buff_io
+
+    def _iter_rewrite(self, stream, rwinfo):
+        """ encode the strings from rewrite_iter(), joined in buffers
+        of at least BUFF_SIZE
+        """
+        try:
+            pending = []
+            size = 0
+            for string in self.rewrite_iter(stream, rwinfo):
+                pending.append(string)
+                size += len(string)
+                if size >= BUFF_SIZE:
+                    yield ''.join(pending).encode('utf-8')
+                    pending = []
+                    size = 0
+
+            if pending:
+                yield ''.join(pending).encode('utf-8')
+
+        finally:
+            no_except_close(stream)
+
+    def _get_cache_key(self, rwinfo):
+        """ key for the rewritten manifest, or None if the upstream
+        response has no ETag or payload digest
+        """
+        record = rwinfo.record
+        validator = record.rec_headers.get_header('WARC-Payload-Digest')
+        if not validator and record.http_headers:
+            validator = record.http_headers.get_header('ETag')
+
+        if not validator:
+            return None
+
+        url = record.rec_headers.get_header('WARC-Target-URI')
+        max_resolution, max_bandwidth = self._get_adaptive_metadata(rwinfo)
+
+        return (type(self).__name__, url, validator, max_resolution, max_bandwidth)
+
+
 # ============================================================================
 class StreamingRewriter(object):
     def __init__(self, url_rewriter, align_to_line=True, first_buff=''):
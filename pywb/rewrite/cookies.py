@@ -2,9 +2,10 @@ from pywb.rewrite.cookie_rewriter import WbUrlBaseCookieRewriter, HostScopeCooki
 from warcio.timeutils import datetime_to_http_date
 from six.moves import zip
 
+from pywb.utils.startup import StartupProfile
+
 import redis
 
-import tldextract
 import time
 import datetime
 import six
@@ -77,9 +78,21 @@ class CookieTracker(object):
             pi.hset(cookie_key + domain, name, value)
             pi.expire(cookie_key + domain, self.expire_time)
 
-    @staticmethod
-    def get_subdomains(url):
-        tld = tldextract.extract(url)
+    # tldextract and its suffix list, loaded on first use
+    _extract = None
+
+    @classmethod
+    def _get_extract(cls):
+        if not cls._extract:
+            with StartupProfile.timed('tldextract'):
+                import tldextract
+                cls._extract = tldextract.extract
+
+        return cls._extract
+
+    @classmethod
+    def get_subdomains(cls, url):
+        tld = cls._get_extract()(url)
 
         if not tld.subdomain:
             return None
@@ -1,60 +1,307 @@
-from contextlib import closing
 from io import BytesIO
 import json
 
 import xml.etree.ElementTree as ET
 
-from pywb.rewrite.content_rewriter import BufferedRewriter
+from pywb.rewrite.content_rewriter import ManifestRewriter
+from pywb.utils.io import BUFF_SIZE
 
 
 # ============================================================================
-class RewriteDASH(BufferedRewriter):
-    def rewrite_stream(self, stream, rwinfo):
-        res_buff, best_ids = self.rewrite_dash(stream, rwinfo)
-        return res_buff
+class RewriteDASH(ManifestRewriter):
+    def rewrite_iter(self, stream, rwinfo):
+        max_resolution, max_bandwidth = self._get_adaptive_metadata(rwinfo)
+        return RepresentationFilter(max_resolution, max_bandwidth)(stream)
 
     def rewrite_dash(self, stream, rwinfo):
         max_resolution, max_bandwidth = self._get_adaptive_metadata(rwinfo)
-        ET.register_namespace('', 'urn:mpeg:dash:schema:mpd:2011')
-        namespaces = {'mpd': 'urn:mpeg:dash:schema:mpd:2011'}
-
-        tree = ET.ElementTree()
-        tree.parse(stream)
-
-        root = tree.getroot()
-
-        best_ids = []
-
-        for period in root.findall('mpd:Period', namespaces):
-            for adaptset in period.findall('mpd:AdaptationSet', namespaces):
-                best = None
-                best_resolution = 0
-                best_bandwidth = 0
-
-                for repres in adaptset.findall('mpd:Representation', namespaces):
-                    curr_resolution = int(repres.get('width', '0')) * int(repres.get('height', '0'))
-                    curr_bandwidth = int(repres.get('bandwidth', 0))
-                    if curr_resolution and max_resolution:
-                        if curr_resolution <= max_resolution and curr_resolution > best_resolution:
-                            best_resolution = curr_resolution
-                            best_bandwidth = curr_bandwidth
-                            best = repres
-                    elif curr_bandwidth <= max_bandwidth and curr_bandwidth > best_bandwidth:
-                        best_resolution = curr_resolution
-                        best_bandwidth = curr_bandwidth
-                        best = repres
-
-                if best is not None:
-                    best_ids.append(best.get('id'))
-
-                for repres in adaptset.findall('mpd:Representation', namespaces):
-                    if repres != best:
-                        adaptset.remove(repres)
-
-        buff_io = BytesIO()
-        tree.write(buff_io, encoding='UTF-8', xml_declaration=True)
-        buff_io.seek(0)
-        return buff_io, best_ids
+
+        rep_filter = RepresentationFilter(max_resolution, max_bandwidth)
+        buff = ''.join(rep_filter(stream)).encode('utf-8')
+
+        return BytesIO(buff), rep_filter.best_ids
+
+
+# ============================================================================
+class RepresentationFilter(object):
+    """ Filters a DASH manifest as it is parsed, keeping only the best
+    Representation of each AdaptationSet, and yields the manifest as
+    it is serialized.
+
+    The MPD, Period and AdaptationSet tags are written as they are
+    parsed. Every other element is written when it has been parsed and
+    is then removed from the tree, so only the content following the best
+    Representation found so far in an AdaptationSet is held in memory.
+    Namespace prefixes are kept as declared in the manifest.
+    """
+    MPD_NS = 'urn:mpeg:dash:schema:mpd:2011'
+
+    PERIOD = '{' + MPD_NS + '}Period'
+    ADAPTATION_SET = '{' + MPD_NS + '}AdaptationSet'
+    REPRESENTATION = '{' + MPD_NS + '}Representation'
+
+    # tags written as parsed, by depth
+    FRAME_TAGS = {0: PERIOD, 1: ADAPTATION_SET}
+
+    XML_NS = 'http://www.w3.org/XML/1998/namespace'
+
+    XML_DECL = "<?xml version='1.0' encoding='UTF-8'?>\n"
+
+    def __init__(self, max_resolution, max_bandwidth):
+        self.max_resolution = max_resolution
+        self.max_bandwidth = max_bandwidth
+
+        # id of the best Representation of each AdaptationSet
+        self.best_ids = []
+
+        # element -> namespaces declared on it
+        self.ns_decls = {}
+
+    def __call__(self, stream):
+        parser = ET.XMLPullParser(events=('start-ns', 'start', 'end'))
+
+        yield self.XML_DECL
+
+        frames = []
+        ns_decls = []
+
+        # depth in an element which is written once parsed
+        skip_depth = 0
+
+        while True:
+            buff = stream.read(BUFF_SIZE)
+            if buff:
+                parser.feed(buff)
+            else:
+                parser.close()
+
+            for event, elem in parser.read_events():
+                if event == 'start-ns':
+                    ns_decls.append(elem)
+                    continue
+
+                if event == 'start':
+                    if ns_decls:
+                        self.ns_decls[elem] = ns_decls
+                        ns_decls = []
+
+                    if skip_depth:
+                        skip_depth += 1
+                        continue
+
+                    if not frames:
+                        frames.append(_Frame(self, elem, {}, 0))
+                        continue
+
+                    frame = frames[-1]
+                    for string in frame.start_child():
+                        yield string
+
+                    if elem.tag == self.FRAME_TAGS.get(frame.depth):
+                        for string in frame.open([], force=True):
+                            yield string
+
+                        frames.append(_Frame(self, elem, frame.scope, frame.depth + 1))
+                    else:
+                        skip_depth = 1
+
+                    continue
+
+                # end
+                if skip_depth:
+                    skip_depth -= 1
+                    if not skip_depth:
+                        frames[-1].last = elem
+
+                    continue
+
+                frame = frames.pop()
+                for string in frame.end():
+                    yield string
+
+                if frames:
+                    frames[-1].last = elem
+                    frames[-1].last_written = True
+
+            if not buff:
+                break
+
+    def is_better(self, repres, best):
+        """ return True if the Representation is better than the best so far,
+        updating the best [resolution, bandwidth]
+        """
+        curr_resolution = int(repres.get('width', '0')) * int(repres.get('height', '0'))
+        curr_bandwidth = int(repres.get('bandwidth', 0))
+
+        if curr_resolution and self.max_resolution:
+            if curr_resolution <= self.max_resolution and curr_resolution > best[0]:
+                best[0] = curr_resolution
+                best[1] = curr_bandwidth
+                return True
+
+        elif curr_bandwidth <= self.max_bandwidth and curr_bandwidth > best[1]:
+            best[0] = curr_resolution
+            best[1] = curr_bandwidth
+            return True
+
+        return False
+
+    def start_tag(self, elem, scope):
+        """ return (scope, qname, start tag) of the element, where scope
+        maps namespaces to prefixes for the element and its children
+        """
+        decls = self.ns_decls.pop(elem, None)
+        attrs = []
+        if decls:
+            scope = dict(scope)
+            for prefix, uri in decls:
+                scope[uri] = prefix
+                attrs.append((('xmlns:' + prefix) if prefix else 'xmlns', uri))
+
+        for name, value in elem.items():
+            attrs.append((self.qname(name, scope), value))
+
+        qname = self.qname(elem.tag, scope)
+
+        start = '<' + qname + ''.join(' {0}="{1}"'.format(name, escape_attrib(value))
+                                      for name, value in attrs)
+
+        return scope, qname, start
+
+    def qname(self, tag, scope):
+        if tag[:1] != '{':
+            return tag
+
+        uri, name = tag[1:].split('}', 1)
+        if uri == self.XML_NS:
+            prefix = 'xml'
+        else:
+            prefix = scope.get(uri)
+
+        return (prefix + ':' + name) if prefix else name
+
+    def serialize(self, elem, scope):
+        scope, qname, start = self.start_tag(elem, scope)
+        if not elem.text and not len(elem):
+            return start + ' />'
+
+        strings = [start, '>', escape_cdata(elem.text or '')]
+        for child in elem:
+            strings.append(self.serialize(child, scope))
+            strings.append(escape_cdata(child.tail or ''))
+
+        strings.append('</' + qname + '>')
+        return ''.join(strings)
+
+
+# ============================================================================
+class _Frame(object):
+    """ An element of the manifest whose tags are written as parsed.
+
+    The start tag is only written before the first content of the
+    element, which is written as an empty element if all its children
+    are removed.
+    """
+    def __init__(self, rep_filter, elem, scope, depth):
+        self.rep_filter = rep_filter
+        self.elem = elem
+        self.depth = depth
+
+        self.scope, self.qname, self.start = rep_filter.start_tag(elem, scope)
+        self.start_written = False
+        self.text_read = False
+
+        # last child, written when its tail is parsed
+        self.last = None
+        self.last_written = False
+
+        # best Representation so far, and the strings following it
+        self.best = None
+        self.best_elem = None
+        self.best_value = [0, 0]
+        self.held = []
+
+    def start_child(self):
+        if not self.text_read:
+            return self.read_text()
+
+        return self.open(self.write_last())
+
+    def end(self):
+        if not self.text_read:
+            strings = self.read_text()
+        else:
+            strings = self.write_last()
+
+        if self.best is not None:
+            strings += self.best + self.held
+            self.rep_filter.best_ids.append(self.best_elem.get('id'))
+
+        if not strings and not self.start_written:
+            return [self.start + ' />']
+
+        strings = self.open(strings)
+        strings.append('</' + self.qname + '>')
+        return strings
+
+    def read_text(self):
+        self.text_read = True
+        if not self.elem.text:
+            return []
+
+        return self.open(self.write(escape_cdata(self.elem.text)))
+
+    def open(self, strings, force=False):
+        """ write the start tag before the first strings written
+        """
+        if (strings or force) and not self.start_written:
+            self.start_written = True
+            strings.insert(0, self.start + '>')
+
+        return strings
+
+    def write_last(self):
+        child = self.last
+        self.last = None
+        if child is None:
+            return []
+
+        tail = escape_cdata(child.tail or '')
+        self.elem.remove(child)
+
+        if self.last_written:
+            self.last_written = False
+            return self.write(tail) if tail else []
+
+        if self.depth == 2 and child.tag == self.rep_filter.REPRESENTATION:
+            if not self.rep_filter.is_better(child, self.best_value):
+                return []
+
+            # previous best Representation removed
+            strings = self.held
+            self.best = [self.rep_filter.serialize(child, self.scope) + tail]
+            self.best_elem = child
+            self.held = []
+            return strings
+
+        return self.write(self.rep_filter.serialize(child, self.scope) + tail)
+
+    def write(self, string):
+        if self.best is not None:
+            self.held.append(string)
+            return []
+
+        return [string]
+
+
+# ============================================================================
+def escape_cdata(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def escape_attrib(text):
+    return (escape_cdata(text).replace('"', '&quot;').replace('\r', '&#13;').
+            replace('\n', '&#10;').replace('\t', '&#09;'))
 
 
 # ============================================================================
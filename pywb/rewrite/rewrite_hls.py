@@ -1,62 +1,96 @@
 import re
-from io import BytesIO
 
-from pywb.rewrite.content_rewriter import BufferedRewriter
+from pywb.rewrite.content_rewriter import ManifestRewriter
+from pywb.utils.io import BUFF_SIZE
 
 
 # ============================================================================
-class RewriteHLS(BufferedRewriter):
+class RewriteHLS(ManifestRewriter):
     EXT_INF = re.compile('#EXT-X-STREAM-INF:(?:.*[,])?BANDWIDTH=([\d]+)')
     EXT_RESOLUTION = re.compile('RESOLUTION=([\d]+)x([\d]+)')
 
-    def rewrite_stream(self, stream, rwinfo):
+    def rewrite_iter(self, stream, rwinfo):
         max_resolution, max_bandwidth = self._get_adaptive_metadata(rwinfo)
 
-        buff = stream.read()
-
-        lines = buff.decode('utf-8').split('\n')
-        indexes = []
-        count = 0
-        best_index = None
+        sep = ''
+        for line in self.filter_variants(self.iter_lines(stream),
+                                         max_resolution, max_bandwidth):
+            yield sep + line
+            sep = '\n'
+
+    @staticmethod
+    def iter_lines(stream):
+        """ yield the lines of the playlist as read, without line endings
+        """
+        last = b''
+        while True:
+            buff = stream.read(BUFF_SIZE)
+            if not buff:
+                break
+
+            lines = (last + buff).split(b'\n')
+            last = lines.pop()
+            for line in lines:
+                yield line.decode('utf-8')
+
+        yield last.decode('utf-8')
+
+    def filter_variants(self, lines, max_resolution, max_bandwidth):
+        """ yield the lines of the playlist, keeping only the best variant
+        stream and its uri.
+
+        Lines are yielded as read, except those after the best variant
+        found so far, which are held until a better variant is found
+        or the playlist ends.
+        """
+        best = None
+        held = []
 
         best_bandwidth = 0
         best_resolution = 0
 
+        lines = iter(lines)
         for line in lines:
             m = self.EXT_INF.match(line)
-            if m:
-                indexes.append(count)
-                curr_bandwidth = int(m.group(1))
-
-                # resolution
-                m2 = self.EXT_RESOLUTION.search(line)
-                if m2:
-                    curr_resolution = int(m2.group(1)) * int(m2.group(2))
+            if not m:
+                if best is None:
+                    yield line
                 else:
-                    curr_resolution = 0
+                    held.append(line)
+
+                continue
+
+            variant = [line]
+            uri = next(lines, None)
+            if uri is not None:
+                variant.append(uri)
+
+            curr_bandwidth = int(m.group(1))
 
-                if max_resolution and curr_resolution:
-                    if curr_resolution > best_resolution and curr_resolution <= max_resolution:
-                        best_resolution = curr_resolution
-                        best_bandwidth = curr_bandwidth
-                        best_index = count
+            # resolution
+            m2 = self.EXT_RESOLUTION.search(line)
+            if m2:
+                curr_resolution = int(m2.group(1)) * int(m2.group(2))
+            else:
+                curr_resolution = 0
 
-                elif curr_bandwidth > best_bandwidth and curr_bandwidth <= max_bandwidth:
-                    best_resolution = curr_resolution
-                    best_bandwidth = curr_bandwidth
-                    best_index = count
+            if max_resolution and curr_resolution:
+                if curr_resolution <= best_resolution or curr_resolution > max_resolution:
+                    continue
 
-            count = count + 1
+            elif curr_bandwidth <= best_bandwidth or curr_bandwidth > max_bandwidth:
+                continue
 
-        if indexes and best_index is not None:
-            indexes.remove(best_index)
+            best_resolution = curr_resolution
+            best_bandwidth = curr_bandwidth
 
-        for index in reversed(indexes):
-            del lines[index + 1]
-            del lines[index]
+            # previous best variant removed
+            for held_line in held:
+                yield held_line
 
-        buff_io = BytesIO()
-        buff_io.write('\n'.join(lines).encode('utf-8'))
-        buff_io.seek(0)
-        return buff_io
+            best = variant
+            held = []
 
+        if best is not None:
+            for line in best + held:
+                yield line
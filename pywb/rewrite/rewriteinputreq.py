@@ -1,17 +1,29 @@
 from pywb.warcserver.inputrequest import DirectWSGIInputRequest
 from pywb.utils.loaders import extract_client_cookie
+from pywb.utils.startup import StartupProfile
 
 from six import iteritems
 from six.moves.urllib.parse import urlsplit
 import re
 
 
-try: # pragma: no cover
-    import brotli
-    has_brotli = True
-except Exception:  # pragma: no cover
-    has_brotli = False
-    print('Warning: brotli module could not be loaded, will not be able to replay brotli-encoded content')
+# checked on first request with brotli in accept-encoding
+has_brotli = None
+
+
+#=============================================================================
+def check_brotli():
+    global has_brotli
+    if has_brotli is None:
+        with StartupProfile.timed('brotli'):
+            try: # pragma: no cover
+                import brotli
+                has_brotli = True
+            except Exception:  # pragma: no cover
+                has_brotli = False
+                print('Warning: brotli module could not be loaded, will not be able to replay brotli-encoded content')
+
+    return has_brotli
 
 
 #=============================================================================
@@ -93,7 +105,7 @@ class RewriteInputRequest(DirectWSGIInputRequest):
                 if self.splits:
                     value = self.splits.scheme
 
-            elif not has_brotli and name == 'HTTP_ACCEPT_ENCODING' and 'br' in value:
+            elif name == 'HTTP_ACCEPT_ENCODING' and 'br' in value and not check_brotli():
                 # if brotli not available, remove 'br' from accept-encoding to avoid
                 # capture brotli encoded content
                 name = 'Accept-Encoding'
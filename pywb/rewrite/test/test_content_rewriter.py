@@ -14,6 +14,8 @@ from pywb.utils.io import chunk_encode_iter
 from pywb.rewrite.wburl import WbUrl
 from pywb.rewrite.url_rewriter import UrlRewriter
 from pywb.rewrite.default_rewriter import DefaultRewriter, RewriterWithJSProxy
+from pywb.rewrite.content_rewriter import ManifestRewriter
+from pywb.rewrite.rewrite_dash import RepresentationFilter
 
 from pywb import get_test_dir
 
@@ -819,6 +821,67 @@ http://example.com/video_4.m3u8
 
         assert b''.join(gen).decode('utf-8') == filtered
 
+    def test_dash_streaming(self):
+        adaptset = '''<AdaptationSet>
+      <Representation bandwidth="500000" id="{0}-1" />
+      <Representation bandwidth="900000" id="{0}-2" />
+    </AdaptationSet>
+    '''
+
+        content = '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011"><Period>'
+        content += ''.join(adaptset.format(i) for i in range(2000))
+        content += '</Period></MPD>'
+
+        stream = BytesIO(content.encode('utf-8'))
+        rep_filter = RepresentationFilter(0, 1000000)
+        gen = rep_filter(stream)
+
+        # first AdaptationSet written before the manifest is fully read
+        output = ''
+        while '</AdaptationSet>' not in output:
+            output += next(gen)
+
+        assert '<Representation bandwidth="900000" id="0-2" />' in output
+        assert '0-1' not in output
+        assert stream.tell() < len(content)
+
+        output += ''.join(gen)
+        assert output.count('<Representation ') == 2000
+        assert rep_filter.best_ids == ['{0}-2'.format(i) for i in range(2000)]
+
+    def test_manifest_cache(self):
+        ManifestRewriter.init_manifest_cache()
+        cache = ManifestRewriter.manifest_cache
+
+        headers = {'Content-Type': 'application/vnd.apple.mpegurl'}
+        with open(os.path.join(get_test_dir(), 'text_content', 'sample_hls.m3u8'), 'rt') as fh:
+            content = fh.read()
+
+        def rewrite(metadata=None):
+            warc_headers = {'WARC-JSON-Metadata': json.dumps(metadata)} if metadata else None
+            headers_, gen, is_rw = self.rewrite_record(headers, content, ts='201701oe_',
+                                                       url='http://example.com/path/master.m3u8',
+                                                       warc_headers=warc_headers)
+            return b''.join(gen)
+
+        try:
+            first = rewrite()
+            assert rewrite() == first
+            assert cache.stats()['hits'] == 1
+
+            # cached separately by adaptive metadata
+            assert b'video_4.m3u8' in rewrite({'adaptive_max_bandwidth': 2000000})
+            assert cache.stats()['entries'] == 2
+
+            # not cached
+            ManifestRewriter.init_manifest_cache(False)
+            assert rewrite() == first
+            assert rewrite() == first
+            assert ManifestRewriter.manifest_cache.stats()['entries'] == 0
+
+        finally:
+            ManifestRewriter.init_manifest_cache()
+
     def test_json_body_but_mime_html(self):
         headers = {'Content-Type': 'text/html'}
         content = '{"foo":"bar", "dash": {"on": "true"}'
@@ -2,8 +2,10 @@
 Utility functions for performing binary search over a sorted text file
 """
 
-from collections import deque
+from collections import OrderedDict, deque
 import itertools
+import mmap
+import os
 import six
 
 import sys
@@ -45,18 +47,27 @@ def binsearch_offset(reader, key, compare_func=cmp, block_size=8192):
 
 
 #=================================================================
-def binsearch(reader, key, compare_func=cmp, block_size=8192):
+def binsearch(reader, key, compare_func=cmp, block_size=8192, prev_size=0):
     """
     Perform a binary search for a specified key to within a 'block_size'
     (default 8192) granularity, and return first full line found.
+
+    For a :class:`MappedReader`, the search starts at an indexed line,
+    at least 'prev_size' + 1 lines before the key, if available.
     """
 
-    min_ = binsearch_offset(reader, key, compare_func, block_size)
+    # mapped files have an index of line offsets, no partial lines
+    if isinstance(reader, MappedReader):
+        reader.seek(reader.mapped.find_offset(key, compare_func,
+                                              prev_size + 1))
+
+    else:
+        min_ = binsearch_offset(reader, key, compare_func, block_size)
 
-    reader.seek(min_)
+        reader.seek(min_)
 
-    if min_ > 0:
-        reader.readline()  # skip partial line
+        if min_ > 0:
+            reader.readline()  # skip partial line
 
     def gen_iter(line):
         while line:
@@ -110,7 +121,7 @@ def search(reader, key, prev_size=0, compare_func=cmp, block_size=8192):
     When performin_g linear search, keep track of up to N previous lines before
     first matching line.
     """
-    iter_ = binsearch(reader, key, compare_func, block_size)
+    iter_ = binsearch(reader, key, compare_func, block_size, prev_size)
     iter_ = linearsearch(iter_,
                          key, prev_size=prev_size,
                          compare_func=compare_func)
@@ -154,3 +165,218 @@ def iter_exact(reader, key, token=b' '):
     """
 
     return iter_prefix(reader, key + token)
+
+
+#=================================================================
+class MappedIndex(object):
+    """
+    A sorted text file mapped into memory, with a sparse index of the
+    offsets of the first line in each 'block_size' (default 8192) block,
+    built when the file is mapped.
+
+    Use :meth:`load` to get a shared mapping, which is kept open
+    until the file is replaced or its mtime or size changes, and
+    :meth:`reader` to get a file-like reader over it for a single lookup.
+    Up to MAX_MAPPED files are kept mapped, least recently loaded first
+    to be dropped.
+
+    A mapped file must only be replaced, eg. with
+    :func:`pywb.utils.io.atomic_write`, never truncated in place, as
+    reading the truncated part of a mapping is fatal to the process.
+    """
+    BLOCK_SIZE = 8192
+
+    MAX_MAPPED = 256
+
+    _mapped = OrderedDict()
+
+    def __init__(self, filename, block_size=None):
+        self.filename = filename
+
+        with open(filename, 'rb') as fh:
+            stat = os.fstat(fh.fileno())
+            self.stat_key = self.get_stat_key(stat)
+            self.size = stat.st_size
+
+            # empty files can not be mapped
+            if self.size:
+                self.buff = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.buff = b''
+
+        self.offsets = self._build_offsets(block_size or self.BLOCK_SIZE)
+
+    def _build_offsets(self, block_size):
+        offsets = [0]
+        buff = self.buff
+        pos = block_size
+
+        while pos < self.size:
+            start = buff.find(b'\n', pos - 1) + 1
+            if start <= 0 or start >= self.size:
+                break
+
+            if start != offsets[-1]:
+                offsets.append(start)
+
+            pos = max(pos + block_size, start + 1)
+
+        return offsets
+
+    def line_at(self, offset):
+        end = self.buff.find(b'\n', offset)
+        if end < 0:
+            end = self.size
+        else:
+            end += 1
+
+        return self.buff[offset:end]
+
+    def find_offset(self, key, compare_func=cmp, prev_lines=0):
+        """
+        return the offset of the last indexed line before 'key',
+        or 0 if 'key' is not after the first line, moving back
+        to include at least 'prev_lines' lines before the key
+        """
+        offsets = self.offsets
+        min_ = 0
+        max_ = len(offsets)
+
+        while max_ - min_ > 1:
+            mid = (min_ + max_) // 2
+            if compare_func(key, self.line_at(offsets[mid])) > 0:
+                min_ = mid
+            else:
+                max_ = mid
+
+        offset = offsets[min_]
+
+        while prev_lines > 0 and offset > 0:
+            offset = self.buff.rfind(b'\n', 0, offset - 1) + 1
+            prev_lines -= 1
+
+        return offset
+
+    def reader(self):
+        return MappedReader(self)
+
+    @staticmethod
+    def get_stat_key(stat):
+        return (stat.st_ino, stat.st_dev, stat.st_mtime, stat.st_size)
+
+    def is_current(self, stat):
+        return self.stat_key == self.get_stat_key(stat)
+
+    @classmethod
+    def load(cls, filename, stat_key=None):
+        """
+        return the shared mapping for 'filename', remapping the file
+        if it has changed since it was last mapped
+
+        If 'stat_key' is given, as returned by :meth:`get_stat_key` when
+        the file was last checked, a mapping with the same key is
+        returned without checking the file again
+        """
+        mapped = cls._mapped.get(filename)
+        if stat_key and mapped and mapped.stat_key == stat_key:
+            cls._mapped.move_to_end(filename)
+            return mapped
+
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            cls._mapped.pop(filename, None)
+            raise
+
+        mapped = cls._mapped.pop(filename, None)
+
+        # existing readers keep the old mapping open until done
+        if not mapped or not mapped.is_current(stat):
+            mapped = cls(filename)
+
+        cls._add(filename, mapped)
+        return mapped
+
+    @classmethod
+    def _add(cls, filename, mapped):
+        cls._mapped[filename] = mapped
+
+        while len(cls._mapped) > cls.MAX_MAPPED:
+            cls._mapped.popitem(last=False)
+
+    @classmethod
+    def purge(cls):
+        """
+        drop the mappings of all files which have been removed or replaced
+        """
+        for filename, mapped in list(cls._mapped.items()):
+            try:
+                if mapped.is_current(os.stat(filename)):
+                    continue
+            except OSError:
+                pass
+
+            cls._mapped.pop(filename, None)
+
+
+#=================================================================
+class MappedReader(object):
+    """
+    Read-only file-like reader over a :class:`MappedIndex`, with its
+    own position so that a shared mapping may be read concurrently
+    """
+    def __init__(self, mapped):
+        self.mapped = mapped
+        self.buff = mapped.buff
+        self.size = mapped.size
+        self.pos = 0
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.size
+
+        self.pos = min(max(offset, 0), self.size)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, length=-1):
+        start = self.pos
+        if length is None or length < 0:
+            self.pos = self.size
+        else:
+            self.pos = min(start + length, self.size)
+
+        return self.buff[start:self.pos]
+
+    def readline(self, length=-1):
+        start = self.pos
+        end = self.buff.find(b'\n', start)
+        end = self.size if end < 0 else end + 1
+
+        if length is not None and length >= 0:
+            end = min(end, start + length)
+
+        self.pos = end
+        return self.buff[start:end]
+
+    def readlines(self):
+        return list(iter(self.readline, b''))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def close(self):
+        # the mapping is shared, and closed once no longer referenced
+        self.buff = b''
+        self.size = 0
+        self.pos = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
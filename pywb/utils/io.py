@@ -1,8 +1,10 @@
+import os
 import zlib
 from contextlib import closing, contextmanager
 from tempfile import SpooledTemporaryFile
 
 from warcio.limitreader import LimitReader
+from warcio.timeutils import timestamp20_now
 from warcio.utils import BUFF_SIZE
 
 
@@ -51,6 +53,31 @@ def call_release_conn(stream):
         no_except_close(stream)
 
 
+# =============================================================================
+@contextmanager
+def atomic_write(filename, mode='wb'):
+    """ open a temp file next to 'filename', which replaces 'filename'
+    once written, or is removed on error
+
+    Index files are mapped into memory while they are read, and must
+    only be replaced, never truncated or rewritten in place
+    """
+    temp_filename = filename + '.tmp.' + timestamp20_now()
+
+    try:
+        with open(temp_filename, mode) as fh:
+            yield fh
+    except:
+        try:
+            os.remove(temp_filename)
+        except OSError:
+            pass
+
+        raise
+
+    os.rename(temp_filename, filename)
+
+
 # =============================================================================
 def chunk_encode_iter(orig_iter):
     for chunk in orig_iter:
@@ -95,21 +122,56 @@ def compress_gzip_iter(orig_iter):
     yield compressobj.flush()
 
 
+# ============================================================================
+def seek_forward(stream, offset):
+    """Attempts to advance the supplied stream by offset bytes by seeking
+    instead of reading, also handling a LimitReader over a seekable stream
+
+    :param stream: The stream to advance
+    :param int offset: The number of bytes to skip
+    :return: True if the stream was advanced, False if it is not seekable
+    :rtype: bool
+    """
+    if isinstance(stream, LimitReader):
+        offset = min(offset, stream.limit)
+        if not seek_forward(stream.stream, offset):
+            return False
+
+        stream.limit -= offset
+        return True
+
+    try:
+        if not stream.seekable():
+            return False
+
+        stream.seek(offset, 1)
+        return True
+    except Exception:
+        return False
+
+
 # ============================================================================
 class OffsetLimitReader(LimitReader):
     def __init__(self, stream, offset, length):
         super(OffsetLimitReader, self).__init__(stream, length)
         self.offset = offset
-        if offset > 0:
-            self._skip_reader = LimitReader(stream, offset)
-        else:
-            self._skip_reader = None
 
     def _skip(self):
-        while self._skip_reader:
-            buff = self._skip_reader.read()
+        if self.offset <= 0:
+            return
+
+        offset = self.offset
+        self.offset = 0
+
+        if seek_forward(self.stream, offset):
+            return
+
+        while offset > 0:
+            buff = self.stream.read(min(offset, BUFF_SIZE))
             if not buff:
-                self._skip_reader = None
+                break
+
+            offset -= len(buff)
 
     def read(self, length=None):
         self._skip()
@@ -120,6 +182,49 @@ class OffsetLimitReader(LimitReader):
         return super(OffsetLimitReader, self).readline(length)
 
 
+# ============================================================================
+class ChainedReader(object):
+    """Reads from a sequence of streams as if they were a single stream.
+    If the total length is known, it is reported via len() so that
+    the chained stream can be sent as a request body without buffering
+    """
+    def __init__(self, streams, length=None):
+        self.streams = list(streams)
+        self.length = length
+
+    def read(self, length=None):
+        while self.streams:
+            buff = self.streams[0].read(length)
+            if buff:
+                return buff
+
+            self.streams.pop(0)
+
+        return b''
+
+    def readline(self, length=None):
+        while self.streams:
+            buff = self.streams[0].readline(length)
+            if buff:
+                return buff
+
+            self.streams.pop(0)
+
+        return b''
+
+    def __len__(self):
+        if self.length is None:
+            raise TypeError('ChainedReader length unknown')
+
+        return self.length
+
+    def close(self):
+        for stream in self.streams:
+            no_except_close(stream)
+
+        self.streams = []
+
+
 # ============================================================================
 class StreamClosingReader(object):
     def __init__(self, stream):
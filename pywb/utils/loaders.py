@@ -19,19 +19,38 @@ import pkgutil
 import base64
 import cgi
 import re
+import logging
 
 from io import open, BytesIO
 from warcio.limitreader import LimitReader
+from requests.adapters import HTTPAdapter
 from pywb.utils.io import no_except_close, StreamClosingReader
+from pywb.utils.lrucache import DiskLRUCache, LRUCache
+from pywb.utils.startup import StartupProfile
 
-try:
-    import boto3
-    from botocore import UNSIGNED
-    from botocore.client import Config
+# boto3 is only imported when first loading from s3
+boto3 = None
+s3_avail = None
 
-    s3_avail = True
-except ImportError:  # pragma: no cover
-    s3_avail = False
+
+# ============================================================================
+def import_boto3():
+    """Imports boto3 on first use
+
+    :return: True if boto3 is available
+    :rtype: bool
+    """
+    global boto3, s3_avail
+    if s3_avail is None:
+        with StartupProfile.timed('boto3'):
+            try:
+                import boto3 as boto3_mod
+                boto3 = boto3_mod
+                s3_avail = True
+            except ImportError:  # pragma: no cover
+                s3_avail = False
+
+    return s3_avail
 
 
 # ============================================================================
@@ -171,8 +190,145 @@ def read_last_line(fh, offset=256):
     return fh.readlines()[-1]
 
 
+# =================================================================
+class RangeBlockCache(object):
+    """ LRU cache of aligned, fixed size blocks of remote files,
+    keyed by (url, block index) and bounded by total size in bytes.
+
+    Reads of up to 'max_read_size' bytes are assembled from cached
+    blocks. Each run of missing blocks, plus up to 'readahead' blocks
+    after the read, is fetched with a single range request, so that
+    reads of adjacent records share blocks and requests.
+
+    If a cache_dir is set, blocks are also written there, up to
+    cache_dir_size bytes, and are kept across restarts. Only full
+    blocks are cached, as remote files may still be growing.
+    """
+    DEFAULT_SIZE = 32 * 1024 * 1024
+    DEFAULT_BLOCK_SIZE = 64 * 1024
+    DEFAULT_MAX_READ_SIZE = 1024 * 1024
+    DEFAULT_READAHEAD = 1
+
+    def __init__(self, max_size=None, block_size=None, cache_dir=None,
+                 cache_dir_size=None, max_read_size=None, readahead=None):
+        self.max_size = max_size or self.DEFAULT_SIZE
+        self.block_size = block_size or self.DEFAULT_BLOCK_SIZE
+        self.max_read_size = max_read_size or self.DEFAULT_MAX_READ_SIZE
+        self.readahead = readahead if readahead is not None else self.DEFAULT_READAHEAD
+
+        self.blocks = LRUCache(self.max_size, sizeof=len)
+
+        self.disk_cache = None
+        if cache_dir:
+            self.disk_cache = DiskLRUCache(cache_dir, cache_dir_size or self.max_size * 4)
+
+        self.disk_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def init_from_config(cls, config):
+        if config is False or config == 0:
+            return None
+
+        if not isinstance(config, dict):
+            config = {}
+
+        return cls(max_size=config.get('size'),
+                   block_size=config.get('block_size'),
+                   cache_dir=config.get('dir'),
+                   cache_dir_size=config.get('dir_size'),
+                   max_read_size=config.get('max_read_size'),
+                   readahead=config.get('readahead'))
+
+    def load(self, url, offset, length, fetch):
+        """ return the 'length' bytes at 'offset' of url, or None if the
+        range can not be cached.
+
+        fetch(offset, length) is called to read missing blocks, and
+        returns the bytes read (fewer at the end of the file),
+        or None if the range can not be read in full
+        """
+        if length <= 0 or length > self.max_read_size:
+            return None
+
+        block_size = self.block_size
+        first = offset // block_size
+        last = (offset + length - 1) // block_size
+
+        blocks = [self.get(url, index) for index in range(first, last + 1)]
+
+        i = 0
+        while i < len(blocks):
+            if blocks[i] is not None:
+                i += 1
+                continue
+
+            j = i + 1
+            while j < len(blocks) and blocks[j] is None:
+                j += 1
+
+            count = j - i
+            if j == len(blocks):
+                count += self.readahead
+
+            data = fetch((first + i) * block_size, count * block_size)
+            if data is None:
+                return None
+
+            for k in range(count):
+                block = data[k * block_size:(k + 1) * block_size]
+                if len(block) == block_size:
+                    self.put(url, first + i + k, block)
+
+                if i + k < j:
+                    blocks[i + k] = block
+
+            i = j
+
+        start = offset - first * block_size
+        return b''.join(blocks)[start:start + length]
+
+    def get(self, url, index):
+        key = (url, index)
+        block = self.blocks.get(key)
+        if block is not None:
+            return block
+
+        block = self.disk_cache.get(self._file_key(key)) if self.disk_cache else None
+        if block is not None:
+            self.disk_hits += 1
+            self.blocks.put(key, block)
+            return block
+
+        self.misses += 1
+        return None
+
+    def put(self, url, index, block):
+        key = (url, index)
+        self.blocks.put(key, block)
+        if self.disk_cache:
+            self.disk_cache.put(self._file_key(key), block)
+
+    def stats(self):
+        hits = self.blocks.hits
+        total = hits + self.disk_hits + self.misses
+        return {'hits': hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': (hits + self.disk_hits) / float(total) if total else 0.0,
+                'size': self.blocks.curr_size,
+                'blocks': len(self.blocks),
+                'dir_size': self.disk_cache.curr_size if self.disk_cache else 0}
+
+    def _file_key(self, key):
+        return '{0}:{1}:{2}'.format(self.block_size, *key)
+
+
 # =================================================================
 class BaseLoader(object):
+    # RangeBlockCache shared by all remote loaders, see BlockLoader.init_range_cache()
+    range_cache = None
+
     def __init__(self, **kwargs):
         pass
 
@@ -254,6 +410,13 @@ class BlockLoader(BaseLoader):
     def set_profile_loader(src):
         BlockLoader.profile_loader = src
 
+    @staticmethod
+    def init_range_cache(config=None):
+        """ set the block cache for ranged reads of remote files,
+        or disable it if config is False
+        """
+        BaseLoader.range_cache = RangeBlockCache.init_from_config(config)
+
     @staticmethod
     def _make_range_header(offset, length):
         if length > 0:
@@ -329,6 +492,12 @@ class LocalFileLoader(PackageLoader):
 
 # =================================================================
 class HttpLoader(BaseLoader):
+    # keep-alive connection pool sizes, by host and per host
+    POOL_CONNECTIONS = 32
+    POOL_MAXSIZE = 16
+
+    shared_session = None
+
     def __init__(self, **kwargs):
         super(HttpLoader, self).__init__()
         self.cookie_maker = kwargs.get('cookie_maker')
@@ -336,11 +505,50 @@ class HttpLoader(BaseLoader):
             self.cookie_maker = kwargs.get('cookie')
         self.session = None
 
+    @classmethod
+    def get_shared_session(cls):
+        """ session shared by all http loaders, so that connections
+        to each host are kept alive and reused
+        """
+        if not HttpLoader.shared_session:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=cls.POOL_CONNECTIONS,
+                                  pool_maxsize=cls.POOL_MAXSIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            HttpLoader.shared_session = session
+
+        return HttpLoader.shared_session
+
     def load(self, url, offset, length):
         """
         Load a file-like reader over http using range requests
-        and an optional cookie created via a cookie_maker
+        and an optional cookie created via a cookie_maker.
+        Ranges of known length are read through the range cache
         """
+        if self.range_cache and length > 0:
+            def fetch(offset, length):
+                return self._load_bytes(url, offset, length)
+
+            buff = self.range_cache.load(url, offset, length, fetch)
+            if buff is not None:
+                return BytesIO(buff)
+
+        r = self._get(url, offset, length)
+        return StreamClosingReader(r.raw)
+
+    def _load_bytes(self, url, offset, length):
+        r = self._get(url, offset, length)
+        try:
+            # range not supported
+            if r.status_code != 206:
+                return None
+
+            return r.content
+        finally:
+            r.close()
+
+    def _get(self, url, offset, length):
         headers = {}
         if offset != 0 or length != -1:
             headers['Range'] = BlockLoader._make_range_header(offset, length)
@@ -352,15 +560,18 @@ class HttpLoader(BaseLoader):
                 headers['Cookie'] = self.cookie_maker.make()
 
         if not self.session:
-            self.session = requests.Session()
+            self.session = self.get_shared_session()
 
         r = self.session.get(url, headers=headers, stream=True)
         r.raise_for_status()
-        return StreamClosingReader(r.raw)
+        return r
 
 
 # =================================================================
 class S3Loader(BaseLoader):
+    # boto3 clients, shared by all s3 loaders, by credentials
+    clients = {}
+
     def __init__(self, **kwargs):
         super(S3Loader, self).__init__()
         self.client = None
@@ -368,10 +579,41 @@ class S3Loader(BaseLoader):
         self.aws_secret_access_key = kwargs.get('aws_secret_access_key')
 
     def load(self, url, offset, length):
-        if not s3_avail:  # pragma: no cover
+        if not import_boto3():  # pragma: no cover
             raise IOError('To load from s3 paths, ' +
                           'you must install boto3: pip install boto3')
 
+        if self.range_cache and length > 0:
+            def fetch(offset, length):
+                return self._get_object(url, offset, length)['Body'].read()
+
+            buff = self.range_cache.load(url, offset, length, fetch)
+            if buff is not None:
+                return BytesIO(buff)
+
+        return self._get_object(url, offset, length)['Body']
+
+    @classmethod
+    def get_client(cls, aws_access_key_id, aws_secret_access_key, anon=False):
+        key = (aws_access_key_id, aws_secret_access_key, anon)
+        client = cls.clients.get(key)
+        if not client:
+            if anon:
+                from botocore import UNSIGNED
+                from botocore.client import Config
+                config = Config(signature_version=UNSIGNED)
+            else:
+                config = None
+
+            client = boto3.client('s3', aws_access_key_id=aws_access_key_id,
+                                  aws_secret_access_key=aws_secret_access_key,
+                                  config=config)
+
+            cls.clients[key] = client
+
+        return client
+
+    def _get_object(self, url, offset, length):
         aws_access_key_id = self.aws_access_key_id
         aws_secret_access_key = self.aws_secret_access_key
 
@@ -393,14 +635,9 @@ class S3Loader(BaseLoader):
 
         def s3_load(anon=False):
             if not self.client:
-                if anon:
-                    config = Config(signature_version=UNSIGNED)
-                else:
-                    config = None
-
-                client = boto3.client('s3', aws_access_key_id=aws_access_key_id,
-                                      aws_secret_access_key=aws_secret_access_key,
-                                      config=config)
+                client = self.get_client(aws_access_key_id,
+                                         aws_secret_access_key,
+                                         anon)
             else:
                 client = self.client
 
@@ -422,7 +659,7 @@ class S3Loader(BaseLoader):
             else:
                 raise
 
-        return obj['Body']
+        return obj
 
 
 # =================================================================
@@ -500,5 +737,6 @@ class HMACCookieMaker(object):
 
 # ============================================================================
 BlockLoader.init_default_loaders()
+BlockLoader.init_range_cache()
 
 init_yaml_env_vars()
@@ -0,0 +1,261 @@
+"""
+LRU caches bounded by total size, in memory and in a directory, shared
+by the caches of pywb
+"""
+
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import time
+
+from gevent.monkey import get_original
+
+from pywb.utils.io import atomic_write
+
+
+# a real lock, even if the thread module is patched by gevent
+allocate_lock = get_original('_thread', 'allocate_lock')
+
+
+# ============================================================================
+class LRUCache(object):
+    """ LRU cache bounded by the total size of its values, in the units
+    of sizeof(value). By default each value has size 1, so that the
+    cache is bounded by its number of entries.
+
+    Values larger than 'max_entry_size' are not cached. If 'ttl' is set,
+    entries expire 'ttl' seconds after they are put, unless put with
+    an explicit expiry time.
+
+    The entries are guarded by a real thread lock, as a cache may also
+    be used by threads outside the gevent hub. The lock is only held
+    while the entries are updated, never across I/O.
+    """
+    def __init__(self, max_size, ttl=None, sizeof=None, max_entry_size=None):
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size if max_entry_size is not None else max_size
+        self.ttl = ttl
+        self.sizeof = sizeof
+
+        self.curr_size = 0
+        self.entries = OrderedDict()
+        self.lock = allocate_lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """ return the value for key, or default if not cached or expired
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                if entry[0] is None or entry[0] > time.time():
+                    self.entries[key] = entry
+                    self.hits += 1
+                    return entry[1]
+
+                self.curr_size -= entry[2]
+
+            self.misses += 1
+            return default
+
+    def put(self, key, value, expires=None):
+        """ cache value for key, and return the (key, value) pairs
+        evicted to make room for it
+        """
+        size = self.sizeof(value) if self.sizeof else 1
+
+        if expires is None and self.ttl is not None:
+            expires = time.time() + self.ttl
+
+        evicted = []
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.curr_size -= old[2]
+
+            if size > self.max_entry_size:
+                return evicted
+
+            self.entries[key] = (expires, value, size)
+            self.curr_size += size
+
+            while self.curr_size > self.max_size:
+                old_key, old = self.entries.popitem(last=False)
+                self.curr_size -= old[2]
+                evicted.append((old_key, old[1]))
+
+        return evicted
+
+    def pop(self, key, default=None):
+        """ remove and return the value for key, even if expired
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return default
+
+            self.curr_size -= entry[2]
+            return entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.curr_size = 0
+
+    def values(self):
+        with self.lock:
+            return [entry[1] for entry in self.entries.values()]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / float(total) if total else 0.0,
+                'size': self.curr_size,
+                'entries': len(self.entries)}
+
+
+# ============================================================================
+class DiskLRUCache(object):
+    """ LRU cache of byte strings in a directory, one file per key,
+    bounded by the total size of the files in bytes. If 'max_size'
+    is not set, the directory is not bounded.
+
+    Files already in the directory, left by an earlier run, are adopted
+    on init, oldest first, and files written by other processes sharing
+    the directory are adopted when first read, so that they are also
+    counted and evicted in turn.
+
+    If 'ttl' is set, files older than 'ttl' seconds are removed instead
+    of read. Files are replaced with atomic_write(), so that a partial
+    file is never read.
+    """
+    def __init__(self, cache_dir, max_size=None, ttl=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # file name -> (size, mtime)
+        self.files = OrderedDict()
+        self.curr_size = 0
+
+        self._load_cache_dir()
+
+    def get(self, key, remove=False):
+        """ return the bytes cached for key, or None if not cached
+        or expired. If remove is set, the file is removed once read
+        """
+        name = self._file_name(key)
+        entry = self.files.pop(name, None)
+        if entry is None:
+            entry = self._stat(name)
+            if entry is None:
+                return None
+
+        else:
+            self.curr_size -= entry[0]
+
+        path = os.path.join(self.cache_dir, name)
+        if self._is_expired(entry):
+            self._remove(path)
+            return None
+
+        try:
+            with open(path, 'rb') as fh:
+                buff = fh.read()
+        except (IOError, OSError):
+            return None
+
+        if remove:
+            self._remove(path)
+        else:
+            self._add(name, entry)
+
+        return buff
+
+    def expires(self, key):
+        """ return the time the file cached for key expires, or None
+        """
+        entry = self.files.get(self._file_name(key))
+        if entry is None or self.ttl is None:
+            return None
+
+        return entry[1] + self.ttl
+
+    def put(self, key, buff):
+        if self.max_size is not None and len(buff) > self.max_size:
+            return
+
+        name = self._file_name(key)
+        try:
+            with atomic_write(os.path.join(self.cache_dir, name)) as fh:
+                fh.write(buff)
+        except (IOError, OSError) as e:
+            logging.debug('Cache write failed: ' + str(e))
+            return
+
+        old = self.files.pop(name, None)
+        if old is not None:
+            self.curr_size -= old[0]
+
+        self._add(name, (len(buff), time.time()))
+
+    def _file_name(self, key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _load_cache_dir(self):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        # oldest first
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry = self._stat(name)
+            if entry is not None:
+                entries.append((entry[1], name, entry))
+
+        for mtime, name, entry in sorted(entries):
+            if self._is_expired(entry):
+                self._remove(os.path.join(self.cache_dir, name))
+            else:
+                self._add(name, entry)
+
+    def _stat(self, name):
+        try:
+            stat = os.stat(os.path.join(self.cache_dir, name))
+        except OSError:
+            return None
+
+        return (stat.st_size, stat.st_mtime)
+
+    def _is_expired(self, entry):
+        return self.ttl is not None and entry[1] + self.ttl <= time.time()
+
+    def _add(self, name, entry):
+        self.files[name] = entry
+        self.curr_size += entry[0]
+
+        if self.max_size is None:
+            return
+
+        while self.curr_size > self.max_size and self.files:
+            old_name, old = self.files.popitem(last=False)
+            self.curr_size -= old[0]
+            self._remove(os.path.join(self.cache_dir, old_name))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
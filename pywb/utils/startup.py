@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import logging
+import os
+import time
+
+try:  # pragma: no cover
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+
+# ============================================================================
+class StartupProfile(object):
+    """ Records the time taken to import and initialize each subsystem.
+
+    Subsystems which are only needed by some requests are created on
+    first use, so may be timed after startup. If enabled, with the
+    --startup-profile option or the PYWB_STARTUP_PROFILE env var,
+    each timing is also logged as it is recorded.
+    """
+    enabled = bool(os.environ.get('PYWB_STARTUP_PROFILE'))
+
+    timings = OrderedDict()
+
+    @classmethod
+    def enable(cls):
+        cls.enabled = True
+
+    @classmethod
+    @contextmanager
+    def timed(cls, name):
+        """ time the import or initialization of the named subsystem
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            cls.timings[name] = cls.timings.get(name, 0) + elapsed
+
+            if cls.enabled:
+                logging.info('Startup: {0} in {1:.1f} ms'.format(name, elapsed * 1000))
+
+    @classmethod
+    def get_max_rss(cls):
+        """ return the max resident set size of this process, in kB,
+        or None if not available
+        """
+        if not resource:  # pragma: no cover
+            return None
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    @classmethod
+    def report(cls):
+        """ return the lines of the report of all timings so far
+        """
+        lines = ['{0:>10.1f} ms  {1}'.format(elapsed * 1000, name)
+                 for name, elapsed in cls.timings.items()]
+
+        max_rss = cls.get_max_rss()
+        if max_rss is not None:
+            lines.append('{0:>10} kB  max rss'.format(max_rss))
+
+        return lines
+
+    @classmethod
+    def log_report(cls, title='Startup Profile'):
+        logging.info(title + ':\n' + '\n'.join(cls.report()))
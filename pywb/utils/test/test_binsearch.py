@@ -76,7 +76,9 @@ org,iana)/time-zones 20140126200737 http://www.iana.org/time-zones text/html 200
 
 #=================================================================
 import os
-from pywb.utils.binsearch import iter_prefix, iter_exact, iter_range
+from pywb.utils.binsearch import iter_prefix, iter_exact, iter_range, search
+from pywb.utils.binsearch import MappedIndex
+from pywb.utils.io import atomic_write
 from pywb.utils.merge import merge
 
 from pywb import get_test_dir
@@ -110,6 +112,93 @@ def test_rev_merge():
             list(merge(reversed(lines1), reversed(lines2), reverse=True)))
 
 
+def test_mapped_index():
+    filename = test_cdx_dir + 'iana.cdx'
+    mapped = MappedIndex.load(filename)
+
+    # mapping is shared until the file changes
+    assert MappedIndex.load(filename) is mapped
+
+    mapped = MappedIndex(filename, block_size=512)
+    assert len(mapped.offsets) > 10
+
+    with open(filename, 'rb') as cdx:
+        lines = [line.rstrip() for line in cdx]
+
+    keys = [b'a)/', b'org,iana)/', b'org,iana)/about', b'org,iana)/domains/root',
+            b'org,iana)/time-zones', b'z)/']
+
+    for key in keys:
+        for prev_size in (0, 1, 2):
+            with open(filename, 'rb') as cdx:
+                expected = list(search(cdx, key, prev_size=prev_size))
+
+            assert list(search(mapped.reader(), key, prev_size=prev_size)) == expected
+
+        with open(filename, 'rb') as cdx:
+            expected = list(iter_exact(cdx, key))
+
+        assert list(iter_exact(mapped.reader(), key)) == expected
+
+    assert list(iter_range(mapped.reader(), b'', b'~')) == lines
+
+
+def test_mapped_index_reload(tmpdir):
+    filename = str(tmpdir / 'test.cdxj')
+    with open(filename, 'wb') as fh:
+        fh.write(b'a 1\nb 2\n')
+
+    mapped = MappedIndex.load(filename)
+    assert list(iter_prefix(mapped.reader(), b'b')) == [b'b 2']
+
+    with open(filename, 'wb') as fh:
+        fh.write(b'a 1\nb 2\nb 3\n')
+
+    reader = MappedIndex.load(filename).reader()
+    assert reader.mapped is not mapped
+    assert list(iter_prefix(reader, b'b')) == [b'b 2', b'b 3']
+
+    with open(filename, 'wb') as fh:
+        pass
+
+    assert list(iter_prefix(MappedIndex.load(filename).reader(), b'b')) == []
+
+
+def test_mapped_index_replace(tmpdir):
+    filename = str(tmpdir / 'test.cdxj')
+    with atomic_write(filename) as fh:
+        fh.write(b''.join(b'a %d\n' % i for i in range(10000)))
+
+    lines = iter_range(MappedIndex.load(filename).reader(), b'a', b'b')
+    assert next(lines) == b'a 0'
+
+    # replaced while read, the old mapping is still readable
+    with atomic_write(filename) as fh:
+        fh.write(b'a 1\n')
+
+    assert len(list(lines)) == 9999
+    assert list(iter_range(MappedIndex.load(filename).reader(), b'a', b'b')) == [b'a 1']
+
+    # removed files are dropped
+    os.remove(filename)
+    MappedIndex.purge()
+    assert filename not in MappedIndex._mapped
+
+
+def test_mapped_index_max_mapped(tmpdir):
+    filenames = []
+    for i in range(MappedIndex.MAX_MAPPED + 5):
+        filename = str(tmpdir / 'test{0}.cdxj'.format(i))
+        with open(filename, 'wb') as fh:
+            fh.write(b'a 1\n')
+
+        MappedIndex.load(filename)
+        filenames.append(filename)
+
+    assert len(MappedIndex._mapped) == MappedIndex.MAX_MAPPED
+    assert filenames[0] not in MappedIndex._mapped
+    assert filenames[-1] in MappedIndex._mapped
+
 
 if __name__ == "__main__":
     import doctest
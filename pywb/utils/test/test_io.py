@@ -0,0 +1,48 @@
+from io import BytesIO
+
+from warcio.limitreader import LimitReader
+
+from pywb.utils.io import ChainedReader, OffsetLimitReader, seek_forward
+
+
+# ============================================================================
+class NonSeekable(object):
+    def __init__(self, buff):
+        self.stream = BytesIO(buff)
+        self.reads = 0
+
+    def read(self, length=None):
+        self.reads += 1
+        return self.stream.read(length)
+
+
+# ============================================================================
+class TestIO(object):
+    def test_offset_limit_seekable(self):
+        stream = BytesIO(b'0123456789')
+        reader = OffsetLimitReader(stream, 4, 3)
+        assert reader.read() == b'456'
+        assert reader.read() == b''
+
+    def test_offset_limit_non_seekable(self):
+        stream = NonSeekable(b'0123456789' * 10000)
+        reader = OffsetLimitReader(stream, 50004, 3)
+        assert reader.read() == b'456'
+        # skipped in multiple bounded reads, not a single large read
+        assert stream.reads > 2
+
+    def test_seek_forward_limit_reader(self):
+        stream = LimitReader(BytesIO(b'0123456789'), 8)
+        assert seek_forward(stream, 5)
+        assert stream.read() == b'567'
+
+        assert not seek_forward(LimitReader(NonSeekable(b'abc'), 3), 1)
+
+    def test_chained_reader(self):
+        reader = ChainedReader([BytesIO(b'abc\ndef'), BytesIO(b'ghi')], 10)
+        assert len(reader) == 10
+        assert reader.readline() == b'abc\n'
+        assert reader.read(2) == b'de'
+        assert reader.read() == b'f'
+        assert reader.read() == b'ghi'
+        assert reader.read() == b''
@@ -86,6 +86,7 @@ from yaml import Loader
 from pywb.utils.loaders import BlockLoader, HMACCookieMaker, to_file_url
 from pywb.utils.loaders import extract_client_cookie
 from pywb.utils.loaders import read_last_line
+from pywb.utils.loaders import HttpLoader, RangeBlockCache
 
 from pywb.utils.canonicalize import canonicalize
 
@@ -201,3 +202,104 @@ if __name__ == "__main__":
     doctest.testmod()
 
 
+
+
+# Range Block Cache
+def test_range_block_cache(tmpdir):
+    data = bytes(bytearray(range(256))) * 4
+    fetches = []
+
+    def fetch(offset, length):
+        fetches.append((offset, length))
+        return data[offset:offset + length]
+
+    cache = RangeBlockCache(max_size=64, block_size=16, readahead=1)
+
+    assert cache.load('http://example.com/', 20, 10, fetch) == data[20:30]
+    assert fetches == [(16, 32)]
+
+    # same and next (readahead) block are cached
+    assert cache.load('http://example.com/', 24, 20, fetch) == data[24:44]
+    assert fetches == [(16, 32)]
+
+    # only missing blocks are fetched, adjacent ones in one request
+    assert cache.load('http://example.com/', 0, 80, fetch) == data[0:80]
+    assert fetches == [(16, 32), (0, 16), (48, 48)]
+
+    # end of file, partial block is not cached
+    assert cache.load('http://example.com/', 1020, 10, fetch) == data[1020:]
+    assert cache.load('http://example.com/', 1020, 10, fetch) == data[1020:]
+    assert fetches[-2:] == [(1008, 48), (1024, 32)]
+
+    # memory size is bounded
+    assert cache.blocks.curr_size <= 64
+
+    # too large or unknown length
+    assert cache.load('http://example.com/', 0, -1, fetch) is None
+    assert RangeBlockCache(max_read_size=10).load('http://example.com/', 0, 11, fetch) is None
+
+    # range not supported
+    assert cache.load('http://example.com/other', 0, 10, lambda offset, length: None) is None
+
+
+def test_range_block_cache_dir(tmpdir):
+    data = b'abcdefghijklmnopqrstuvwxyz' * 10
+    cache_dir = str(tmpdir)
+
+    def fetch(offset, length):
+        return data[offset:offset + length]
+
+    cache = RangeBlockCache(max_size=16, block_size=16, cache_dir=cache_dir, readahead=0)
+    assert cache.load('s3://bucket/file', 0, 40, fetch) == data[:40]
+    assert len(os.listdir(cache_dir)) == 3
+
+    # persisted across instances
+    cache = RangeBlockCache(max_size=16, block_size=16, cache_dir=cache_dir)
+
+    def no_fetch(offset, length):
+        assert False
+
+    assert cache.load('s3://bucket/file', 10, 30, no_fetch) == data[10:40]
+    assert cache.stats()['disk_hits'] == 3
+
+    # dir size is bounded
+    cache = RangeBlockCache(max_size=16, block_size=16, cache_dir=cache_dir, cache_dir_size=32)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_http_loader_range_cache():
+    data = b'0123456789' * 1000
+
+    class MockResponse(object):
+        def __init__(self, status_code, content):
+            self.status_code = status_code
+            self.content = content
+            self.raw = BytesIO(content)
+
+        def raise_for_status(self):
+            pass
+
+        def close(self):
+            pass
+
+    class MockSession(object):
+        def __init__(self):
+            self.ranges = []
+
+        def get(self, url, headers=None, stream=False):
+            range_ = headers['Range']
+            self.ranges.append(range_)
+            start, end = range_.split('=')[1].split('-')
+            return MockResponse(206, data[int(start):int(end) + 1])
+
+    loader = HttpLoader()
+    loader.session = MockSession()
+
+    orig_cache = HttpLoader.range_cache
+    try:
+        HttpLoader.range_cache = RangeBlockCache(block_size=1024)
+        assert loader.load('http://example.com/file', 10, 20).read() == data[10:30]
+        assert loader.load('http://example.com/file', 40, 20).read() == data[40:60]
+        assert loader.session.ranges == ['bytes=0-2047']
+    finally:
+        HttpLoader.range_cache = orig_cache
@@ -0,0 +1,125 @@
+import os
+import time
+
+from pywb.utils.lrucache import DiskLRUCache, LRUCache
+
+
+# ============================================================================
+def test_lru_max_entries():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+
+    # 'a' most recently used
+    assert cache.get('a') == 1
+
+    assert cache.put('c', 3) == [('b', 2)]
+    assert cache.get('b') is None
+    assert cache.values() == [1, 3]
+
+    assert cache.stats() == {'hits': 1,
+                             'misses': 1,
+                             'hit_ratio': 0.5,
+                             'size': 2,
+                             'entries': 2}
+
+
+def test_lru_max_size():
+    cache = LRUCache(10, sizeof=len, max_entry_size=6)
+
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+
+    # too large, not cached, old value removed
+    assert cache.put('b', b'1234567') == []
+    assert 'b' not in cache
+    assert cache.curr_size == 4
+
+    cache.put('c', b'123456')
+    assert cache.curr_size == 10
+
+    assert cache.put('d', b'12') == [('a', b'1234')]
+    assert cache.curr_size == 8
+
+    assert cache.pop('c') == b'123456'
+    assert cache.pop('c') is None
+    assert cache.curr_size == 2
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.curr_size == 0
+
+
+def test_lru_ttl():
+    cache = LRUCache(10, ttl=60)
+
+    cache.put('a', 1)
+    cache.put('b', 2, expires=time.time() - 1)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+
+    # expired entries removed when looked up
+    assert len(cache) == 1
+    assert cache.curr_size == 1
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def test_disk_lru_max_size(tmpdir):
+    cache_dir = str(tmpdir)
+    cache = DiskLRUCache(cache_dir, 10)
+
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    assert cache.get('a') == b'1234'
+
+    cache.put('c', b'1234')
+    assert cache.get('b') is None
+    assert cache.curr_size == dir_size(cache_dir) == 8
+
+    assert cache.get('c', remove=True) == b'1234'
+    assert cache.get('c') is None
+    assert cache.curr_size == dir_size(cache_dir) == 4
+
+
+def test_disk_lru_adopt_existing(tmpdir):
+    cache_dir = str(tmpdir)
+
+    # files of earlier runs counted and evicted in turn
+    for i in range(3):
+        cache = DiskLRUCache(cache_dir, 10)
+        cache.put('a' + str(i), b'1234')
+        cache.put('b' + str(i), b'1234')
+
+        assert cache.curr_size == dir_size(cache_dir) == 8
+
+    assert cache.get('a0') is None
+    assert cache.get('a2') == b'1234'
+
+    # files of other processes adopted when read
+    other = DiskLRUCache(cache_dir, 10)
+    other.put('c', b'12')
+
+    assert cache.get('c') == b'12'
+    assert cache.curr_size == dir_size(cache_dir) == 10
+
+
+def test_disk_lru_ttl(tmpdir):
+    cache_dir = str(tmpdir)
+    cache = DiskLRUCache(cache_dir, ttl=60)
+
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    assert cache.expires('a') > time.time()
+
+    mtime = time.time() - 120
+    os.utime(os.path.join(cache_dir, cache._file_name('a')), (mtime, mtime))
+
+    # expired files removed on init
+    cache = DiskLRUCache(cache_dir, ttl=60)
+    assert cache.get('a') is None
+    assert cache.get('b') == b'1234'
+    assert len(os.listdir(cache_dir)) == 1
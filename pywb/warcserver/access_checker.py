@@ -1,21 +1,202 @@
 from pywb.warcserver.index.indexsource import FileIndexSource
-from pywb.warcserver.index.aggregator import DirectoryIndexSource, CacheDirectoryMixin
+from pywb.warcserver.index.aggregator import BaseAggregator, DirectoryIndexSource, CacheDirectoryMixin
 from pywb.warcserver.index.aggregator import SimpleAggregator
-from pywb.warcserver.index.cdxobject import CDXObject
+from pywb.warcserver.index.cdxobject import CDXObject, CDXException
+from pywb.warcserver.index.query import CDXQuery
 
 from pywb.utils.binsearch import search
+from pywb.utils.format import res_template
 from pywb.utils.merge import merge
+from pywb.utils.wbexception import NotFoundException
 
-from warcio.timeutils import timestamp_to_datetime
+from warcio.timeutils import timestamp_to_datetime, datetime_to_timestamp
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import os
+import re
+
+
+# ============================================================================
+class AccessRuleTrie(object):
+    """The rules of an access control list, compiled into a trie of
+    SURT segments, so that the rule for a url key is found with a
+    single walk of the key.
+
+    Rules match any key that starts with the rule key, so a rule key
+    which does not end on a segment boundary is stored with the
+    remainder at the node of its last full segment. Exact match rules,
+    ending in '###', are kept in a separate dict.
+    """
+
+    # a segment ends with a separator, except the last segment of a key
+    SEGMENT_RX = re.compile(br'[^,)/?&=]*[,)/?&=]')
+
+    EXACT_SUFFIX_B = b'###'  # type: bytes
+
+    def __init__(self):
+        self.root = self._new_node()
+        self.exact = {}
+
+    @staticmethod
+    def _new_node():
+        # (children by segment, rules by remainder)
+        return ({}, {})
+
+    @classmethod
+    def _split(cls, key):
+        """Split a key into the full segments and the remainder
+
+        :param bytes key: The url key
+        :return: The list of segments and the remainder
+        :rtype: tuple
+        """
+        segments = cls.SEGMENT_RX.findall(key)
+        return segments, key[sum(len(seg) for seg in segments):]
+
+    @staticmethod
+    def _add_rule(rules, rule):
+        user = rule.get('user') or None
+        # the first rule for a user is used, as by the sorted search
+        rules.setdefault(user, rule)
+
+    @staticmethod
+    def _select(rules, acl_user):
+        """Select the rule for the user, or the rule for all users"""
+        if acl_user:
+            rule = rules.get(acl_user)
+            if rule:
+                return rule
+
+        return rules.get(None)
+
+    def add(self, line):
+        """Add the rule of an access control list line
+
+        :param bytes line: The line of the access control list
+        """
+        try:
+            rule = CDXObject(line)
+        except CDXException:
+            return
+
+        key = line.split(b' ', 1)[0]
+
+        if key.endswith(self.EXACT_SUFFIX_B):
+            self._add_rule(self.exact.setdefault(key[:-len(self.EXACT_SUFFIX_B)], {}), rule)
+            return
+
+        segments, remainder = self._split(key)
+
+        node = self.root
+        for seg in segments:
+            node = node[0].setdefault(seg, self._new_node())
+
+        self._add_rule(node[1].setdefault(remainder, {}), rule)
+
+    def find(self, key, acl_user=None):
+        """Find the most specific rule for the url key and user
+
+        :param bytes key: The url key
+        :param str|None acl_user: The access control user, if any
+        :return: The matching rule, or None
+        :rtype: CDXObject|None
+        """
+        rules = self.exact.get(key)
+        if rules:
+            rule = self._select(rules, acl_user)
+            if rule:
+                return rule
+
+        best = None
+        node = self.root
+        pos = 0
+
+        for seg in self.SEGMENT_RX.findall(key) + [None]:
+            best = self._find_in_node(node, key, pos, acl_user) or best
+
+            if seg is None:
+                break
+
+            node = node[0].get(seg)
+            if node is None:
+                break
+
+            pos += len(seg)
+
+        return best
+
+    def _find_in_node(self, node, key, pos, acl_user):
+        best = None
+        best_len = -1
+
+        for remainder, rules in node[1].items():
+            if len(remainder) <= best_len or not key.startswith(remainder, pos):
+                continue
+
+            rule = self._select(rules, acl_user)
+            if rule:
+                best = rule
+                best_len = len(remainder)
+
+        return best
+
+    @classmethod
+    def load(cls, fh):
+        """Compile the rules of an access control list file
+
+        :param fh: The file handle to an access control list
+        :return: The compiled rules
+        :rtype: AccessRuleTrie
+        """
+        trie = cls()
+        for line in fh:
+            line = line.rstrip()
+            if line:
+                trie.add(line)
+
+        return trie
 
 
 # ============================================================================
 class FileAccessIndexSource(FileIndexSource):
     """An Index Source class specific to access control lists"""
 
+    # acl files are rewritten in place, so are not mapped
+    USE_MMAP = False
+
+    def __init__(self, filename, config=None):
+        super(FileAccessIndexSource, self).__init__(filename, config)
+        self._rules = None
+
+    def load_rules(self, params):
+        """Return the compiled rules of the access control list,
+        compiled again if the file has changed since last loaded
+
+        :param dict params: The params used to resolve the filename
+        :return: The compiled rules
+        :rtype: AccessRuleTrie
+        :raises NotFoundException: If the file does not exist
+        """
+        filename = res_template(self.filename_template, params)
+
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            raise NotFoundException(filename)
+
+        version = (filename, stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+        cached = self._rules
+        if cached and cached[0] == version:
+            return cached[1]
+
+        with open(filename, 'rb') as fh:
+            rules = AccessRuleTrie.load(fh)
+
+        # replaced as a whole, for concurrent lookups
+        self._rules = (version, rules)
+        return rules
+
     @staticmethod
     def rev_cmp(a, b):
         """Performs a comparison between two items using the
@@ -28,12 +209,13 @@ class FileAccessIndexSource(FileIndexSource):
         """
         return (a < b) - (a > b)
 
-    def _do_iter(self, fh, params):
+    def _do_iter(self, fh, params, collapse=False):
         """Iterates over the supplied file handle to an access control list
         yielding the results of the search for the params key
 
         :param TextIO fh: The file handle to an access control list
         :param dict params: The params of the
+        :param bool collapse: Unused, access rules are never collapsed
         :return: A generator yielding the results of the param search
         """
         exact_suffix = params.get('exact_match_suffix')
@@ -107,6 +289,9 @@ class AccessChecker(object):
         self.default_rule['access'] = default_access
         self.default_rule['default'] = 'true'
 
+        # use compiled rules, until a source which can not be compiled is found
+        self.compiled = True
+
         self.embargo = self.parse_embargo(embargo)
 
     def parse_embargo(self, embargo):
@@ -143,35 +328,68 @@ class AccessChecker(object):
 
         return embargo
 
-    def check_embargo(self, url, ts):
+    def get_embargo_range(self):
+        """Return the embargoed range of capture timestamps, as a tuple of
+        '<' or '>' and a 14-digit timestamp: captures before or after it
+        are embargoed. The range of an embargo relative to the current
+        time is only valid for the current request.
+
+        :return: The embargoed range, or None if no embargo
+        :rtype: tuple|None
+        """
         if not self.embargo:
             return None
 
-        dt = timestamp_to_datetime(ts)
-        access = self.embargo.get('access', 'exclude')
-
         # embargo before
         before = self.embargo.get('before')
         if before:
-            print(dt, before)
-            return access if dt < before else None
+            return ('<', datetime_to_timestamp(before))
 
         # embargo after
         after = self.embargo.get('after')
         if after:
-            return access if dt > after else None
+            return ('>', datetime_to_timestamp(after))
 
-        # embargo if newser than
+        # embargo if newer than
         newer = self.embargo.get('newer')
         if newer:
-            actual = datetime.utcnow() - newer
-            return access if actual < dt else None
+            return ('>', datetime_to_timestamp(datetime.utcnow() - newer))
 
         # embargo if older than
         older = self.embargo.get('older')
         if older:
-            actual = datetime.utcnow() - older
-            return access if actual > dt else None
+            return ('<', datetime_to_timestamp(datetime.utcnow() - older))
+
+        return None
+
+    def check_embargo(self, url, ts, embargo_range=None):
+        """Return the embargo access for a capture, or None if the
+        capture is not embargoed
+
+        :param str url: The URL of the capture
+        :param str ts: The timestamp of the capture
+        :param tuple embargo_range: The embargoed range, if already
+        computed for this request, see :meth:`get_embargo_range`
+        :return: The embargo access, or None
+        :rtype: str|None
+        """
+        if not self.embargo:
+            return None
+
+        if not embargo_range:
+            embargo_range = self.get_embargo_range()
+            if not embargo_range:
+                return None
+
+        # 14-digit timestamps compare as the dates they represent
+        if len(ts) != 14 or not ts.isdigit():
+            ts = datetime_to_timestamp(timestamp_to_datetime(ts))
+
+        op, bound = embargo_range
+        if (ts < bound) if op == '<' else (ts > bound):
+            return self.embargo.get('access', 'exclude')
+
+        return None
 
     def create_access_aggregator(self, source_files):
         """Creates a new AccessRulesAggregator using the supplied list
@@ -213,6 +431,93 @@ class AccessChecker(object):
         """Attempts to find the access control rule for the
         supplied URL otherwise returns the default rule
 
+        The compiled rules of each access control list are used if all
+        sources are access control list files or directories of them,
+        otherwise the access sources are queried
+
+        :param str url: The URL for the rule to be found
+        :param str|None ts: A timestamp (not used)
+        :param str|None urlkey: The access control url key
+        :param str|None collection: The collection, if any
+        :param str|None acl_user: The access control user, if any
+        :return: The access control rule for the supplied URL
+        if one exists otherwise the default rule
+        :rtype: CDXObject
+        """
+        if self.compiled:
+            params = {'url': url}
+            if collection:
+                params['param.coll'] = collection
+
+            try:
+                rule_lists = list(self._iter_rule_lists(self.aggregator, params))
+            except TypeError:
+                # not all sources can be compiled
+                self.compiled = False
+            else:
+                key = CDXQuery(params).key
+                return self._find_compiled_rule(rule_lists, key, acl_user)
+
+        return self._query_access_rule(url, ts, urlkey, collection, acl_user)
+
+    def _iter_rule_lists(self, source, params):
+        """Yield the compiled rules of each access control list file
+        of the source, skipping missing files
+
+        :param source: The access source
+        :param dict params: The params of the lookup
+        :raises TypeError: If a source is not an access control list
+        """
+        if isinstance(source, FileAccessIndexSource):
+            try:
+                yield source.load_rules(params)
+            except NotFoundException:
+                pass
+
+        elif isinstance(source, BaseAggregator) and hasattr(source, '_iter_sources'):
+            try:
+                sources = list(source._iter_sources(params))
+            except NotFoundException:
+                return
+
+            for name, child in sources:
+                for rules in self._iter_rule_lists(child, params):
+                    yield rules
+
+        else:
+            raise TypeError('Access source can not be compiled: ' + str(source))
+
+    def _find_compiled_rule(self, rule_lists, key, acl_user):
+        """Return the most specific rule for the key of all the
+        compiled access control lists, or the default rule
+
+        :param list[AccessRuleTrie] rule_lists: The compiled rules
+        :param bytes key: The url key
+        :param str|None acl_user: The access control user, if any
+        :return: The access control rule
+        :rtype: CDXObject
+        """
+        best = None
+        best_rank = None
+
+        for rules in rule_lists:
+            rule = rules.find(key, acl_user)
+            if not rule:
+                continue
+
+            # the longest rule key wins, then a rule for the user
+            rank = (len(rule['urlkey']), bool(rule.get('user')))
+            if not best or rank > best_rank:
+                best = rule
+                best_rank = rank
+
+        return best or self.default_rule
+
+    def _query_access_rule(self, url, ts=None, urlkey=None, collection=None, acl_user=None):
+        """Attempts to find the access control rule for the
+        supplied URL by querying the access sources, otherwise
+        returns the default rule
+
         :param str url: The URL for the rule to be found
         :param str|None ts: A timestamp (not used)
         :param str|None urlkey: The access control url key
@@ -301,6 +606,8 @@ class AccessChecker(object):
         last_user = None
         rule = None
 
+        embargo_range = self.get_embargo_range()
+
         for cdx in cdx_iter:
             url = cdx.get('url')
             timestamp = cdx.get('timestamp')
@@ -323,8 +630,8 @@ class AccessChecker(object):
 
                 access = rule.get('access', 'exclude')
 
-            if access != 'allow_ignore_embargo' and access != 'exclude':
-                embargo_access = self.check_embargo(url, timestamp)
+            if embargo_range and access != 'allow_ignore_embargo' and access != 'exclude':
+                embargo_access = self.check_embargo(url, timestamp, embargo_range)
                 if embargo_access and embargo_access != 'allow':
                     access = embargo_access
 
@@ -4,8 +4,10 @@ from pywb.utils.memento import MementoUtils
 
 from warcio.recordloader import ArchiveLoadFailed
 
+from pywb.warcserver.index.aggregator import BaseAggregator
 from pywb.warcserver.index.cdxobject import CDXException
 from pywb.warcserver.index.fuzzymatcher import FuzzyMatcher
+from pywb.warcserver.index.query import CDXQuery
 from pywb.warcserver.resource.responseloader import  WARCPathLoader, LiveWebLoader, VideoLoader
 
 import six
@@ -51,6 +53,10 @@ class IndexHandler(object):
         self.fuzzy = FuzzyMatcher(kwargs.get('rules_file'))
         self.access_checker = kwargs.get('access_checker')
 
+        # no fuzzy matching for live sources, so the request body is not needed
+        self.is_live_only = (isinstance(index_source, BaseAggregator) and
+                             index_source.is_live_only())
+
     def get_supported_modes(self):
         return dict(modes=['list_sources', 'index'])
 
@@ -62,7 +68,8 @@ class IndexHandler(object):
 
         input_req = params.get('_input_req')
         if input_req:
-            params['alt_url'] = input_req.include_method_query(url)
+            params['alt_url'] = input_req.include_method_query(url,
+                                                               read_body=not self.is_live_only)
 
         cdx_iter = self.fuzzy(self.index_source, params)
 
@@ -134,16 +141,51 @@ class ResourceHandler(IndexHandler):
         super(ResourceHandler, self).__init__(index_source, **kwargs)
         self.resource_loaders = resource_loaders
 
+        # (name, source) if the only index is a single live index
+        self.live_source = None
+        if self.is_live_only and len(index_source.sources) == 1:
+            self.live_source = next(six.iteritems(index_source.sources))
+
     def get_supported_modes(self):
         res = super(ResourceHandler, self).get_supported_modes()
         res['modes'].append('resource')
         return res
 
+    def _load_live_cdx(self, params):
+        """ Load the single live cdx directly from the live index,
+        skipping aggregation, sorting and fuzzy matching, which have
+        no effect on a single live result
+        """
+        url = params.get('url')
+        if not url:
+            errs = dict(last_exc=BadRequestException('The "url" param is required'))
+            return None, errs
+
+        input_req = params.get('_input_req')
+        if input_req:
+            params['alt_url'] = input_req.include_method_query(url, read_body=False)
+
+        CDXQuery(params)
+
+        name, source = self.live_source
+        cdx_iter, err_list = self.index_source.load_child_source(name, source, params)
+
+        if self.access_checker:
+            acl_user = input_req.env.get('HTTP_X_PYWB_ACL_USER') if input_req else None
+            cdx_iter = self.access_checker.wrap_iter(cdx_iter, acl_user)
+
+        return cdx_iter, dict(err_list)
+
     def __call__(self, params):
         if params.get('mode', 'resource') != 'resource':
             return super(ResourceHandler, self).__call__(params)
 
-        cdx_iter, errs = self._load_index_source(params)
+        if (self.live_source and not params.get('filter') and
+            not params.get(self.index_source.sources_key)):
+            cdx_iter, errs = self._load_live_cdx(params)
+        else:
+            cdx_iter, errs = self._load_index_source(params)
+
         if not cdx_iter:
             return None, None, errs
 
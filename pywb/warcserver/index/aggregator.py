@@ -11,11 +11,16 @@ from heapq import merge
 from collections import deque
 from itertools import chain
 
+from pywb.utils.binsearch import MappedIndex
 from pywb.utils.wbexception import NotFoundException, WbException
 from pywb.utils.format import ParamFormatter, res_template
 
-from pywb.warcserver.index.indexsource import FileIndexSource, RedisIndexSource
+from pywb.warcserver.index.indexsource import FileIndexSource, RedisIndexSource, LiveIndexSource
 from pywb.warcserver.index.cdxops import process_cdx
+from pywb.warcserver.index.digestindex import DigestIndex
+from pywb.warcserver.index.dirwatcher import DirWatcher
+from pywb.warcserver.index.indexfilter import IndexFilter
+from pywb.warcserver.index.resultcache import CDXResultCache
 from pywb.warcserver.index.query import CDXQuery
 from pywb.warcserver.index.zipnum import ZipNumIndexSource
 
@@ -25,6 +30,9 @@ import glob
 
 #=============================================================================
 class BaseAggregator(object):
+    # optional CDXResultCache for processed query results
+    result_cache = None
+
     def __call__(self, params):
         if params.get('closest') == 'now':
             params['closest'] = timestamp_now()
@@ -35,14 +43,42 @@ class BaseAggregator(object):
 
         query = CDXQuery(params)
 
+        # shared with the index sources, to avoid parsing the query again
+        params['_query'] = query
+
+        cache_key = None
+        if (self.result_cache and not query.page_count and
+            not query.secondary_index_only):
+            cache_key = self.result_cache.make_key(self, params)
+
+        if cache_key:
+            res = self.result_cache.get(cache_key)
+            if res:
+                return res
+
+            params['_cache_deps'] = []
+
+        # set by load_index() for this query only
+        params.pop('_collapse_lines', None)
+
         cdx_iter, errs = self.load_index(query.params)
 
         if not query.page_count:
             cdx_iter = process_cdx(cdx_iter, query)
 
-        return cdx_iter, dict(errs)
+        errs = dict(errs)
+
+        if cache_key:
+            cdx_iter = self.result_cache.cache_results(cache_key, cdx_iter, errs,
+                                                       params.pop('_cache_deps'))
+
+        return cdx_iter, errs
 
     def load_child_source(self, name, source, params):
+        deps = params.get('_cache_deps')
+        if deps is not None:
+            self._add_cache_dep(source, params, deps)
+
         try:
             params['_name'] = name
             params['_formatter'] = ParamFormatter(params, name)
@@ -79,11 +115,64 @@ class BaseAggregator(object):
 
         return cdx_iter, err_list
 
+    def _add_cache_dep(self, source, params, deps):
+        if isinstance(source, LiveIndexSource):
+            deps.append((CDXResultCache.LIVE, None))
+
+        elif isinstance(source, FileIndexSource):
+            deps.append((CDXResultCache.FILE,
+                         res_template(source.filename_template, params)))
+
+        elif isinstance(source, ZipNumIndexSource):
+            deps.append((CDXResultCache.FILE, source.summary))
+
+        # aggregators add the sources they load themselves
+        elif not isinstance(source, BaseAggregator):
+            deps.append((CDXResultCache.REMOTE, None))
+
     def _get_coll(self, name):
         return name
 
+    def is_live_only(self):
+        return False
+
+    def lookup_digest(self, digest, params):
+        """ return a cdx with the location of an original capture with
+        the payload digest, from the digest index of a local index file,
+        or None if not found
+        """
+        try:
+            sources = list(self._iter_sources(params))
+        except WbException:
+            return None
+
+        for name, source in sources:
+            if isinstance(source, BaseAggregator):
+                cdx = source.lookup_digest(digest, params)
+
+            elif isinstance(source, FileIndexSource):
+                filename = res_template(source.filename_template, params)
+                cdx = DigestIndex.lookup(filename, digest)
+
+            else:
+                continue
+
+            if cdx:
+                return cdx
+
+        return None
+
     def load_index(self, params):
-        res_list = self._load_all(params)
+        sources = list(self._iter_sources(params))
+
+        # if results come from a single index, the index source may also
+        # collapse the raw lines before creating objects. Set before any
+        # source is loaded, nested aggregators keep the value of the first
+        if '_collapse_lines' not in params:
+            params['_collapse_lines'] = (len(sources) == 1 and
+                                         not isinstance(sources[0][1], BaseAggregator))
+
+        res_list = self._load_all(params, sources)
 
         iter_list = [res[0] for res in res_list]
         err_list = chain(*[res[1] for res in res_list])
@@ -102,7 +191,7 @@ class BaseAggregator(object):
     def _on_source_error(self, name):  #pragma: no cover
         pass
 
-    def _load_all(self, params):  #pragma: no cover
+    def _load_all(self, params, sources):  #pragma: no cover
         raise NotImplemented()
 
     def _iter_sources(self, params):  #pragma: no cover
@@ -125,6 +214,11 @@ class BaseSourceListAggregator(BaseAggregator):
     def get_all_sources(self, params):
         return self.sources
 
+    def is_live_only(self):
+        return (len(self.sources) > 0 and
+                all(isinstance(source, LiveIndexSource)
+                    for source in six.itervalues(self.sources)))
+
     def _iter_sources(self, params):
         invert_sources = self.invert_sources
         sel_sources = params.get(self.sources_key)
@@ -172,8 +266,7 @@ class SeqAggMixin(object):
         super(SeqAggMixin, self).__init__(*args, **kwargs)
 
 
-    def _load_all(self, params):
-        sources = self._iter_sources(params)
+    def _load_all(self, params, sources):
         return [self.load_child_source(name, source, params)
                 for name, source in sources]
 
@@ -232,11 +325,9 @@ class GeventMixin(object):
         self.pool = Pool(size=kwargs.get('size'))
         self.timeout = kwargs.get('timeout') or self.DEFAULT_TIMEOUT
 
-    def _load_all(self, params):
+    def _load_all(self, params, sources):
         params['_timeout'] = self.timeout
 
-        sources = list(self._iter_sources(params))
-
         def do_spawn(name, source):
             return self.pool.spawn(self.load_child_source, name, source, params)
 
@@ -276,12 +367,39 @@ class BaseDirectoryIndexSource(BaseAggregator):
     def _iter_sources(self, params):
         the_dir = res_template(self.base_dir, params)
         the_dir = os.path.join(self.base_prefix, the_dir)
+
+        deps = params.get('_cache_deps')
+        if deps is not None:
+            self._add_dir_deps(the_dir, deps)
+
         try:
             sources = list(self._load_files(the_dir))
         except Exception:
             raise NotFoundException(the_dir)
 
-        return sources
+        return [(name, source) for name, source in sources
+                if self._may_contain(source, params)]
+
+    def _add_dir_deps(self, glob_dir, deps):
+        # new matching dirs may appear at any time
+        if any(c in glob_dir for c in '*?['):
+            deps.append((CDXResultCache.REMOTE, None))
+            dirs = glob.glob(glob_dir)
+        else:
+            dirs = [glob_dir]
+
+        for the_dir in dirs:
+            deps.append((CDXResultCache.FILE, the_dir))
+
+    def _may_contain(self, source, params):
+        """ skip index files which have an up-to-date filter file
+        and can not contain any results for this query
+        """
+        if not isinstance(source, FileIndexSource):
+            return True
+
+        index_filter = IndexFilter.load_for_index(source.filename_template)
+        return not index_filter or index_filter.may_contain(params)
 
     def _load_files(self, glob_dir):
         for the_dir in glob.iglob(glob_dir):
@@ -349,28 +467,56 @@ class DirectoryIndexSource(SeqAggMixin, BaseDirectoryIndexSource):
 
 #=============================================================================
 class CacheDirectoryMixin(object):
+    """ Directory source which keeps the index files of each directory
+    up to date in the background, see :class:`DirWatcher`, so that
+    requests do not access the filesystem to find the index files.
+
+    The index filter and the stat key of each cdx file are also checked
+    when its directory is reloaded, so that requests do not need to
+    check them again. Index files must be replaced, not modified in place,
+    for changes to be seen.
+    """
     def __init__(self, *args, **kwargs):
         super(CacheDirectoryMixin, self).__init__(*args, **kwargs)
-        self.cached_file_list = {}
+        config = self.config or {}
+        self.watcher = DirWatcher(self._reload_files_single_dir,
+                                  interval=config.get('index_dir_check_interval'))
 
-    def _load_files_single_dir(self, the_dir):
-        try:
-            stat = os.stat(the_dir)
-        except Exception as e:
-            stat = 0
-
-        result = self.cached_file_list.get(the_dir)
-
-        if result:
-            last_stat, files = result
-            if stat and last_stat == stat:
-                print('Dir {0} unchanged'.format(the_dir))
-                return files
-
-        files = super(CacheDirectoryMixin, self)._load_files_single_dir(the_dir)
-        files = list(files)
-        self.cached_file_list[the_dir] = (stat, files)
-        return files
+    def _load_files(self, glob_dir):
+        return self.watcher.get_files(glob_dir)
+
+    def _reload_files_single_dir(self, the_dir, old_files):
+        # keep existing sources for unchanged files
+        old_sources = dict(old_files)
+
+        for name, source in self._load_files_single_dir(the_dir):
+            old_source = old_sources.get(name)
+
+            if isinstance(source, FileIndexSource):
+                filename = source.filename_template
+                try:
+                    source.stat_key = MappedIndex.get_stat_key(os.stat(filename))
+                except OSError:
+                    continue
+
+                if (type(old_source) == type(source) and
+                    old_source.stat_key == source.stat_key):
+                    source = old_source
+
+                source.index_filter = IndexFilter.load_for_index(filename)
+
+            elif type(old_source) == type(source):
+                source = old_source
+
+            yield name, source
+
+    def _may_contain(self, source, params):
+        # filter loaded when the directory was last reloaded
+        if not isinstance(source, FileIndexSource):
+            return True
+
+        index_filter = source.index_filter
+        return not index_filter or index_filter.may_contain(params)
 
 
 #=============================================================================
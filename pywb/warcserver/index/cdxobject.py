@@ -3,6 +3,11 @@ try:  # pragma: no cover
 except ImportError:  # pragma: no cover
     from ordereddict import OrderedDict
 
+try:  # pragma: no cover
+    from collections.abc import MutableMapping
+except ImportError:  # pragma: no cover
+    from collections import MutableMapping
+
 import six
 from six.moves import zip
 
@@ -42,10 +47,20 @@ class CDXException(WbException):
 
 
 #=================================================================
-class CDXObject(OrderedDict):
+class CDXObject(MutableMapping):
     """
-    dictionary object representing parsed CDX line.
+    dictionary-like object representing parsed CDX line.
+
+    Only the urlkey and timestamp are decoded when the object is created,
+    the remaining fields (the CDXJ json or the rest of the CDX line) are
+    decoded on first access. Fields set before then are kept in an overlay,
+    so that filtering and sorting by timestamp does not require decoding.
+    Until modified, the original line is reused when serializing.
     """
+    __slots__ = ('cdxline', '_urlkey', '_timestamp', '_tail', '_format',
+                 '_fields', '_extra', '_from_json',
+                 '_cached_json', '_formatter')
+
     CDX_FORMATS = [
         # Public CDX Format
         [URLKEY, TIMESTAMP, ORIGINAL, MIMETYPE, STATUSCODE,
@@ -79,6 +94,8 @@ class CDXObject(OrderedDict):
          ORIG_LENGTH, ORIG_OFFSET, ORIG_FILENAME],
     ]
 
+    # cdx formats by number of fields
+    CDX_FORMATS_BY_LEN = dict((len(fmt), fmt) for fmt in CDX_FORMATS)
 
     CDX_ALT_FIELDS = {
                   'u': ORIGINAL,
@@ -105,23 +122,63 @@ class CDXObject(OrderedDict):
     }
 
     def __init__(self, cdxline=b''):
-        OrderedDict.__init__(self)
-
         cdxline = cdxline.rstrip()
         self._from_json = False
         self._cached_json = None
+        self._formatter = None
+        self._extra = None
+        self._format = None
+        self._tail = None
+        self.cdxline = cdxline
 
         # Allows for filling the fields later or in a custom way
         if not cdxline:
-            self.cdxline = cdxline
+            self._urlkey = None
+            self._timestamp = None
+            self._fields = OrderedDict()
             return
 
-        fields = cdxline.split(b' ' , 2)
+        self._fields = None
+
+        first = cdxline.find(b' ')
+        second = cdxline.find(b' ', first + 1) if first >= 0 else -1
+
         # Check for CDX JSON
-        if fields[-1].startswith(b'{'):
-            self[URLKEY] = to_native_str(fields[0], 'utf-8')
-            self[TIMESTAMP] = to_native_str(fields[1], 'utf-8')
-            json_fields = self.json_decode(to_native_str(fields[-1], 'utf-8'))
+        if second >= 0 and cdxline[second + 1:second + 2] == b'{':
+            self._from_json = True
+
+        else:
+            if second < 0:
+                num_fields = cdxline.count(b' ') + 1
+            else:
+                num_fields = cdxline.count(b' ', second + 1) + 3
+
+            self._format = self.CDX_FORMATS_BY_LEN.get(num_fields)
+
+            if not self._format:
+                fields = cdxline.split(b' ')
+                msg = 'unknown {0}-field cdx format: {1}'.format(len(fields), fields)
+                raise CDXException(msg)
+
+        self._urlkey = to_native_str(cdxline[:first], 'utf-8')
+        self._timestamp = to_native_str(cdxline[first + 1:second], 'utf-8')
+
+        # zero-copy view of the undecoded remainder of the line
+        self._tail = memoryview(cdxline)[second + 1:]
+
+    def _decode(self):
+        fields = self._fields
+        if fields is not None:
+            return fields
+
+        fields = OrderedDict()
+        fields[URLKEY] = self._urlkey
+        fields[TIMESTAMP] = self._timestamp
+
+        tail = to_native_str(self._tail.tobytes(), 'utf-8')
+
+        if self._from_json:
+            json_fields = self.json_decode(tail)
             for n, v in six.iteritems(json_fields):
                 n = to_native_str(n, 'utf-8')
                 n = self.CDX_ALT_FIELDS.get(n, n)
@@ -135,31 +192,45 @@ class CDXObject(OrderedDict):
                 if n != 'filename':
                     v = to_native_str(v, 'utf-8') or v
 
-                self[n] = v
+                fields[n] = v
 
-            self.cdxline = cdxline
-            self._from_json = True
-            return
+        else:
+            for header, field in zip(self._format[2:], tail.split(' ')):
+                fields[header] = field
 
-        more_fields = fields.pop().split(b' ')
-        fields.extend(more_fields)
+        # apply any fields set before decoding
+        if self._extra:
+            fields.update(self._extra)
+            self._extra = None
 
-        cdxformat = None
-        for i in self.CDX_FORMATS:
-            if len(i) == len(fields):
-                cdxformat = i
+        self._fields = fields
+        self._tail = None
+        return fields
 
-        if not cdxformat:
-            msg = 'unknown {0}-field cdx format: {1}'.format(len(fields), fields)
-            raise CDXException(msg)
+    def __getitem__(self, key):
+        fields = self._fields
+        if fields is None:
+            if key == URLKEY:
+                return self._urlkey
 
-        for header, field in zip(cdxformat, fields):
-            self[header] = to_native_str(field, 'utf-8')
+            if key == TIMESTAMP:
+                return self._timestamp
 
-        self.cdxline = cdxline
+            if self._extra and key in self._extra:
+                return self._extra[key]
+
+            fields = self._decode()
+
+        return fields[key]
 
     def __setitem__(self, key, value):
-        OrderedDict.__setitem__(self, key, value)
+        if self._fields is None and key != URLKEY and key != TIMESTAMP:
+            if self._extra is None:
+                self._extra = OrderedDict()
+
+            self._extra[key] = value
+        else:
+            self._decode()[key] = value
 
         # force regen on next __str__ call
         self.cdxline = None
@@ -167,6 +238,58 @@ class CDXObject(OrderedDict):
         # force regen on next to_json() call
         self._cached_json = None
 
+    def __delitem__(self, key):
+        del self._decode()[key]
+        self.cdxline = None
+        self._cached_json = None
+
+    def __iter__(self):
+        return iter(self._decode())
+
+    def __len__(self):
+        return len(self._decode())
+
+    def keys(self):
+        return self._decode().keys()
+
+    def values(self):
+        return self._decode().values()
+
+    def items(self):
+        return self._decode().items()
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(self.__class__.__name__, list(self.items()))
+
+    def line_view(self):
+        """return a zero-copy ``memoryview`` of the original cdx line,
+        or ``None`` if the object has been modified or was not created
+        from a line.
+        """
+        if self.cdxline:
+            return memoryview(self.cdxline)
+
+    def to_compact(self):
+        """return a compact, immutable form of this object,
+        which :meth:`from_compact` turns back into an equal object.
+        """
+        if self.cdxline:
+            return bytes(self.cdxline)
+
+        return (self._from_json, tuple(self.items()))
+
+    @classmethod
+    def from_compact(cls, data):
+        if isinstance(data, bytes):
+            return cls(data)
+
+        cdx = cls()
+        cdx._from_json, items = data
+        for name, value in items:
+            cdx[name] = value
+
+        return cdx
+
     def is_revisit(self):
         """return ``True`` if this record is a revisit record."""
         return (self.get(MIMETYPE) == 'warc/revisit' or
@@ -222,32 +345,44 @@ class CDXObject(OrderedDict):
         if not self._from_json:
             return ' '.join(str(val) for val in six.itervalues(self))
         else:
-            return json_encode(self)
+            return json_encode(self._decode())
 
     def to_cdxj(self, fields=None):
         prefix = self['urlkey'] + ' ' + self['timestamp'] + ' '
         dupe = OrderedDict(list(self.items())[2:])
         return prefix + self.conv_to_json(dupe, fields)
 
-    def __lt__(self, other):
+    def _get_cached_json(self):
         if not self._cached_json:
             self._cached_json = self.to_json()
 
-        if not other._cached_json:
-            other._cached_json = other.to_json()
+        return self._cached_json
 
-        res = self._cached_json < other._cached_json
-        return res
+    def _compare_key(self):
+        return (self.get(URLKEY, ''), self.get(TIMESTAMP, ''))
+
+    def __lt__(self, other):
+        # compare by urlkey and timestamp first, to avoid decoding all fields
+        key = self._compare_key()
+        other_key = other._compare_key()
+        if key != other_key:
+            return key < other_key
+
+        return self._get_cached_json() < other._get_cached_json()
 
     def __le__(self, other):
-        if not self._cached_json:
-            self._cached_json = self.to_json()
+        key = self._compare_key()
+        other_key = other._compare_key()
+        if key != other_key:
+            return key < other_key
+
+        return self._get_cached_json() <= other._get_cached_json()
 
-        if not other._cached_json:
-            other._cached_json = other.to_json()
+    def __gt__(self, other):
+        return other < self
 
-        res = (self._cached_json <= other._cached_json)
-        return res
+    def __ge__(self, other):
+        return other <= self
 
     @classmethod
     def json_decode(cls, string):
@@ -255,14 +390,19 @@ class CDXObject(OrderedDict):
 
 
 #=================================================================
-class IDXObject(OrderedDict):
+class IDXObject(MutableMapping):
+    """
+    dictionary-like object representing a parsed ZipNum summary (IDX) line,
+    with the fields stored in a fixed-size list.
+    """
+    __slots__ = ('idxline', '_values', '_extra')
 
     FORMAT = ['urlkey', 'part', 'offset', 'length', 'lineno']
     NUM_REQ_FIELDS = len(FORMAT) - 1  # lineno is an optional field
 
-    def __init__(self, idxline):
-        OrderedDict.__init__(self)
+    FIELD_INDEX = dict((name, i) for i, name in enumerate(FORMAT))
 
+    def __init__(self, idxline):
         idxline = idxline.rstrip()
         fields = idxline.split(b'\t')
 
@@ -270,17 +410,59 @@ class IDXObject(OrderedDict):
             msg = 'invalid idx format: {0} fields found, {1} required'
             raise CDXException(msg.format(len(fields), self.NUM_REQ_FIELDS))
 
-        for header, field in zip(self.FORMAT, fields):
-            self[header] = to_native_str(field, 'utf-8')
+        values = [to_native_str(field, 'utf-8') for field in fields[:len(self.FORMAT)]]
 
-        self['offset'] = int(self['offset'])
-        self['length'] = int(self['length'])
-        lineno = self.get('lineno')
-        if lineno:
-            self['lineno'] = int(lineno)
+        values[2] = int(values[2])
+        values[3] = int(values[3])
+        if len(values) > 4:
+            if values[4]:
+                values[4] = int(values[4])
 
+        self._values = values
+        self._extra = None
         self.idxline = idxline
 
+    def __getitem__(self, key):
+        i = self.FIELD_INDEX.get(key)
+        if i is not None and i < len(self._values):
+            return self._values[i]
+
+        if self._extra:
+            return self._extra[key]
+
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        i = self.FIELD_INDEX.get(key)
+        if i is not None and i < len(self._values):
+            self._values[i] = value
+            return
+
+        if self._extra is None:
+            self._extra = OrderedDict()
+
+        self._extra[key] = value
+
+    def __delitem__(self, key):
+        if not self._extra or key not in self._extra:
+            raise KeyError(key)
+
+        del self._extra[key]
+
+    def __iter__(self):
+        for name in self.FORMAT[:len(self._values)]:
+            yield name
+
+        if self._extra:
+            for name in self._extra:
+                yield name
+
+    def __len__(self):
+        return len(self._values) + (len(self._extra) if self._extra else 0)
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(self.__class__.__name__, list(self.items()))
+
     def to_text(self, fields=None):
         """
         return plaintext IDX record (including newline).
@@ -290,7 +472,7 @@ class IDXObject(OrderedDict):
         return str(self) + '\n'
 
     def to_json(self, fields=None):
-        return json_encode(self) + '\n'
+        return json_encode(OrderedDict(self.items())) + '\n'
 
     def __str__(self):
         return to_native_str(self.idxline, 'utf-8')
@@ -1,8 +1,12 @@
 from pywb.warcserver.index.cdxobject import CDXObject, IDXObject
-from pywb.warcserver.index.cdxobject import TIMESTAMP, STATUSCODE, MIMETYPE, DIGEST
+from pywb.warcserver.index.cdxobject import URLKEY, TIMESTAMP, ORIGINAL
+from pywb.warcserver.index.cdxobject import STATUSCODE, MIMETYPE, DIGEST
 from pywb.warcserver.index.cdxobject import OFFSET, LENGTH, FILENAME
 
 from pywb.warcserver.index.query import CDXQuery
+from pywb.utils.format import to_bool
+
+from warcio.utils import to_native_str
 
 from warcio.timeutils import timestamp_to_sec, pad_timestamp
 from warcio.timeutils import PAD_14_DOWN, PAD_14_UP
@@ -31,6 +35,10 @@ def cdx_load(sources, query, process=True):
     if query.page_count:
         return cdx_iter
 
+    # merged into a single stream, so lines may also be collapsed
+    if process and not query.secondary_index_only:
+        cdx_iter = process_cdx_lines(cdx_iter, query.params, collapse=True)
+
     cdx_iter = make_obj_iter(cdx_iter, query)
 
     if process and not query.secondary_index_only:
@@ -92,6 +100,165 @@ def process_cdx(cdx_iter, query):
     return cdx_iter
 
 
+#=================================================================
+def process_cdx_lines(line_iter, params, collapse=False):
+    """
+    apply the filter, clamp and (optionally) collapse ops to raw cdx lines,
+    before any CDXObjects are created.
+
+    A line is only dropped if :func:`process_cdx` would also drop it,
+    lines which can not be checked without decoding are passed through.
+    :func:`process_cdx` should still be applied to the resulting objects.
+
+    :param collapse: bool, the lines are the complete, merged result and
+        may be collapsed here as well.
+    """
+    # revisit resolution needs all the records, unmodified
+    if to_bool(params.get('resolveRevisits')):
+        return line_iter
+
+    filters = params.get('filter')
+    if isinstance(filters, str):
+        filters = [filters]
+
+    filters = [CDXLineFilter(filter_str) for filter_str in filters or []]
+
+    from_ts = params.get('from') or params.get('from_ts')
+    if from_ts:
+        from_ts = pad_timestamp(from_ts, PAD_14_DOWN).encode('utf-8')
+
+    to_ts = params.get('to')
+    if to_ts:
+        to_ts = pad_timestamp(to_ts, PAD_14_UP).encode('utf-8')
+
+    collapse_time = params.get('collapseTime') if collapse else None
+
+    if not filters and not from_ts and not to_ts and not collapse_time:
+        return line_iter
+
+    return _iter_cdx_lines(line_iter, filters, from_ts, to_ts, collapse_time)
+
+
+def _iter_cdx_lines(line_iter, filters, from_ts, to_ts, collapse_time):
+    timelen = int(collapse_time) if collapse_time else 0
+    last_token = None
+
+    for line in line_iter:
+        first = line.find(b' ')
+        second = line.find(b' ', first + 1)
+
+        # invalid line, leave it to CDXObject
+        if first < 0 or second < 0:
+            yield line
+            continue
+
+        timestamp = line[first + 1:second]
+
+        if from_ts and timestamp < from_ts:
+            continue
+
+        if to_ts and timestamp > to_ts:
+            continue
+
+        exact = True
+        matched = True
+        for line_filter in filters:
+            res = line_filter.match_line(line)
+            if res is None:
+                exact = False
+            elif not res:
+                matched = False
+                break
+
+        if not matched:
+            continue
+
+        if timelen:
+            status = cdx_line_field(line, STATUSCODE) if exact else None
+
+            # once a line can't be checked exactly, leave collapsing
+            # of the remaining lines to cdx_collapse_time_status()
+            if status is None:
+                timelen = 0
+            else:
+                curr_token = (timestamp[:timelen], status)
+                if curr_token == last_token:
+                    continue
+
+                last_token = curr_token
+
+        yield line
+
+
+#=================================================================
+# all fields which are stored in the cdx line itself
+CDX_LINE_FIELDS = frozenset(field for fmt in CDXObject.CDX_FORMATS
+                            for field in fmt)
+
+CDXJ_FIELD_RX = {}
+
+
+def _cdxj_field_rx(field):
+    rx = CDXJ_FIELD_RX.get(field)
+    if not rx:
+        names = [field] + [alt for alt, name in CDXObject.CDX_ALT_FIELDS.items()
+                           if name == field]
+
+        names = b'|'.join(re.escape(name.encode('utf-8')) for name in names)
+        rx = re.compile(b'"(?:' + names + br')"\s*:\s*("[^"\\]*"|.)')
+        CDXJ_FIELD_RX[field] = rx
+
+    return rx
+
+
+def cdx_line_field(line, field):
+    """
+    return the value of ``field`` in a raw cdx or cdxj line as it would
+    be returned by ``str(cdx.get(field, ''))``, or ``None`` if it can not
+    be determined without decoding the line.
+    """
+    first = line.find(b' ')
+    second = line.find(b' ', first + 1)
+
+    # cdxj
+    if line[second + 1:second + 2] == b'{':
+        matches = _cdxj_field_rx(field).findall(line, second + 1)
+
+        if not matches:
+            if field == URLKEY:
+                return to_native_str(line[:first], 'utf-8')
+            elif field == TIMESTAMP:
+                return to_native_str(line[first + 1:second], 'utf-8')
+
+            return '' if field in CDX_LINE_FIELDS else None
+
+        # set more than once, or not a simple string value
+        value = matches[0]
+        if len(matches) > 1 or field in (URLKEY, TIMESTAMP) or len(value) < 2:
+            return None
+
+        value = value[1:-1]
+
+        # non-ascii urls are %-encoded when decoded
+        if field == ORIGINAL:
+            try:
+                return value.decode('ascii')
+            except UnicodeDecodeError:
+                return None
+
+        return to_native_str(value, 'utf-8')
+
+    parts = line.rstrip().split(b' ')
+    fmt = CDXObject.CDX_FORMATS_BY_LEN.get(len(parts))
+    if not fmt:
+        return None
+
+    try:
+        return to_native_str(parts[fmt.index(field)], 'utf-8')
+    except ValueError:
+        return '' if field in CDX_LINE_FIELDS else None
+
+
 #=================================================================
 def create_merged_cdx_gen(sources, query):
     """
@@ -215,6 +382,24 @@ class CDXFilter(object):
         return res is not None
 
 
+#=================================================================
+class CDXLineFilter(CDXFilter):
+    def match_line(self, line):
+        """
+        apply the filter to a raw cdx line, return ``None`` if the
+        line can not be checked without creating a CDXObject.
+        """
+        # str(cdx) may differ from the line, eg. once a source is added
+        if not self.field:
+            return None
+
+        val = cdx_line_field(line, self.field)
+        if val is None:
+            return None
+
+        return self.compare_func(val) ^ self.invert
+
+
 #=================================================================
 def cdx_filter(cdx_iter, filter_strings):
     """
@@ -306,6 +491,43 @@ def cdx_sort_closest(closest, cdx_iter, limit=10):
     #    yield cdx
 
 
+#=================================================================
+def cdx_lines_closest_window(line_iter, closest_sec, limit):
+    """
+    yield only the raw lines which may be among the 'limit' lines closest
+    to 'closest_sec', from the ascending lines of a single urlkey.
+
+    Stops reading after the 'limit' lines at or after 'closest_sec'.
+    Earlier lines are kept until at least 'limit' later lines are found,
+    including lines with the same timestamp, which are ahead of later lines
+    with the same distance in :func:`cdx_sort_closest`
+    """
+    before = deque()
+    after = 0
+
+    for line in line_iter:
+        sec = timestamp_to_sec(to_native_str(line.split(b' ', 2)[1]))
+
+        if sec < closest_sec:
+            before.append((sec, line))
+            while len(before) > limit and before[-limit][0] > before[0][0]:
+                before.popleft()
+
+            continue
+
+        while before:
+            yield before.popleft()[1]
+
+        if after == limit:
+            break
+
+        after += 1
+        yield line
+
+    for sec, line in before:
+        yield line
+
+
 #=================================================================
 # resolve revisits
 
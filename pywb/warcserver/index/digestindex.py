@@ -0,0 +1,90 @@
+from pywb.utils.binsearch import MappedIndex, iter_exact
+from pywb.utils.io import atomic_write
+from pywb.warcserver.index.cdxobject import CDXObject, CDXException
+
+
+# ============================================================================
+class DigestIndex(object):
+    """ Sidecar index of the payload digests of a cdx index file, stored
+    next to it as <index>.digests, used to find the original capture
+    for a revisit record without another index query.
+
+    Each line maps a digest to the location of the first non-revisit
+    capture with that payload: 'digest filename offset length',
+    sorted by digest.
+    """
+    EXT = '.digests'
+
+    @classmethod
+    def build(cls, index_filename):
+        """ return the sorted lines of the digest index for a cdx index file
+        """
+        origs = {}
+
+        with open(index_filename, 'rb') as fh:
+            for line in fh:
+                # skip cdx header
+                if line.startswith(b' CDX'):
+                    continue
+
+                try:
+                    cdx = CDXObject(line.rstrip())
+                except CDXException:
+                    continue
+
+                digest = cdx.get('digest', '-')
+                if digest == '-' or digest in origs:
+                    continue
+
+                if cdx.get('mime') == 'warc/revisit':
+                    continue
+
+                filename = cdx.get('filename', '-')
+                offset = cdx.get('offset', '-')
+                length = cdx.get('length', '-')
+
+                if filename == '-' or offset == '-' or ' ' in filename:
+                    continue
+
+                origs[digest] = ' '.join((digest, filename, offset, length))
+
+        return sorted(line.encode('utf-8') + b'\n' for line in origs.values())
+
+    @classmethod
+    def write_for_index(cls, index_filename):
+        """ build and write the digest index for an index file,
+        return the digest index filename
+        """
+        lines = cls.build(index_filename)
+        digest_filename = index_filename + cls.EXT
+
+        with atomic_write(digest_filename) as fh:
+            fh.writelines(lines)
+
+        return digest_filename
+
+    @classmethod
+    def lookup(cls, index_filename, digest):
+        """ return a cdx with the filename, offset and length of the
+        original capture for digest, or None if not found or
+        the index file has no digest index
+        """
+        try:
+            mapped = MappedIndex.load(index_filename + cls.EXT)
+        except (IOError, OSError):
+            return None
+
+        with mapped.reader() as reader:
+            for line in iter_exact(reader, digest.encode('utf-8')):
+                parts = line.rstrip().decode('utf-8').split(' ')
+                if len(parts) != 4:
+                    continue
+
+                cdx = CDXObject()
+                cdx['digest'] = parts[0]
+                cdx['filename'] = parts[1]
+                cdx['offset'] = parts[2]
+                cdx['length'] = parts[3]
+                return cdx
+
+        return None
@@ -0,0 +1,295 @@
+import ctypes
+import ctypes.util
+import glob
+import logging
+import os
+import struct
+import weakref
+
+import gevent
+from gevent.monkey import get_original
+from gevent.select import select
+
+from pywb.utils.binsearch import MappedIndex
+
+
+logger = logging.getLogger(__name__)
+
+# the thread id, even if the thread module is patched by gevent
+get_thread_ident = get_original('_thread', 'get_ident')
+
+
+# ============================================================================
+class INotify(object):
+    """ Minimal inotify wrapper, only reporting which watched
+    directories had entries created, removed or renamed, or
+    optionally modified
+    """
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+
+    WATCH_MASK = (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO |
+                  IN_DELETE_SELF | IN_MOVE_SELF)
+
+    EVENT_HEADER = struct.Struct('iIII')
+
+    _libc = None
+
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+
+    @classmethod
+    def create(cls):
+        """ return a new INotify, or None if inotify is not available
+        """
+        try:
+            if not cls._libc:
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                                   use_errno=True)
+                # not available on all platforms
+                libc.inotify_init1
+                libc.inotify_add_watch
+                cls._libc = libc
+
+            fd = cls._libc.inotify_init1(cls.IN_NONBLOCK | cls.IN_CLOEXEC)
+        except Exception:
+            return None
+
+        if fd < 0:
+            return None
+
+        return cls(cls._libc, fd)
+
+    def add_watch(self, path, mask=None):
+        """ return watch descriptor for path, or None if it can not be watched
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path),
+                                         mask or self.WATCH_MASK)
+        if wd < 0:
+            return None
+
+        return wd
+
+    def wait(self, timeout):
+        """ wait until events are available or timeout expires
+        """
+        select([self.fd], [], [], timeout)
+
+    def read_events(self):
+        """ yield (wd, mask) for all pending events, without blocking
+        """
+        while True:
+            try:
+                buff = os.read(self.fd, 65536)
+            except (IOError, OSError):
+                return
+
+            if not buff:
+                return
+
+            offset = 0
+            while offset + self.EVENT_HEADER.size <= len(buff):
+                wd, mask, cookie, length = self.EVENT_HEADER.unpack_from(buff, offset)
+                offset += self.EVENT_HEADER.size + length
+                yield wd, mask
+
+    def close(self):
+        os.close(self.fd)
+
+
+# ============================================================================
+class DirWatcher(object):
+    """ Keeps the list of index files in a set of (possibly glob)
+    directory paths up to date in the background.
+
+    Requests read an immutable snapshot of the files for a path with
+    no filesystem access. Only the first request for a path lists the
+    directories directly, after which the background greenlet updates
+    the snapshot when inotify reports a change to a directory, or
+    when a directory mtime changes if it can not be watched. Glob
+    paths are expanded again every 'interval' seconds, or when
+    :meth:`notify_changed` is called.
+
+    'load_dir' is called as load_dir(the_dir, old_files) and returns
+    the list of (name, source) for the directory.
+    """
+    DEFAULT_INTERVAL = 2.0
+
+    # started watchers, reloaded by notify_changed()
+    _watchers = weakref.WeakSet()
+
+    def __init__(self, load_dir, interval=None, use_inotify=True):
+        self.load_dir = load_dir
+        self.interval = interval or self.DEFAULT_INTERVAL
+
+        self.inotify = INotify.create() if use_inotify else None
+
+        # glob path -> tuple of (name, source)
+        self.globs = {}
+
+        # dir -> (stat, tuple of (name, source))
+        self.dirs = {}
+
+        # dir -> wd, wd -> dir
+        self.watched = {}
+        self.watches = {}
+
+        self.changed = set()
+
+        self.keep_running = True
+        self.ge = None
+
+        # wakes the background greenlet from other threads
+        self.reload_async = None
+        self.thread_ident = None
+
+    @classmethod
+    def notify_changed(cls):
+        """ reload all watchers, for index files changed by this process,
+        eg. by the auto-indexer.
+
+        Watchers are reloaded before returning if called from the thread
+        running them, or else by their background greenlet as soon as
+        possible
+        """
+        for watcher in list(cls._watchers):
+            watcher.reload()
+
+    def reload(self):
+        if self.thread_ident == get_thread_ident():
+            self.check(reload_all=True)
+        elif self.reload_async:
+            self.reload_async.send()
+
+    def get_files(self, glob_dir):
+        files = self.globs.get(glob_dir)
+        if files is None:
+            files = self._update_glob(glob_dir)
+            self.start()
+
+        return files
+
+    def start(self):
+        if not self.ge:
+            self.thread_ident = get_thread_ident()
+            self.reload_async = gevent.get_hub().loop.async_()
+            self.reload_async.start(self._on_reload_async)
+
+            self.ge = gevent.spawn(self.run)
+            DirWatcher._watchers.add(self)
+
+    def stop(self):
+        self.keep_running = False
+        DirWatcher._watchers.discard(self)
+
+        if self.reload_async:
+            self.reload_async.close()
+            self.reload_async = None
+
+        if self.ge:
+            self.ge.kill(block=False)
+            self.ge = None
+
+    def _on_reload_async(self):
+        gevent.spawn(self._checked, True)
+
+    def _checked(self, reload_all=False):
+        try:
+            self.check(reload_all=reload_all)
+        except Exception:
+            logger.exception('Error checking index dirs')
+
+    def run(self):
+        while self.keep_running:
+            if self.inotify:
+                self.inotify.wait(self.interval)
+            else:
+                gevent.sleep(self.interval)
+
+            self._checked()
+
+    def check(self, reload_all=False):
+        """ update all snapshots for changed directories, or for all
+        directories if 'reload_all' is set, and re-expand all glob paths
+        """
+        changed = set(self.dirs) if reload_all else set()
+
+        if self.inotify:
+            for wd, mask in self.inotify.read_events():
+                the_dir = self.watches.get(wd)
+                if not the_dir:
+                    continue
+
+                changed.add(the_dir)
+
+                if mask & INotify.IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    self.watched.pop(the_dir, None)
+
+        for the_dir, (stat, files) in list(self.dirs.items()):
+            if the_dir not in self.watched and self._stat(the_dir) != stat:
+                changed.add(the_dir)
+
+        self.changed = changed
+        try:
+            for glob_dir in list(self.globs):
+                self._update_glob(glob_dir)
+        finally:
+            self.changed = set()
+
+        # close the mappings of removed or replaced index files
+        if changed:
+            MappedIndex.purge()
+
+    def _update_glob(self, glob_dir):
+        files = []
+        for the_dir in glob.glob(glob_dir):
+            files.extend(self._get_dir(the_dir))
+
+        files = tuple(files)
+        self.globs[glob_dir] = files
+        return files
+
+    def _get_dir(self, the_dir):
+        result = self.dirs.get(the_dir)
+        if result and the_dir not in self.changed:
+            return result[1]
+
+        old_files = result[1] if result else ()
+
+        # watch before listing, so that no change is missed
+        stat = self._stat(the_dir)
+        if stat and self.inotify and the_dir not in self.watched:
+            wd = self.inotify.add_watch(the_dir)
+            if wd is not None:
+                self.watched[the_dir] = wd
+                self.watches[wd] = the_dir
+
+        try:
+            files = tuple(self.load_dir(the_dir, old_files))
+        except (IOError, OSError):
+            files = ()
+
+        self.dirs[the_dir] = (stat, files)
+        return files
+
+    @staticmethod
+    def _stat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        return (stat.st_mtime, stat.st_size)
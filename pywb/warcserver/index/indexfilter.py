@@ -0,0 +1,220 @@
+import hashlib
+import json
+import math
+import os
+
+from pywb.utils.io import atomic_write
+
+
+# ============================================================================
+class BloomFilter(object):
+    """ A simple Bloom filter over byte string keys, using
+    double hashing of the md5 of each key to set 'hashes' bits
+    """
+    def __init__(self, num_bits, num_hashes, bits=None):
+        self.num_bits = max(num_bits, 8)
+        self.num_hashes = num_hashes
+        self.bits = bits or bytearray((self.num_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        num_bits = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        num_hashes = max(int(round(num_bits / float(capacity) * math.log(2))), 1)
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, key):
+        digest = hashlib.md5(key).hexdigest()
+        h1 = int(digest[:16], 16)
+        h2 = int(digest[16:], 16) | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self._positions(key))
+
+
+# ============================================================================
+class IndexFilter(object):
+    """ Summary of a sorted cdx/cdxj index file, stored next to it
+    as <index>.bloom, used to skip index files which can not contain
+    any results for a query.
+
+    The summary holds the lowest and highest urlkeys in the file
+    and a Bloom filter of all urlkeys and hosts. It is only
+    used while the size and mtime of the index file are unchanged.
+    """
+    EXT = '.bloom'
+
+    HOST_PREFIX = b'host:'
+
+    _filters = {}
+
+    def __init__(self, min_key, max_key, bloom, index_size=0, index_mtime=0):
+        self.min_key = min_key
+        self.max_key = max_key
+        self.bloom = bloom
+        self.index_size = index_size
+        self.index_mtime = index_mtime
+
+    @classmethod
+    def get_host(cls, key):
+        """ return the surt host of a key, including the closing paren,
+        or None if the key does not include a full host
+        """
+        end = key.find(b')')
+        if end < 0:
+            return None
+
+        return key[:end + 1]
+
+    def may_contain(self, params):
+        """ return False if the index file can not contain any lines
+        in the key range of the query
+        """
+        key = params.get('key')
+        end_key = params.get('end_key')
+        if key is None or end_key is None:
+            return True
+
+        # all lines are >= min_key and < max_key + '!', as ' ' < '!'
+        if self.min_key and end_key <= self.min_key:
+            return False
+
+        if self.max_key and key >= self.max_key + b'!':
+            return False
+
+        match_type = params.get('matchType')
+        if match_type == 'exact':
+            return key in self.bloom
+
+        if match_type in ('prefix', 'host'):
+            host = self.get_host(key)
+            if host:
+                return self.HOST_PREFIX + host in self.bloom
+
+        return True
+
+    @classmethod
+    def build(cls, index_filename, error_rate=0.01):
+        """ scan a cdx index file and return a new IndexFilter for it
+        """
+        def iter_keys(fh):
+            last_key = None
+            for line in fh:
+                # skip cdx header
+                if line.startswith(b' CDX'):
+                    continue
+
+                key = line.rstrip().split(b' ', 1)[0]
+                if key != last_key:
+                    last_key = key
+                    yield key
+
+        count = 0
+        with open(index_filename, 'rb') as fh:
+            for _ in iter_keys(fh):
+                count += 1
+
+        # each key may add its host as well
+        bloom = BloomFilter.for_capacity(count * 2, error_rate)
+
+        min_key = None
+        max_key = None
+        last_host = None
+
+        with open(index_filename, 'rb') as fh:
+            for key in iter_keys(fh):
+                if min_key is None or key < min_key:
+                    min_key = key
+
+                if max_key is None or key > max_key:
+                    max_key = key
+
+                bloom.add(key)
+
+                host = cls.get_host(key)
+                if host and host != last_host:
+                    bloom.add(cls.HOST_PREFIX + host)
+                    last_host = host
+
+            stat = os.fstat(fh.fileno())
+
+        return cls(min_key or b'', max_key or b'', bloom,
+                   stat.st_size, stat.st_mtime)
+
+    @classmethod
+    def write_for_index(cls, index_filename, error_rate=0.01):
+        """ build and write the filter file for an index file,
+        return the filter filename
+        """
+        index_filter = cls.build(index_filename, error_rate)
+        filter_filename = index_filename + cls.EXT
+
+        header = {'min': index_filter.min_key.decode('latin-1'),
+                  'max': index_filter.max_key.decode('latin-1'),
+                  'bits': index_filter.bloom.num_bits,
+                  'hashes': index_filter.bloom.num_hashes,
+                  'size': index_filter.index_size,
+                  'mtime': index_filter.index_mtime}
+
+        with atomic_write(filter_filename) as fh:
+            fh.write(json.dumps(header).encode('utf-8') + b'\n')
+            fh.write(index_filter.bloom.bits)
+
+        return filter_filename
+
+    @classmethod
+    def read(cls, filter_filename):
+        with open(filter_filename, 'rb') as fh:
+            header = json.loads(fh.readline().decode('utf-8'))
+            bits = bytearray(fh.read())
+
+        bloom = BloomFilter(header['bits'], header['hashes'], bits)
+        return cls(header['min'].encode('latin-1'),
+                   header['max'].encode('latin-1'),
+                   bloom,
+                   header['size'],
+                   header['mtime'])
+
+    @classmethod
+    def load_for_index(cls, index_filename):
+        """ return the IndexFilter for an index file, or None if there
+        is no filter file or it is out of date
+        """
+        filter_filename = index_filename + cls.EXT
+        try:
+            filter_mtime = os.path.getmtime(filter_filename)
+        except OSError:
+            cls._filters.pop(index_filename, None)
+            return None
+
+        cached = cls._filters.get(index_filename)
+        if not cached or cached[0] != filter_mtime:
+            try:
+                cached = (filter_mtime, cls.read(filter_filename))
+            except Exception:
+                cached = (filter_mtime, None)
+
+            cls._filters[index_filename] = cached
+
+        index_filter = cached[1]
+        if not index_filter:
+            return None
+
+        try:
+            stat = os.stat(index_filename)
+        except OSError:
+            return None
+
+        if (stat.st_size != index_filter.index_size or
+            stat.st_mtime != index_filter.index_mtime):
+            return None
+
+        return index_filter
@@ -1,7 +1,10 @@
 from six.moves.urllib.parse import quote_plus
 from warcio.timeutils import PAD_14_DOWN, http_date_to_timestamp, pad_timestamp, timestamp_now, timestamp_to_http_date
+from warcio.timeutils import sec_to_timestamp
 
-from pywb.utils.binsearch import iter_range
+from collections import deque
+
+from pywb.utils.binsearch import MappedIndex, iter_range
 from pywb.utils.canonicalize import canonicalize
 from pywb.utils.format import res_template
 from pywb.utils.io import no_except_close
@@ -9,7 +12,9 @@ from pywb.utils.memento import MementoUtils
 from pywb.utils.wbexception import BadRequestException, NotFoundException
 from pywb.warcserver.http import DefaultAdapters
 from pywb.warcserver.index.cdxobject import CDXObject
-from pywb.warcserver.index.cdxops import cdx_sort_closest
+from pywb.warcserver.index.cdxops import cdx_sort_closest, process_cdx_lines
+from pywb.warcserver.index.cdxops import cdx_lines_closest_window
+from pywb.warcserver.index.query import CDXQuery
 
 try:
     from lxml import etree
@@ -52,13 +57,23 @@ class BaseIndexSource(object):
 class FileIndexSource(BaseIndexSource):
     CDX_EXT = ('.cdx', '.cdxj')
 
+    # keep index files mapped in memory between lookups
+    USE_MMAP = True
+
     def __init__(self, filename, config=None):
         self.filename_template = filename
 
+        # stat key of the file when last checked, if kept up to date
+        # by a DirWatcher, see MappedIndex.load()
+        self.stat_key = None
+
     def _do_open(self, filename):
         try:
+            if self.USE_MMAP:
+                return MappedIndex.load(filename, self.stat_key).reader()
+
             return open(filename, 'rb')
-        except IOError:
+        except (IOError, OSError):
             raise NotFoundException(filename)
 
     def load_index(self, params):
@@ -66,17 +81,58 @@ class FileIndexSource(BaseIndexSource):
 
         fh = self._do_open(filename)
 
+        collapse = params.get('_collapse_lines', False)
+
         def do_iter():
             with fh:
-                for obj in self._do_iter(fh, params):
+                for obj in self._do_iter(fh, params, collapse):
                     yield obj
 
         return do_iter()
 
-    def _do_iter(self, fh, params):
-        for line in iter_range(fh, params['key'], params['end_key']):
+    def _do_iter(self, fh, params, collapse=False):
+        query = params.get('_query') or CDXQuery(params)
+
+        key, end_key = query.search_range
+
+        window = query.closest_window
+        if window:
+            key = self._closest_start(fh, query.key, key, end_key, window)
+
+        line_iter = iter_range(fh, key, end_key)
+
+        if window:
+            line_iter = cdx_lines_closest_window(line_iter, *window)
+
+        line_iter = process_cdx_lines(line_iter, params, collapse=collapse)
+
+        for line in line_iter:
             yield CDXObject(line)
 
+    def _closest_start(self, fh, urlkey, start, end, window):
+        """ return the key from which to read the lines closest to the
+        window timestamp, skipping all but the last 'limit' earlier lines
+        (and any lines with the same timestamp as the first of them)
+        """
+        closest_sec, limit = window
+        point = urlkey + b' ' + sec_to_timestamp(closest_sec).encode('utf-8')
+        point = min(point, end)
+        if point <= start:
+            return start
+
+        before = deque(maxlen=limit)
+        for line in iter_range(fh, point, end, prev_size=limit):
+            if line >= point:
+                break
+
+            if line >= start:
+                before.append(line)
+
+        if len(before) < limit:
+            return start
+
+        return max(start, urlkey + b' ' + before[0].split(b' ', 2)[1])
+
     def __repr__(self):
         return '{0}(file://{1})'.format(self.__class__.__name__,
                                         self.filename_template)
@@ -3,9 +3,15 @@ from pywb.warcserver.index.cdxobject import CDXException
 from pywb.utils.canonicalize import calc_search_range
 from pywb.utils.format import to_bool
 
+from warcio.timeutils import pad_timestamp, timestamp_to_sec
+from warcio.timeutils import PAD_14_DOWN, PAD_14_UP
+
 
 #=================================================================
 class CDXQuery(object):
+    # max limit for which index sources only read the lines near 'closest'
+    MAX_CLOSEST_WINDOW = 1000
+
     def __init__(self, params):
         self.params = params
         alt_url = self.params.get('alt_url')
@@ -38,6 +44,49 @@ class CDXQuery(object):
     def end_key(self):
         return self.params['end_key']
 
+    @property
+    def search_range(self):
+        """ (key, end_key) range of index lines to read for the query.
+
+        Lines are sorted by urlkey then timestamp, so for exact match
+        queries the range is narrowed to the from/to timestamps, unless
+        all captures are needed to resolve revisits or the query is paged
+        """
+        key = self.key
+        end_key = self.end_key
+
+        if (not self.is_exact or self.resolve_revisits or self.page_count or
+            self.secondary_index_only or 'page' in self.params):
+            return key, end_key
+
+        if self.from_ts:
+            from_ts = pad_timestamp(self.from_ts, PAD_14_DOWN)
+            key = self.key + b' ' + from_ts.encode('utf-8')
+
+        if self.to_ts:
+            to_ts = pad_timestamp(self.to_ts, PAD_14_UP)
+            end_key = self.key + b' ' + to_ts.encode('utf-8') + b'!'
+
+        return key, end_key
+
+    @property
+    def closest_window(self):
+        """ (closest_sec, limit) if each index source needs to return only
+        the 'limit' lines closest to 'closest' of its (exact match) lines,
+        or None if all lines in the search range are needed
+        """
+        closest = self.closest
+        if (not closest or not closest.isdigit() or not self.is_exact or
+            'limit' not in self.params):
+            return None
+
+        if (self.limit > self.MAX_CLOSEST_WINDOW or self.filters or
+            self.collapse_time or self.resolve_revisits or self.page_count or
+            self.secondary_index_only or 'page' in self.params):
+            return None
+
+        return timestamp_to_sec(closest), self.limit
+
     def set_key(self, key, end_key):
         self.params['key'] = key
         self.params['end_key'] = end_key
@@ -0,0 +1,163 @@
+import os
+import time
+
+import six
+
+from pywb.utils.lrucache import LRUCache
+from pywb.warcserver.index.cdxobject import CDXObject
+
+
+# ============================================================================
+class CDXResultCache(object):
+    """ LRU cache of processed index query results, shared by the
+    aggregators of a warcserver and bounded by total size in bytes.
+
+    While a query is loaded, the index sources it uses are recorded
+    in ``params['_cache_deps']``. Results are only cached if the query
+    completed without errors and used no live index. A cached result
+    is dropped once the mtime or size of any index file or directory
+    it used changes, or after 'ttl' seconds if it also used a remote
+    index or a wildcard directory.
+    """
+    DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+    DEFAULT_TTL = 60
+
+    # per entry overhead, in bytes
+    ENTRY_SIZE = 256
+
+    # dependency types
+    FILE = 'file'
+    REMOTE = 'remote'
+    LIVE = 'live'
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size or self.DEFAULT_MAX_SIZE
+        self.max_entry_size = self.max_size // 8
+        self.ttl = ttl if ttl is not None else self.DEFAULT_TTL
+        self.entries = LRUCache(self.max_size, sizeof=lambda entry: entry[4],
+                                max_entry_size=self.max_entry_size)
+
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def init_from_config(cls, config):
+        if not config:
+            return None
+
+        if not isinstance(config, dict):
+            config = {}
+
+        return cls(config.get('max_size'), config.get('ttl'))
+
+    def make_key(self, agg, params):
+        """ key for a query to the given aggregator, from all params
+        which are not internal, or None if the query can't be cached
+        """
+        items = []
+        for name, value in six.iteritems(params):
+            if name.startswith('_'):
+                continue
+
+            if isinstance(value, list):
+                value = tuple(value)
+
+            items.append((name, value))
+
+        key = (id(agg), tuple(sorted(items)))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+
+        return key
+
+    def get(self, key):
+        """ return (cdx_iter, errs) for the query, or None if not cached
+        or no longer valid
+        """
+        entry = self.entries.pop(key)
+        if entry and self._is_valid(entry):
+            self.entries.put(key, entry)
+            self.hits += 1
+            results, errs = entry[0], entry[1]
+            return (CDXObject.from_compact(data) for data in results), dict(errs)
+
+        self.misses += 1
+        return None
+
+    def cache_results(self, key, cdx_iter, errs, deps):
+        """ wrap a query result, caching it if it is read to the end
+        """
+        if errs:
+            return cdx_iter
+
+        stats = []
+        expires = None
+        for dep_type, path in deps:
+            if dep_type == self.LIVE:
+                return cdx_iter
+
+            if dep_type == self.REMOTE:
+                expires = time.time() + self.ttl
+                continue
+
+            stat = self._stat(path)
+            if not stat:
+                return cdx_iter
+
+            stats.append((path, stat))
+
+        return self._iter_and_cache(key, cdx_iter, errs, stats, expires)
+
+    def _iter_and_cache(self, key, cdx_iter, errs, stats, expires):
+        results = []
+        size = self.ENTRY_SIZE
+
+        for cdx in cdx_iter:
+            if results is not None:
+                data = cdx.to_compact()
+                results.append(data)
+                size += self._compact_size(data)
+                if size > self.max_entry_size:
+                    results = None
+
+            yield cdx
+
+        if results is not None:
+            self.entries.put(key, (tuple(results), dict(errs), stats, expires, size))
+
+    def _is_valid(self, entry):
+        results, errs, stats, expires, size = entry
+        if expires and time.time() > expires:
+            return False
+
+        for path, stat in stats:
+            if self._stat(path) != stat:
+                return False
+
+        return True
+
+    @staticmethod
+    def _stat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        return (stat.st_mtime, stat.st_size)
+
+    @staticmethod
+    def _compact_size(data):
+        if isinstance(data, bytes):
+            return len(data)
+
+        return sum(len(str(name)) + len(str(value)) for name, value in data[1])
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / float(total) if total else 0.0,
+                'size': self.entries.curr_size,
+                'entries': len(self.entries)}
@@ -53,3 +53,44 @@ def test_lt_le():
     assert A < C
 
 
+
+def test_lazy_decode_and_reuse():
+    line = b'com,example)/ 2016 {"url": "http://example.com/", "mime": "text/html"}'
+    x = CDXObject(line)
+    assert x['timestamp'] == '2016'
+    assert x._fields is None
+
+    # set before decoding, kept in overlay
+    x['source'] = 'coll'
+    assert x['source'] == 'coll'
+    assert x._fields is None
+
+    assert list(x.keys()) == ['urlkey', 'timestamp', 'url', 'mime', 'source']
+    assert x.to_cdxj() == 'com,example)/ 2016 {"url": "http://example.com/", "mime": "text/html", "source": "coll"}\n'
+
+    y = CDXObject(line)
+    assert y.to_cdxj() == line.decode('utf-8') + '\n'
+    assert y.line_view().tobytes() == line
+
+def test_to_cdxj_normalizes_json():
+    # compact or escaped json is always serialized again
+    x = CDXObject(b'com,example)/ 2016 {"url":"http:\\/\\/example.com\\/","mime":"text/html"}')
+    assert x.to_cdxj() == 'com,example)/ 2016 {"url": "http://example.com/", "mime": "text/html"}\n'
+
+def test_cdx_dict_access():
+    x = CDXObject(b'com,example)/ 2016 http://example.com/ text/html 200 ABC - - 100 0 example.warc.gz')
+    assert x['filename'] == 'example.warc.gz'
+    assert x.pop('filename') == 'example.warc.gz'
+    assert 'filename' not in x
+    assert x.get('filename', '-') == '-'
+    assert x.line_view() is None
+    assert dict(x)['status'] == '200'
+
+def test_idx_object():
+    x = IDXObject(b'com,example)/ 2016\tzipnum\t0\t100\t1')
+    assert x['part'] == 'zipnum'
+    assert x['offset'] == 0
+    assert x['length'] == 100
+    assert x['lineno'] == 1
+    assert list(x.keys()) == IDXObject.FORMAT
+    assert str(x) == 'com,example)/ 2016\tzipnum\t0\t100\t1'
@@ -196,6 +196,9 @@ org,iana)/domains/root/db 20140126200928 http://www.iana.org/domains/root/db tex
 
 #=================================================================
 from pywb.warcserver.warcserver import init_index_agg
+from pywb.warcserver.index.cdxobject import CDXObject
+from pywb.warcserver.index.cdxops import process_cdx, process_cdx_lines, cdx_line_field
+from pywb.warcserver.index.query import CDXQuery
 
 import os
 import sys
@@ -262,6 +265,84 @@ def test_cdxj_resolve_revisit_2():
     assert(dict(results[1]) == {"urlkey": "com,example)/?example=1", "timestamp": "20140103030341", "url": "http://example.com?example=1", "length": "553", "filename": "example.warc.gz", "mime": "warc/revisit", "offset": "1864", "orig.length": "-", "orig.offset": "-", "orig.filename": "-"})
 
 
+def process_lines_test(lines, **params):
+    params['url'] = 'http://example.com/'
+    query = CDXQuery(params)
+
+    expected = [str(cdx) for cdx in process_cdx(map(CDXObject, lines), query)]
+
+    lines = list(process_cdx_lines(iter(lines), params, collapse=True))
+    results = [str(cdx) for cdx in process_cdx(map(CDXObject, lines), query)]
+
+    assert results == expected
+    return lines
+
+
+CDXJ_LINES = [
+    b'com,example)/ 20140101000000 {"url": "http://example.com/", "mime": "text/html", "status": "200"}',
+    b'com,example)/ 20140101000010 {"url": "http://example.com/", "mime": "text/html", "status": "200"}',
+    b'com,example)/ 20140102000000 {"url": "http://example.com/", "m": "text/plain", "status": "404"}',
+    b'com,example)/ 20150101000000 {"url": "http://example.com/\\"", "mime": "warc/revisit", "status": "200"}',
+    b'com,example)/ 20150101000010 {"url": "http://example.com/", "mime": "text/html", "status": 200}',
+]
+
+
+def test_cdx_line_field():
+    line = CDXJ_LINES[2]
+    assert cdx_line_field(line, 'mime') == 'text/plain'
+    assert cdx_line_field(line, 'timestamp') == '20140102000000'
+    assert cdx_line_field(line, 'digest') == ''
+    assert cdx_line_field(line, 'source') == None
+
+    # escaped or non-string values need decoding
+    assert cdx_line_field(CDXJ_LINES[3], 'url') == None
+    assert cdx_line_field(CDXJ_LINES[4], 'status') == None
+
+    line = b'com,example)/ 20140101000000 http://example.com/ text/html 200 ABC - - 100 20 a.warc.gz'
+    assert cdx_line_field(line, 'filename') == 'a.warc.gz'
+    assert cdx_line_field(line, 'status') == '200'
+
+
+def test_process_lines_clamp_filter():
+    assert len(process_lines_test(CDXJ_LINES, from_ts='2014', to='2014')) == 3
+    assert len(process_lines_test(CDXJ_LINES, filter='=mime:text/html')) == 3
+    assert len(process_lines_test(CDXJ_LINES, filter=['!mime:html', 'url:com'])) == 2
+
+    # applies to str(cdx), not checked on lines
+    assert len(process_lines_test(CDXJ_LINES, filter='plain')) == 5
+
+    # lines can't be filtered when resolving revisits
+    assert len(process_lines_test(CDXJ_LINES, filter='=mime:text/html',
+                                  resolveRevisits='true')) == 5
+
+
+def test_process_lines_collapse():
+    assert len(process_lines_test(CDXJ_LINES[:4], collapseTime='8')) == 3
+    assert len(process_lines_test(CDXJ_LINES[:4], collapseTime='4')) == 3
+
+    # collapsing stops once a line can't be checked
+    assert len(process_lines_test(CDXJ_LINES, collapseTime='4', filter='url:http')) == 4
+
+
+def test_collapse_lines_single_source():
+    iana = get_test_dir() + 'cdxj/iana.cdxj'
+    one = init_index_agg({'iana': iana})
+    two = init_index_agg({'iana': iana, 'iana2': iana})
+
+    # set before loading, for the query only
+    params = {'url': 'http://www.iana.org/', 'collapseTime': '10'}
+    res, errs = one(params)
+    assert params['_collapse_lines'] == True
+    one_res = [cdx['timestamp'] for cdx in res]
+
+    res, errs = two(params)
+    assert params['_collapse_lines'] == False
+    assert [cdx['timestamp'] for cdx in res] == one_res
+
+    res, errs = one(params)
+    assert params['_collapse_lines'] == True
+    assert [cdx['timestamp'] for cdx in res] == one_res
+
 
 if __name__ == "__main__":
     import doctest
@@ -1,4 +1,5 @@
 import tempfile
+import pytest
 import os
 import shutil
 import json
@@ -8,9 +9,12 @@ from pywb.warcserver.test.testutils import to_path, to_json_list, TempDirTests,
 from mock import patch
 
 import time
+import gevent
 
 from pywb.warcserver.index.aggregator import DirectoryIndexSource, CacheDirectoryIndexSource
 from pywb.warcserver.index.aggregator import SimpleAggregator
+from pywb.warcserver.index.dirwatcher import DirWatcher
+from pywb.warcserver.index.cdxobject import CDXObject
 from pywb.warcserver.index.indexsource import MementoIndexSource
 
 
@@ -212,8 +216,298 @@ class TestDirAgg(TempDirTests, BaseTestClass):
         with open(new_file, 'a') as fh:
             os.utime(new_file, None)
 
-        res = self.cache_dir_loader.get_source_list({'url': 'example.com/', 'param.coll': '*'})
-
-        # New File Included
+        # New File Included, once picked up by the watcher
         exp['sources'][to_path('colls:C/indexes/empty.cdxj')] = 'file'
+
+        for i in range(100):
+            gevent.sleep(0.1)
+            res = self.cache_dir_loader.get_source_list({'url': 'example.com/', 'param.coll': '*'})
+            if res == exp:
+                break
+
         assert(res == exp)
+
+
+def test_dir_agg_index_filters(tmpdir):
+    from pywb.warcserver.index.indexfilter import IndexFilter
+    from pywb.warcserver.index.query import CDXQuery
+
+    index_dir = str(tmpdir)
+    for name in ('example2.cdxj', 'iana.cdxj', 'dupes.cdxj'):
+        shutil.copy(to_path(TEST_CDX_PATH + name), index_dir)
+
+    loader = DirectoryIndexSource(index_dir, '')
+
+    def query(url, **params):
+        params['url'] = url
+        sources = [name for name, _ in loader._iter_sources(CDXQuery(dict(params)).params)]
+        res, errs = loader(params)
+        return sorted(sources), to_json_list(res)
+
+    no_filter = query('example.com/')
+    no_filter_iana = query('iana.org/', matchType='prefix')
+    assert len(no_filter[0]) == 3
+
+    for name in ('example2.cdxj', 'iana.cdxj', 'dupes.cdxj'):
+        IndexFilter.write_for_index(os.path.join(index_dir, name))
+
+    sources, res = query('example.com/')
+    assert sources == ['dupes.cdxj', 'example2.cdxj']
+    assert res == no_filter[1]
+
+    sources, res = query('iana.org/', matchType='prefix')
+    assert sources == ['dupes.cdxj', 'iana.cdxj']
+    assert res == no_filter_iana[1]
+
+    assert query('example.com/not-found')[0] == []
+    assert query('zzz.zz/', matchType='domain')[0] == []
+
+    # out of date filter is ignored
+    with open(os.path.join(index_dir, 'iana.cdxj'), 'ab') as fh:
+        fh.write(b'\n')
+
+    assert query('example.com/not-found')[0] == ['iana.cdxj']
+
+
+def test_cache_dir_agg_no_stat(tmpdir):
+    from pywb.warcserver.index.indexfilter import IndexFilter
+    from pywb.warcserver.index.query import CDXQuery
+
+    index_dir = str(tmpdir)
+    for name in ('example2.cdxj', 'iana.cdxj'):
+        shutil.copy(to_path(TEST_CDX_PATH + name), index_dir)
+        IndexFilter.write_for_index(os.path.join(index_dir, name))
+
+    loader = CacheDirectoryIndexSource(index_dir, '')
+    try:
+        res, errs = loader({'url': 'example.com/'})
+        expected = to_json_list(res)
+        assert len(expected) > 0
+
+        # filters and mappings checked with the directory snapshot
+        with patch('os.stat', side_effect=AssertionError('stat')), \
+             patch('os.path.getmtime', side_effect=AssertionError('getmtime')):
+            res, errs = loader({'url': 'example.com/'})
+            assert to_json_list(res) == expected
+
+            params = CDXQuery({'url': 'iana.org/'}).params
+            sources = [name for name, _ in loader._iter_sources(params)]
+            assert sources == ['iana.cdxj']
+
+        # replaced file seen after reload
+        with open(os.path.join(index_dir, 'new.cdxj'), 'wb') as fh:
+            fh.write(b'')
+
+        os.rename(os.path.join(index_dir, 'new.cdxj'),
+                  os.path.join(index_dir, 'example2.cdxj'))
+
+        DirWatcher.notify_changed()
+
+        res, errs = loader({'url': 'example.com/'})
+        assert to_json_list(res) == []
+    finally:
+        loader.watcher.stop()
+
+
+def test_dir_agg_lookup_digest(tmpdir):
+    from pywb.warcserver.index.digestindex import DigestIndex
+
+    index_dir = str(tmpdir)
+    for name in ('iana.cdxj', 'dupes.cdxj'):
+        shutil.copy(to_path(TEST_CDX_PATH + name), index_dir)
+
+    loader = SimpleAggregator({'dir': DirectoryIndexSource(index_dir, '')})
+
+    digest = 'B2LTWWPUOYAH7UIPQ7ZUPQ4VMBSVC36A'
+    assert loader.lookup_digest(digest, {}) is None
+
+    DigestIndex.write_for_index(os.path.join(index_dir, 'dupes.cdxj'))
+
+    cdx = loader.lookup_digest(digest, {})
+    assert (cdx['filename'], cdx['offset'], cdx['length']) == ('dupes.warc.gz', '334', '1046')
+
+    assert loader.lookup_digest('ABCDEF', {}) is None
+
+
+def test_dir_agg_result_cache(tmpdir):
+    from pywb.warcserver.index.indexsource import LiveIndexSource
+    from pywb.warcserver.index.resultcache import CDXResultCache
+
+    index_dir = str(tmpdir)
+    for name in ('example2.cdxj', 'dupes.cdxj'):
+        shutil.copy(to_path(TEST_CDX_PATH + name), index_dir)
+
+    cache = CDXResultCache()
+    loader = DirectoryIndexSource(index_dir, '')
+    loader.result_cache = cache
+
+    def query(url):
+        res, errs = loader({'url': url})
+        return to_json_list(res)
+
+    res = query('example.com/')
+    assert len(res) == 3
+    assert cache.stats()['entries'] == 1
+
+    assert query('example.com/') == res
+    assert cache.stats()['hits'] == 1
+
+    # index changed, cached result is dropped
+    time.sleep(0.01)
+    with open(os.path.join(index_dir, 'example2.cdxj'), 'ab') as fh:
+        fh.write(b'com,example)/ 20170101000000 {"url": "http://example.com/", "filename": "new.warc.gz"}\n')
+
+    assert len(query('example.com/')) == 4
+    assert cache.stats()['hits'] == 1
+
+    # new index file
+    assert len(query('iana.org/')) == 2
+    time.sleep(0.01)
+    shutil.copy(to_path(TEST_CDX_PATH + 'iana.cdxj'), index_dir)
+    assert len(query('iana.org/')) == 3
+    assert query('iana.org/') == query('iana.org/')
+    assert cache.stats()['hits'] == 3
+
+    # live results are never cached
+    live_agg = SimpleAggregator({'live': LiveIndexSource()})
+    live_agg.result_cache = cache
+    entries = cache.stats()['entries']
+    res, errs = live_agg({'url': 'http://example.com/'})
+    assert len(list(res)) == 1
+    assert cache.stats()['entries'] == entries
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_dir_watcher(tmpdir, use_inotify):
+    index_dir = str(tmpdir)
+    loads = []
+
+    def load_dir(the_dir, old_files):
+        loads.append(the_dir)
+        return [(name, name) for name in sorted(os.listdir(the_dir))]
+
+    watcher = DirWatcher(load_dir, interval=0.01, use_inotify=use_inotify)
+    try:
+        assert watcher.get_files(index_dir) == ()
+        assert watcher.get_files(os.path.join(index_dir, '*')) == ()
+
+        # snapshot is read without loading again
+        assert watcher.get_files(index_dir) == ()
+        assert loads == [index_dir]
+
+        os.makedirs(os.path.join(index_dir, 'A'))
+        with open(os.path.join(index_dir, 'A', 'example.cdxj'), 'w'):
+            pass
+
+        # dir mtime may not change within its resolution when polling
+        os.utime(index_dir, (0, 0))
+
+        for i in range(100):
+            gevent.sleep(0.02)
+            if watcher.get_files(os.path.join(index_dir, '*')) == (('example.cdxj', 'example.cdxj'),):
+                break
+
+        assert watcher.get_files(index_dir) == (('A', 'A'),)
+        assert watcher.get_files(os.path.join(index_dir, '*')) == (('example.cdxj', 'example.cdxj'),)
+    finally:
+        watcher.stop()
+
+
+def test_dir_watcher_notify_changed(tmpdir):
+    index_dir = str(tmpdir)
+
+    def load_dir(the_dir, old_files):
+        return [(name, name) for name in sorted(os.listdir(the_dir))]
+
+    watcher = DirWatcher(load_dir, interval=60, use_inotify=False)
+    try:
+        assert watcher.get_files(index_dir) == ()
+
+        with open(os.path.join(index_dir, 'example.cdxj'), 'w'):
+            pass
+
+        # changes made in this process are seen on next access
+        DirWatcher.notify_changed()
+        assert watcher.get_files(index_dir) == (('example.cdxj', 'example.cdxj'),)
+    finally:
+        watcher.stop()
+
+
+def test_dir_watcher_notify_changed_thread(tmpdir):
+    index_dir = str(tmpdir)
+
+    def load_dir(the_dir, old_files):
+        return [(name, name) for name in sorted(os.listdir(the_dir))]
+
+    watcher = DirWatcher(load_dir, interval=60, use_inotify=False)
+    try:
+        assert watcher.get_files(index_dir) == ()
+
+        with open(os.path.join(index_dir, 'example.cdxj'), 'w'):
+            pass
+
+        # reloaded by the background greenlet if notified from another thread
+        gevent.get_hub().threadpool.apply(DirWatcher.notify_changed)
+
+        for i in range(100):
+            gevent.sleep(0.02)
+            if watcher.get_files(index_dir):
+                break
+
+        assert watcher.get_files(index_dir) == (('example.cdxj', 'example.cdxj'),)
+    finally:
+        watcher.stop()
+
+
+def test_dir_agg_closest_window(tmpdir):
+    from pywb.warcserver.index.cdxops import cdx_sort_closest
+
+    index_dir = str(tmpdir)
+
+    lines = []
+    for i, timestamps in enumerate([['2014010100000{0}'.format(j % 10) for j in range(0, 50, 3)],
+                                    ['2014010100000{0}'.format(j % 10) for j in range(1, 50, 4)],
+                                    ['20140101000005'] * 4 + ['20140101000007']]):
+        file_lines = []
+        for j, ts in enumerate(timestamps):
+            file_lines.append('com,example)/ {0} {{"url": "http://example.com/", "filename": "{1}-{2}.warc.gz"}}'.format(ts, i, j))
+
+        file_lines.append('com,example)/other 20140101000005 {"url": "http://example.com/other"}')
+        file_lines.sort()
+        lines.extend(file_lines)
+
+        with open(os.path.join(index_dir, 'index{0}.cdxj'.format(i)), 'w') as fh:
+            fh.write('\n'.join(file_lines) + '\n')
+
+    lines.sort()
+    all_cdx = [CDXObject(line.encode('utf-8')) for line in lines
+               if line.startswith('com,example)/ ')]
+
+    def expected(closest, limit, from_ts=None, to=None):
+        res = [cdx for cdx in all_cdx
+               if (not from_ts or cdx['timestamp'] >= from_ts) and
+                  (not to or cdx['timestamp'] <= to)]
+        return [cdx['filename'] for cdx in cdx_sort_closest(closest, iter(res), limit)]
+
+    loader = DirectoryIndexSource(index_dir, '')
+
+    def query(**params):
+        params['url'] = 'http://example.com/'
+        res, errs = loader(params)
+        assert errs == {}
+        return [cdx['filename'] for cdx in res]
+
+    for closest in ('20140101000000', '20140101000005', '20140101000006', '20140101000009', '2013', '2015'):
+        for limit in (1, 2, 3, 5, 100):
+            assert query(closest=closest, limit=str(limit)) == expected(closest, limit)
+
+    assert (query(closest='20140101000005', limit='3', **{'from': '20140101000006'}) ==
+            expected('20140101000005', 3, from_ts='20140101000006'))
+
+    assert (query(closest='20140101000005', limit='3', to='20140101000004') ==
+            expected('20140101000005', 3, to='20140101000004'))
+
+    # from/to only
+    res, errs = loader({'url': 'http://example.com/', 'from': '20140101000008', 'to': '20140101000009'})
+    assert ([cdx['filename'] for cdx in res] ==
+            [cdx['filename'] for cdx in all_cdx if '20140101000008' <= cdx['timestamp'] <= '20140101000009'])
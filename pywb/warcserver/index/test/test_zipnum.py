@@ -126,13 +126,16 @@ from pywb import get_test_dir
 from pywb.warcserver.index.test.test_cdxops import cdx_ops_test, cdx_ops_test_data
 from pywb.warcserver.warcserver import init_index_agg
 from pywb.warcserver.index.cdxobject import CDXException
+from pywb.warcserver.index.zipnum import ZipBlock, ZipBlockCache
 
 import shutil
 import tempfile
 import os
 import json
 
+import gevent
 import pytest
+from mock import patch
 
 
 test_zipnum = get_test_dir() + 'zipcdx/zipnum-sample.idx'
@@ -236,6 +239,108 @@ def test_blocks_ignore_timestamp_params():
     res = zip_ops_test_data(url='*.iana.org', pageSize='4', showNumPages=True, closest='20140126000000')
     assert(res == {"blocks": 38, "pages": 10, "pageSize": 4})
 
+def test_block_cache():
+    config = {'type': 'zipnum', 'path': test_zipnum, 'block_cache_size': 1024 * 1024}
+    server = init_index_agg({'zip': config})
+    block_cache = server.sources['zip'].block_cache
+
+    def query():
+        cdx_iter, err = server(dict(url='iana.org/domains/', matchType='prefix'))
+        return [cdx['urlkey'] for cdx in cdx_iter]
+
+    results = query()
+    assert len(results) == 9
+    assert block_cache.stats()['hits'] == 0
+    assert block_cache.stats()['blocks'] == 3
+
+    assert query() == results
+    assert block_cache.stats()['hits'] == 3
+    assert block_cache.stats()['hit_ratio'] > 0
+
+
+def test_prefetch_blocks_order():
+    def query(**config):
+        config.update({'type': 'zipnum', 'path': test_zipnum, 'max_blocks': 1})
+        server = init_index_agg({'zip': config})
+        cdx_iter, err = server(dict(url='iana.org/', matchType='domain', pageSize='100', limit='50'))
+        return [cdx['urlkey'] + ' ' + cdx['timestamp'] for cdx in cdx_iter]
+
+    results = query(prefetch_blocks=0)
+    assert len(results) == 50
+    assert query(prefetch_blocks=3) == results
+    assert query(prefetch_blocks=3, block_cache_size=0) == results
+
+
+def test_prefetch_blocks_lazy():
+    config = {'type': 'zipnum', 'path': test_zipnum, 'max_blocks': 1,
+              'prefetch_blocks': 3, 'block_cache_size': 1024 * 1024}
+
+    def query(**params):
+        server = init_index_agg({'zip': dict(config)})
+        block_cache = server.sources['zip'].block_cache
+
+        with patch('gevent.spawn', wraps=gevent.spawn) as spawn:
+            cdx_iter, err = server(params)
+            results = list(cdx_iter)
+
+        return results, block_cache.stats()['blocks'], spawn.call_count
+
+    # answered from the first range, nothing loaded ahead
+    results, blocks, spawned = query(url='iana.org/_css/', matchType='prefix', limit='1')
+    assert len(results) == 1
+    assert blocks == 1
+    assert spawned == 0
+
+    results, blocks, spawned = query(url='http://www.iana.org/domains/root/db')
+    assert len(results) == 2
+    assert spawned == 0
+
+    # later ranges loaded ahead once past the first
+    results, blocks, spawned = query(url='iana.org/', matchType='domain', pageSize='100', limit='50')
+    assert len(results) == 50
+    assert spawned > 0
+
+
+def test_block_cache_spill(tmpdir):
+    block_cache = ZipBlockCache(300, spill_dir=str(tmpdir))
+
+    block_cache.put(('a', 0, 10), ZipBlock(b'a 1\n' * 20))
+    block_cache.put(('a', 10, 10), ZipBlock(b'b 1\n' * 20))
+
+    # first block evicted to disk
+    assert block_cache.stats()['blocks'] == 1
+    assert len(os.listdir(str(tmpdir))) == 1
+
+    block = block_cache.get(('a', 0, 10))
+    assert list(block.iter_lines(b'a 1')) == [b'a 1\n'] * 20
+    assert block_cache.stats()['spill_hits'] == 1
+
+    assert block_cache.get(('a', 20, 10)) is None
+    assert block_cache.stats()['misses'] == 1
+
+
+def test_block_cache_spill_dir_bounded(tmpdir):
+    spill_dir = str(tmpdir)
+
+    # blocks spilled by earlier runs are counted towards the spill size
+    for i in range(3):
+        block_cache = ZipBlockCache(300, spill_dir=spill_dir, spill_size=200)
+        for j in range(4):
+            block_cache.put((str(i), j, 10), ZipBlock(b'a 1\n' * 20))
+
+        spilled = sum(os.path.getsize(os.path.join(spill_dir, name))
+                      for name in os.listdir(spill_dir))
+
+        assert 0 < spilled <= 200
+        assert block_cache.stats()['spill_size'] == spilled
+
+
+def test_block_bisect():
+    block = ZipBlock(b'a 1\nb 1\nb 2\nc 1')
+    assert list(block.iter_lines(b'b')) == [b'b 1\n', b'b 2\n', b'c 1']
+    assert list(block.iter_lines(b'd')) == []
+    assert len(list(block.iter_lines())) == 4
+
 
 # Errors
 
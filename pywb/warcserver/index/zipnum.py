@@ -1,17 +1,21 @@
+import copy
 import datetime
 import itertools
 import json
 import logging
 import os
-from io import BytesIO
+from collections import deque
 
+import gevent
 import six
 from warcio.bufferedreaders import gzip_decompressor
 
-from pywb.utils.binsearch import iter_range, linearsearch, search
+from pywb.utils.binsearch import MappedIndex, iter_range, linearsearch, search
 from pywb.utils.io import no_except_close
 from pywb.utils.loaders import BlockLoader, read_last_line
+from pywb.utils.lrucache import DiskLRUCache, LRUCache
 from pywb.warcserver.index.cdxobject import CDXException, CDXObject, IDXObject
+from pywb.warcserver.index.cdxops import cdx_lines_closest_window, process_cdx_lines
 # from pywb.warcserver.index.cdxsource import CDXSource
 from pywb.warcserver.index.indexsource import BaseIndexSource
 from pywb.warcserver.index.query import CDXQuery
@@ -26,6 +30,108 @@ class ZipBlocks(object):
         self.count = count
 
 
+# ============================================================================
+class ZipBlock(object):
+    """ A decompressed block of cdx lines, with the offset of each line
+    so that the first line at or after a key can be found by bisection
+    """
+    __slots__ = ('buff', 'offsets')
+
+    def __init__(self, buff):
+        self.buff = buff
+
+        offsets = []
+        start = 0
+        size = len(buff)
+        while start < size:
+            offsets.append(start)
+            start = buff.find(b'\n', start) + 1
+            if start == 0:
+                break
+
+        self.offsets = offsets
+
+    @property
+    def size(self):
+        return len(self.buff) + len(self.offsets) * 8
+
+    def line(self, i):
+        start = self.offsets[i]
+        end = self.offsets[i + 1] if i + 1 < len(self.offsets) else len(self.buff)
+        return self.buff[start:end]
+
+    def iter_lines(self, key=None):
+        lo = 0
+        if key:
+            hi = len(self.offsets)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.line(mid) < key:
+                    lo = mid + 1
+                else:
+                    hi = mid
+
+        for i in range(lo, len(self.offsets)):
+            yield self.line(i)
+
+
+# ============================================================================
+class ZipBlockCache(object):
+    """ LRU cache of decompressed ZipNum blocks, keyed by
+    (location, offset, length) and bounded by total size in bytes.
+
+    If a spill_dir is set, blocks evicted from memory are written there
+    and read back on a miss, up to spill_size bytes. Blocks spilled by
+    earlier runs, or by other processes sharing the spill_dir, are
+    counted towards spill_size, so that the spill_dir stays bounded.
+    """
+    def __init__(self, max_size, spill_dir=None, spill_size=None):
+        self.max_size = max_size
+        self.blocks = LRUCache(max_size, sizeof=lambda block: block.size)
+
+        self.spill = None
+        if spill_dir:
+            self.spill = DiskLRUCache(spill_dir, spill_size or max_size * 4)
+
+        self.spill_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        block = self.blocks.get(key)
+        if block:
+            return block
+
+        buff = self.spill.get(self._spill_key(key), remove=True) if self.spill else None
+        if buff is not None:
+            self.spill_hits += 1
+            block = ZipBlock(buff)
+            self.put(key, block)
+            return block
+
+        self.misses += 1
+        return None
+
+    def put(self, key, block):
+        for old_key, old in self.blocks.put(key, block):
+            if self.spill:
+                self.spill.put(self._spill_key(old_key), old.buff)
+
+    def stats(self):
+        hits = self.blocks.hits
+        total = hits + self.spill_hits + self.misses
+        return {'hits': hits,
+                'spill_hits': self.spill_hits,
+                'misses': self.misses,
+                'hit_ratio': (hits + self.spill_hits) / float(total) if total else 0.0,
+                'size': self.blocks.curr_size,
+                'blocks': len(self.blocks),
+                'spill_size': self.spill.curr_size if self.spill else 0}
+
+    @staticmethod
+    def _spill_key(key):
+        return '{0}:{1}:{2}'.format(*key)
+
+
 # ============================================================================
 class AlwaysJsonResponse(dict):
     def to_json(self, *args):
@@ -57,10 +163,10 @@ class LocMapResolver(object):
 
         self.load_loc()
 
-    def load_loc(self):
+    def load_loc(self, force=False):
         # check modified time of current file before loading
         new_mtime = os.path.getmtime(self.loc_filename)
-        if (new_mtime == self.loc_mtime):
+        if (new_mtime == self.loc_mtime) and not force:
             return
 
         # update loc file mtime
@@ -82,7 +188,13 @@ class LocMapResolver(object):
                 self.loc_map[parts[0]] = paths
 
     def __call__(self, part, query):
-        return self.loc_map[part]
+        paths = self.loc_map.get(part)
+        if paths is None:
+            # part of a summary written after the loc was last loaded
+            self.load_loc(force=True)
+            paths = self.loc_map[part]
+
+        return paths
 
 
 # ============================================================================
@@ -108,10 +220,16 @@ class LocPrefixResolver(object):
 class ZipNumIndexSource(BaseIndexSource):
     DEFAULT_RELOAD_INTERVAL = 10  # in minutes
     DEFAULT_MAX_BLOCKS = 10
+    DEFAULT_PREFETCH = 4
+    DEFAULT_BLOCK_CACHE_SIZE = 32 * 1024 * 1024
     IDX_EXT = ('.idx', '.summary')
 
+    # block cache shared by all sources using the default settings
+    shared_block_cache = None
+
     def __init__(self, summary, config=None):
         self.max_blocks = self.DEFAULT_MAX_BLOCKS
+        self.prefetch = self.DEFAULT_PREFETCH
 
         self.loc_resolver = None
         self.config = config or {}
@@ -126,6 +244,8 @@ class ZipNumIndexSource(BaseIndexSource):
 
             self.max_blocks = config.get('max_blocks', self.max_blocks)
 
+            self.prefetch = config.get('prefetch_blocks', self.prefetch)
+
             reload_ival = config.get('reload_interval', reload_ival)
 
         if isinstance(loc, dict):
@@ -141,12 +261,39 @@ class ZipNumIndexSource(BaseIndexSource):
 
         self.blk_loader = BlockLoader(cookie_maker=cookie_maker)
 
+        self.block_cache = self.init_block_cache(self.config)
+
+    @classmethod
+    def init_block_cache(cls, config):
+        cache_size = config.get('block_cache_size', cls.DEFAULT_BLOCK_CACHE_SIZE)
+        spill_dir = config.get('block_cache_dir')
+
+        if not cache_size:
+            return None
+
+        if spill_dir or cache_size != cls.DEFAULT_BLOCK_CACHE_SIZE:
+            return ZipBlockCache(cache_size, spill_dir,
+                                 config.get('block_cache_dir_size'))
+
+        if not cls.shared_block_cache:
+            ZipNumIndexSource.shared_block_cache = ZipBlockCache(cache_size)
+
+        return cls.shared_block_cache
+
     def load_index(self, params):
         self.loc_resolver.load_loc()
         return self._do_load_cdx(self.summary, CDXQuery(params))
 
     def _do_load_cdx(self, filename, query):
-        reader = open(filename, 'rb')
+        params = query.params
+
+        key, end_key = query.search_range
+        if (key, end_key) != (query.key, query.end_key):
+            query = copy.copy(query)
+            query.params = dict(params)
+            query.set_key(key, end_key)
+
+        reader = MappedIndex.load(filename).reader()
 
         idx_iter = self.compute_page_range(reader, query)
 
@@ -160,12 +307,24 @@ class ZipNumIndexSource(BaseIndexSource):
         if query.page_count:
             return idx_iter
 
-        blocks = self.idx_to_cdx(idx_iter, query)
+        if self.prefetch > 1:
+            blocks = self.prefetch_cdx(idx_iter, query)
+        else:
+            blocks = self.idx_to_cdx(idx_iter, query)
+
+        window = query.closest_window
+
+        collapse = params.get('_collapse_lines', False)
 
         def gen_cdx():
-            for blk in blocks:
-                for cdx in blk:
-                    yield CDXObject(cdx)
+            line_iter = itertools.chain.from_iterable(blocks)
+            if window:
+                line_iter = cdx_lines_closest_window(line_iter, *window)
+
+            line_iter = process_cdx_lines(line_iter, params, collapse=collapse)
+
+            for cdx in line_iter:
+                yield CDXObject(cdx)
 
         return gen_cdx()
 
@@ -278,6 +437,62 @@ class ZipNumIndexSource(BaseIndexSource):
         yield six.next(line_iter)
 
     def idx_to_cdx(self, idx_iter, query):
+        for blocks, ranges in self.idx_to_blocks(idx_iter):
+            yield self.block_to_cdx_iter(blocks, ranges, query)
+
+    def prefetch_cdx(self, idx_iter, query):
+        """ Yield the lines of each block range in order, loading later
+        ranges ahead of the consumer.
+
+        The first range is read lazily in the calling greenlet, so that
+        queries answered from it, such as exact or limit=1 queries, load
+        no other range. Once the consumer reads past it, the range being
+        read is still read lazily, while up to 'prefetch' - 1 of the ranges
+        after it are loaded and decompressed, each in its own greenlet.
+        Any pending loads are killed if the consumer stops early.
+        """
+        def load_lines(blocks, ranges):
+            return list(self.block_to_cdx_iter(blocks, ranges, query))
+
+        range_iter = self.idx_to_blocks(idx_iter)
+        pending = deque()
+
+        def load_ahead():
+            while len(pending) < self.prefetch - 1:
+                next_range = next(range_iter, None)
+                if next_range is None:
+                    break
+
+                pending.append(gevent.spawn(load_lines, *next_range))
+
+        try:
+            first = next(range_iter, None)
+            if first is None:
+                return
+
+            yield self.block_to_cdx_iter(first[0], first[1], query)
+
+            # more lines needed, so later ranges are loaded ahead
+            second = next(range_iter, None)
+            if second is None:
+                return
+
+            load_ahead()
+            yield self.block_to_cdx_iter(second[0], second[1], query)
+
+            while pending:
+                greenlet = pending.popleft()
+                load_ahead()
+                yield greenlet.get()
+
+        finally:
+            gevent.killall(list(pending), block=False)
+
+    def idx_to_blocks(self, idx_iter):
+        """ Group idx lines into ranges of adjacent blocks in the same part,
+        up to 'max_blocks' per range, yielding each as a (ZipBlocks, lengths)
+        tuple
+        """
         blocks = None
         ranges = []
 
@@ -294,7 +509,7 @@ class ZipNumIndexSource(BaseIndexSource):
 
             else:
                 if blocks:
-                    yield self.block_to_cdx_iter(blocks, ranges, query)
+                    yield blocks, ranges
 
                 blocks = ZipBlocks(idx['part'],
                                    idx['offset'],
@@ -304,7 +519,7 @@ class ZipNumIndexSource(BaseIndexSource):
                 ranges = [blocks.length]
 
         if blocks:
-            yield self.block_to_cdx_iter(blocks, ranges, query)
+            yield blocks, ranges
 
     def block_to_cdx_iter(self, blocks, ranges, query):
         last_exc = None
@@ -315,6 +530,12 @@ class ZipNumIndexSource(BaseIndexSource):
         except:
             raise Exception('No Locations Found for: ' + blocks.part)
 
+        if self.block_cache:
+            for location in locations:
+                cached = self._get_cached_blocks(location, blocks, ranges)
+                if cached:
+                    return self._iter_block_lines(cached, query)
+
         for location in self.loc_resolver(blocks.part, query):
             try:
                 return self.load_blocks(location, blocks, ranges, query)
@@ -340,24 +561,48 @@ class ZipNumIndexSource(BaseIndexSource):
 
         reader = self.blk_loader.load(location, blocks.offset, blocks.length)
 
-        def decompress_block(range_):
+        block_cache = self.block_cache
+
+        def decompress_block(offset, range_):
             decomp = gzip_decompressor()
-            buff = decomp.decompress(reader.read(range_))
-            for line in BytesIO(buff):
-                yield line
+            block = ZipBlock(decomp.decompress(reader.read(range_)))
+            if block_cache:
+                block_cache.put((location, offset, range_), block)
+
+            return block
 
         def iter_blocks(reader):
             try:
+                offset = blocks.offset
                 for r in ranges:
-                    yield decompress_block(r)
+                    yield decompress_block(offset, r)
+                    offset += r
             finally:
                 no_except_close(reader)
 
-        # iterate over all blocks
-        iter_ = itertools.chain.from_iterable(iter_blocks(reader))
+        return self._iter_block_lines(iter_blocks(reader), query)
+
+    def _get_cached_blocks(self, location, blocks, ranges):
+        cached = []
+        offset = blocks.offset
+        for r in ranges:
+            block = self.block_cache.get((location, offset, r))
+            if not block:
+                return None
+
+            cached.append(block)
+            offset += r
+
+        return cached
+
+    def _iter_block_lines(self, block_iter, query):
+        def iter_lines():
+            for block in block_iter:
+                for line in block.iter_lines(query.key):
+                    yield line
 
         # start bound
-        iter_ = linearsearch(iter_, query.key)
+        iter_ = linearsearch(iter_lines(), query.key)
 
         # end bound
         iter_ = itertools.takewhile(lambda line: line < query.end_key, iter_)
@@ -4,17 +4,23 @@ from pywb.warcserver.amf import Amf
 from pyamf.remoting import decode
 from warcio.utils import to_native_str
 
+from pywb.utils.io import ChainedReader
+
 from six.moves.urllib.parse import urlsplit, quote, unquote_plus, urlencode
 from six import iteritems, StringIO, PY3
 from io import BytesIO
 
 import base64
 import cgi
+import codecs
 import json
 
 
 #=============================================================================
 class DirectWSGIInputRequest(object):
+    # request bodies larger than this are streamed, not buffered
+    MAX_BUFFERED_BODY_SIZE = 65536
+
     def __init__(self, env):
         self.env = env
 
@@ -72,7 +78,14 @@ class DirectWSGIInputRequest(object):
     def _get_header(self, name):
         return self.env.get('HTTP_' + name.upper().replace('-', '_'))
 
-    def include_method_query(self, url):
+    def include_method_query(self, url, read_body=True):
+        """Return the url with the request method, and if read_body is set,
+        a canonicalized prefix of the request body, appended as a query.
+
+        Only a bounded prefix of the body is consumed, and it is chained
+        back in front of the remaining input so the full body can still be
+        streamed upstream.
+        """
         if not url:
             return url
 
@@ -82,18 +95,19 @@ class DirectWSGIInputRequest(object):
             return url
 
         mime = self._get_content_type()
-        length = self._get_content_length()
+        length = self._get_content_length() if read_body else 0
         stream = self.env['wsgi.input']
 
         buffered_stream = BytesIO()
 
         query = MethodQueryCanonicalizer(method, mime, length, stream,
                                            buffered_stream=buffered_stream,
-                                           environ=self.env)
+                                           environ=self.env,
+                                           max_read=MethodQueryCanonicalizer.MAX_POST_SIZE)
 
         new_url = query.append_query(url)
-        if new_url != url:
-            self.env['wsgi.input'] = buffered_stream
+        if query.read_len:
+            self.env['wsgi.input'] = ChainedReader([buffered_stream, stream])
 
         return new_url
 
@@ -109,7 +123,7 @@ class DirectWSGIInputRequest(object):
 
         return req_uri
 
-    def reconstruct_request(self, url=None):
+    def _reconstruct_headers(self, url=None):
         buff = StringIO()
         buff.write(self.get_req_method())
         buff.write(' ')
@@ -136,7 +150,10 @@ class DirectWSGIInputRequest(object):
             buff.write('\r\n')
 
         buff.write('\r\n')
-        buff = buff.getvalue().encode('latin-1')
+        return buff.getvalue().encode('latin-1')
+
+    def reconstruct_request(self, url=None):
+        buff = self._reconstruct_headers(url)
 
         body = self.get_req_body()
         if body:
@@ -144,6 +161,29 @@ class DirectWSGIInputRequest(object):
 
         return buff
 
+    def reconstruct_request_stream(self, url=None):
+        """Return the reconstructed request as a stream and its total length.
+
+        Bodies with a known length above MAX_BUFFERED_BODY_SIZE are not read
+        into memory, but chained after the request headers to be streamed.
+
+        :param str url: The url of the request, used to set the Host header
+        :return: A tuple of the request stream and its total length
+        :rtype: tuple[ChainedReader|BytesIO, int]
+        """
+        try:
+            length = int(self._get_content_length())
+        except (ValueError, TypeError):
+            length = -1
+
+        if length <= self.MAX_BUFFERED_BODY_SIZE:
+            buff = self.reconstruct_request(url)
+            return BytesIO(buff), len(buff)
+
+        buff = self._reconstruct_headers(url)
+        total_len = len(buff) + length
+        return ChainedReader([BytesIO(buff), self.get_req_body()], total_len), total_len
+
 
 #=============================================================================
 class POSTInputRequest(DirectWSGIInputRequest):
@@ -182,20 +222,27 @@ class POSTInputRequest(DirectWSGIInputRequest):
 
 # ============================================================================
 class MethodQueryCanonicalizer(object):
-    #MAX_POST_SIZE = 16384
+    MAX_POST_SIZE = 65536
     MAX_QUERY_LENGTH = 4096
 
     def __init__(self, method, mime, length, stream,
                        buffered_stream=None,
-                       environ=None):
+                       environ=None,
+                       max_read=None):
         """
         Append the method for HEAD/OPTIONS as __pywb_method=<method>
         For POST requests, requests extract a url-encoded form from stream
         read content length and convert to query params, if possible
         Attempt to decode application/x-www-form-urlencoded or multipart/*,
         otherwise read whole block and b64encode
+
+        If max_read is set, at most max_read bytes of a form or binary body
+        are read, which is sufficient to fill the MAX_QUERY_LENGTH query.
+        Other bodies are parsed whole, so that the query is the same as
+        when indexing. The number of bytes consumed is available as read_len
         """
         self.query = b''
+        self.read_len = 0
 
         method = method.upper()
         self.method = method
@@ -211,8 +258,15 @@ class MethodQueryCanonicalizer(object):
         if length <= 0:
             return
 
-        # always read entire POST request, but limit query string later
-        #length = min(length, self.MAX_POST_SIZE)
+        if not mime:
+            mime = ''
+
+        # only read a bounded prefix if the query doesn't depend on the rest
+        truncated = False
+        if max_read and length > max_read and self.is_prefix_query(mime):
+            length = max_read
+            truncated = True
+
         query = []
 
         while length > 0:
@@ -225,14 +279,12 @@ class MethodQueryCanonicalizer(object):
             query.append(buff)
 
         query = b''.join(query)
+        self.read_len = len(query)
 
         if buffered_stream:
             buffered_stream.write(query)
             buffered_stream.seek(0)
 
-        if not mime:
-            mime = ''
-
         def handle_binary(query):
             query = base64.b64encode(query)
             query = to_native_str(query)
@@ -241,7 +293,9 @@ class MethodQueryCanonicalizer(object):
 
         if mime.startswith('application/x-www-form-urlencoded'):
             try:
-                query = to_native_str(query.decode('utf-8'))
+                # a character may be split at the end of a truncated body
+                query = codecs.getincrementaldecoder('utf-8')().decode(query, final=not truncated)
+                query = to_native_str(query)
                 query = unquote_plus(query)
             except UnicodeDecodeError:
                 query = handle_binary(query)
@@ -292,6 +346,18 @@ class MethodQueryCanonicalizer(object):
         if query:
             self.query = query[:self.MAX_QUERY_LENGTH]
 
+    @staticmethod
+    def is_prefix_query(mime):
+        """ return True if the query for a body of this mime type only
+        depends on a prefix of the body: form data, or binary data which
+        is base64 encoded
+        """
+        if mime.startswith('application/x-www-form-urlencoded'):
+            return True
+
+        return not mime.startswith(('multipart/', 'application/x-amf',
+                                    'application/json', 'text/plain'))
+
     def amf_parse(self, string, warn_on_error):
         try:
             res = decode(BytesIO(string))
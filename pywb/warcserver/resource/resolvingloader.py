@@ -3,7 +3,9 @@ from warcio.recordloader import ArchiveLoadFailed
 from warcio.timeutils import iso_date_to_timestamp
 
 from pywb.utils.io import no_except_close
+from pywb.utils.lrucache import LRUCache
 from pywb.utils.wbexception import NotFoundException
+from pywb.warcserver.index.cdxobject import CDXObject
 from pywb.warcserver.resource.blockrecordloader import BlockArcWarcRecordLoader
 
 
@@ -13,10 +15,14 @@ class ResolvingLoader(object):
 
     EMPTY_DIGEST = '3I42H3S6NNFQ2MSVX7XZKYAYSCX5QBYJ'
 
+    # max number of (source coll, digest) -> original location entries
+    DIGEST_CACHE_SIZE = 10000
+
     def __init__(self, path_resolvers, record_loader=None, no_record_parse=False):
         self.path_resolvers = path_resolvers
         self.record_loader = record_loader if record_loader is not None else BlockArcWarcRecordLoader()
         self.no_record_parse = no_record_parse
+        self.digest_cache = LRUCache(self.DIGEST_CACHE_SIZE)
 
     def __call__(self, cdx, failed_files, cdx_loader, *args, **kwargs):
         headers_record, payload_record = self.load_headers_and_payload(cdx, failed_files, cdx_loader)
@@ -49,7 +55,8 @@ class ResolvingLoader(object):
 
         return (headers_record.http_headers, payload_record.raw_stream)
 
-    def load_headers_and_payload(self, cdx, failed_files, cdx_loader):
+    def load_headers_and_payload(self, cdx, failed_files, cdx_loader,
+                                 digest_loader=None):
         """
         Resolve headers and payload for a given capture
         In the simple case, headers and payload are in the same record.
@@ -59,7 +66,8 @@ class ResolvingLoader(object):
         If the original has already been found, lookup original using
         orig. fields in cdx dict.
         Otherwise, call _load_different_url_payload() to get cdx index
-        from a different url to find the original record.
+        from a different url to find the original record, or to look up
+        the original by digest with the optional digest_loader.
         """
         has_curr = (cdx['filename'] != '-')
         # has_orig = (cdx.get('orig.filename', '-') != '-')
@@ -78,7 +86,8 @@ class ResolvingLoader(object):
             payload_record = self._load_different_url_payload(cdx,
                                                               headers_record,
                                                               failed_files,
-                                                              cdx_loader)
+                                                              cdx_loader,
+                                                              digest_loader)
 
         # single lookup cases
         # case 2: non-revisit
@@ -154,13 +163,17 @@ class ResolvingLoader(object):
         six.reraise(ArchiveLoadFailed, ArchiveLoadFailed(filename + ': ' + msg), last_traceback)
 
     def _load_different_url_payload(self, cdx, headers_record,
-                                    failed_files, cdx_loader):
+                                    failed_files, cdx_loader,
+                                    digest_loader=None):
         """
         Handle the case where a duplicate of a capture with same digest
         exists at a different url.
 
-        If a cdx_server is provided, a query is made for matching
-        url, timestamp and digest.
+        The location of the original is first looked up by digest, in
+        the digest cache and then with the digest_loader, if provided.
+
+        Otherwise, if a cdx_server is provided, a query is made for
+        matching url, timestamp and digest.
 
         Raise exception if no matches found.
         """
@@ -189,6 +202,13 @@ class ResolvingLoader(object):
         else:
             ref_target_date = iso_date_to_timestamp(ref_target_date)
 
+        cache_key = None
+        if digest and digest != '-':
+            cache_key = self._digest_cache_key(cdx, digest)
+            payload_record = self._load_by_digest(cache_key, cdx, digest_loader)
+            if payload_record:
+                return payload_record
+
         try:
             orig_cdx_lines = self.load_cdx_for_dupe(ref_target_uri,
                                                     ref_target_date,
@@ -201,6 +221,9 @@ class ResolvingLoader(object):
             try:
                 payload_record = self._resolve_path_load(orig_cdx, False,
                                                          failed_files)
+                if cache_key:
+                    self._cache_digest(cache_key, orig_cdx)
+
                 return payload_record
 
             except ArchiveLoadFailed as e:
@@ -208,6 +231,73 @@ class ResolvingLoader(object):
 
         raise ArchiveLoadFailed(self.MISSING_REVISIT_MSG)
 
+    def _digest_cache_key(self, cdx, digest):
+        """
+        Key of the digest cache: the collection requested, as a handler
+        may be shared by several collections, the source of the cdx in
+        that collection, and the digest
+        """
+        formatter = getattr(cdx, '_formatter', None)
+        coll = formatter.params.get('param.coll') if formatter else None
+        return (coll, cdx.get('source-coll'), digest)
+
+    def _load_by_digest(self, cache_key, cdx, digest_loader):
+        """
+        Load the original record from the location cached for the digest,
+        or found by the digest_loader. Return None if not found, if
+        the record could not be loaded from that location or if its
+        payload digest does not match.
+        """
+        digest = cache_key[-1]
+        location = self.digest_cache.get(cache_key)
+
+        if not location and digest_loader:
+            orig_cdx = digest_loader(digest)
+            if orig_cdx:
+                location = (orig_cdx['filename'],
+                            orig_cdx['offset'],
+                            orig_cdx.get('length', '-'))
+
+        if not location:
+            return None
+
+        orig_cdx = CDXObject()
+        orig_cdx['filename'], orig_cdx['offset'], orig_cdx['length'] = location
+        orig_cdx._formatter = getattr(cdx, '_formatter', None)
+
+        try:
+            payload_record = self._resolve_path_load(orig_cdx, False, None)
+        except ArchiveLoadFailed:
+            payload_record = None
+
+        if payload_record and not self._is_payload_digest(payload_record, digest):
+            no_except_close(payload_record.raw_stream)
+            payload_record = None
+
+        if not payload_record:
+            self.digest_cache.pop(cache_key)
+            return None
+
+        self._cache_digest(cache_key, orig_cdx)
+        return payload_record
+
+    @staticmethod
+    def _is_payload_digest(record, digest):
+        """
+        Return False if the record has a payload digest other than digest,
+        ignoring the algorithm prefix
+        """
+        payload_digest = record.rec_headers.get_header('WARC-Payload-Digest')
+        if not payload_digest:
+            return True
+
+        return payload_digest.split(':', 1)[-1] == digest.split(':', 1)[-1]
+
+    def _cache_digest(self, cache_key, orig_cdx):
+        self.digest_cache.put(cache_key, (orig_cdx['filename'],
+                                          orig_cdx['offset'],
+                                          orig_cdx.get('length', '-')))
+
     def load_cdx_for_dupe(self, url, timestamp, digest, cdx_loader):
         """
         If a cdx_server is available, return response from server,
@@ -5,6 +5,8 @@ import os
 import uuid
 from io import BytesIO
 
+import gevent
+import gevent.threadpool
 import six
 from requests.models import PreparedRequest
 from six.moves.urllib.parse import quote, unquote, urlsplit
@@ -22,7 +24,9 @@ from warcio.utils import to_native_str
 from pywb.utils.canonicalize import canonicalize
 from pywb.utils.format import ParamFormatter
 from pywb.utils.io import StreamIter, call_release_conn, compress_gzip_iter, no_except_close
+from pywb.utils.lrucache import DiskLRUCache, LRUCache
 from pywb.utils.memento import MementoUtils
+from pywb.utils.startup import StartupProfile
 from pywb.utils.wbexception import LiveResourceException
 from pywb.warcserver.http import DefaultAdapters
 from pywb.warcserver.resource.pathresolvers import DefaultResolverMixin
@@ -199,11 +203,23 @@ class WARCPathLoader(DefaultResolverMixin, BaseLoader):
                 cdx._formatter = formatter
                 yield cdx
 
+        def local_digest_query(digest):
+            if not hasattr(self.cdx_source, 'lookup_digest'):
+                return None
+
+            local_params = {}
+            for n, v in six.iteritems(params):
+                if n.startswith('param.'):
+                    local_params[n] = v
+
+            return self.cdx_source.lookup_digest(digest, local_params)
+
         failed_files = []
         headers, payload = (self.resolve_loader.
                              load_headers_and_payload(cdx,
                                                       failed_files,
-                                                      local_index_query))
+                                                      local_index_query,
+                                                      local_digest_query))
 
         http_headers_buff = None
         if payload.rec_type in ('response', 'revisit'):
@@ -544,21 +560,191 @@ class LiveWebLoader(BaseLoader):
         return  'LiveWebLoader'
 
 
+#=============================================================================
+class VideoInfoCache(object):
+    """ Extracts video metadata in a thread pool, off the gevent hub,
+    and caches the serialized metadata of each url.
+
+    Concurrent requests for the same url wait for the same extraction.
+    A request which waits longer than 'timeout' seconds fails, but the
+    extraction continues and is cached when done.
+
+    The metadata is kept in an LRU bounded by total size in bytes, for
+    'ttl' seconds. If a cache_dir is set, it is also written there and
+    is kept across restarts, for the same ttl.
+    """
+    DEFAULT_SIZE = 8 * 1024 * 1024
+    DEFAULT_TTL = 3600
+    DEFAULT_WORKERS = 2
+    DEFAULT_TIMEOUT = 60
+
+    def __init__(self, max_size=None, ttl=None, cache_dir=None,
+                 workers=None, timeout=None):
+        self.max_size = max_size if max_size is not None else self.DEFAULT_SIZE
+        self.ttl = ttl if ttl is not None else self.DEFAULT_TTL
+        self.workers = workers or self.DEFAULT_WORKERS
+        self.timeout = timeout or self.DEFAULT_TIMEOUT
+
+        self.memory = LRUCache(self.max_size, self.ttl, sizeof=len)
+
+        # url -> AsyncResult of the extraction in progress
+        self.pending = {}
+
+        self.pool = None
+
+        self.disk_cache = None
+        if cache_dir:
+            self.disk_cache = DiskLRUCache(cache_dir, ttl=self.ttl)
+
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    @classmethod
+    def init_from_config(cls, config):
+        if not isinstance(config, dict):
+            # metadata not cached, only extracted in the pool
+            config = {'size': 0} if config is False else {}
+
+        return cls(max_size=config.get('size'),
+                   ttl=config.get('ttl'),
+                   cache_dir=config.get('dir'),
+                   workers=config.get('workers'),
+                   timeout=config.get('timeout'))
+
+    def load(self, url, extract):
+        """ return the metadata for url, calling extract(url) in the
+        pool to extract and serialize it if not cached
+
+        :raises LiveResourceException: if not extracted within the timeout
+        """
+        info_buff = self.get(url)
+        if info_buff is not None:
+            return info_buff
+
+        result = self.pending.get(url)
+        if result:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+
+            if not self.pool:
+                self.pool = gevent.threadpool.ThreadPool(self.workers)
+
+            result = self.pool.spawn(extract, url)
+            self.pending[url] = result
+            result.rawlink(lambda result: self._on_extracted(url, result))
+
+        try:
+            return result.get(timeout=self.timeout)
+        except gevent.Timeout:
+            self.timeouts += 1
+            raise LiveResourceException(url)
+
+    def _on_extracted(self, url, result):
+        if self.pending.get(url) is result:
+            self.pending.pop(url)
+
+        if result.successful():
+            self.put(url, result.value)
+
+    def get(self, url):
+        info_buff = self.memory.get(url)
+        if info_buff is not None:
+            return info_buff
+
+        info_buff = self.disk_cache.get(url) if self.disk_cache else None
+        if info_buff is not None:
+            self.disk_hits += 1
+            self.memory.put(url, info_buff, self.disk_cache.expires(url))
+            return info_buff
+
+        return None
+
+    def put(self, url, info_buff):
+        if not self.ttl:
+            return
+
+        self.memory.put(url, info_buff)
+        if self.disk_cache:
+            self.disk_cache.put(url, info_buff)
+
+    def stats(self):
+        return {'hits': self.memory.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'timeouts': self.timeouts,
+                'pending': len(self.pending),
+                'size': self.memory.curr_size,
+                'entries': len(self.memory)}
+
+
 #=============================================================================
 class VideoLoader(BaseLoader):
     CONTENT_TYPE = 'application/vnd.youtube-dl_formats+json'
 
+    # VideoInfoCache shared by all video loaders, see VideoLoader.init_info_cache()
+    info_cache = None
+
     def __init__(self):
+        self._ydl = None
+        self._ydl_loaded = False
+
+        # youtube_dl instances not in use, one is used per extraction
+        self._idle_ydls = []
+
+    @property
+    def ydl(self):
+        """ youtube_dl and its extractors are only loaded on first use
+        """
+        if not self._ydl_loaded:
+            with StartupProfile.timed('youtube_dl'):
+                self._ydl = self._init_ydl()
+
+            if self._ydl:
+                self._idle_ydls.append(self._ydl)
+
+            self._ydl_loaded = True
+
+        return self._ydl
+
+    @staticmethod
+    def _init_ydl():
         try:
             from youtube_dl import YoutubeDL as YoutubeDL
         except ImportError:
-            self.ydl = None
-            return
+            return None
+
+        ydl = YoutubeDL(dict(simulate=True, quiet=True,
+                             youtube_include_dash_manifest=False))
 
-        self.ydl = YoutubeDL(dict(simulate=True, quiet=True,
-                                  youtube_include_dash_manifest=False))
+        ydl.add_default_info_extractors()
+        return ydl
 
-        self.ydl.add_default_info_extractors()
+    @staticmethod
+    def init_info_cache(config=None):
+        """ set the cache and pool for video metadata extraction,
+        config False disables caching
+        """
+        VideoLoader.info_cache = VideoInfoCache.init_from_config(config)
+
+    def extract_info(self, url):
+        """ extract and serialize the metadata for url, run in the
+        info cache thread pool
+        """
+        try:
+            ydl = self._idle_ydls.pop()
+        except IndexError:
+            ydl = self._init_ydl()
+
+        try:
+            info = ydl.extract_info(url)
+        finally:
+            self._idle_ydls.append(ydl)
+
+        return json.dumps(info).encode('utf-8')
 
     def load_resource(self, cdx, params):
         load_url = cdx.get('load_url')
@@ -571,9 +757,10 @@ class VideoLoader(BaseLoader):
         if not self.ydl:
             return None
 
-        info = self.ydl.extract_info(load_url)
-        info_buff = json.dumps(info)
-        info_buff = info_buff.encode('utf-8')
+        if not VideoLoader.info_cache:
+            VideoLoader.init_info_cache()
+
+        info_buff = VideoLoader.info_cache.load(load_url, self.extract_info)
 
         warc_headers = {}
 
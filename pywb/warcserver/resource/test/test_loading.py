@@ -291,15 +291,23 @@ import os
 import sys
 import pprint
 import six
+import time
+
+import gevent
+import pytest
 
 from warcio.recordloader import ArcWarcRecordLoader, ArchiveLoadFailed
 
 from pywb.warcserver.resource.blockrecordloader import BlockArcWarcRecordLoader
 from pywb.warcserver.resource.resolvingloader import ResolvingLoader
 from pywb.warcserver.resource.pathresolvers import DefaultResolverMixin
+from pywb.warcserver.resource.responseloader import VideoInfoCache
 
 from pywb.warcserver.index.cdxobject import CDXObject
 
+from pywb.utils.format import ParamFormatter
+from pywb.utils.wbexception import LiveResourceException
+
 from pywb import get_test_dir
 from mock import patch
 
@@ -324,6 +332,10 @@ BAD_ORIG_CDX = b'org,iana,example)/ 20130702195401 http://example.iana.org/ \
 text/html 200 B2LTWWPUOYAH7UIPQ7ZUPQ4VMBSVC36A - - \
 1001 353 someunknown.warc.gz'
 
+OTHER_PAYLOAD_CDX = b'org,iana,example)/ 20130702195401 http://example.iana.org/ \
+text/html 200 B2LTWWPUOYAH7UIPQ7ZUPQ4VMBSVC36A - - \
+2258 334 iana.warc.gz'
+
 
 WRAP_WIDTH = 160
 
@@ -387,6 +399,93 @@ def parse_stream_error(**params):
         print('Exception: ' + e.__class__.__name__)
 
 
+#==============================================================================
+def test_revisit_digest_cache():
+    resolve_loader = ResolvingLoader(DefaultResolverMixin.make_resolvers(test_warc_dir))
+
+    def load(revisit_func, digest_loader=None, coll=None):
+        cdx = CDXObject(URL_AGNOSTIC_REVISIT_CDX.encode('utf-8'))
+        if coll:
+            cdx._formatter = ParamFormatter({'param.coll': coll})
+
+        headers, payload = resolve_loader.load_headers_and_payload(cdx, [], revisit_func,
+                                                                   digest_loader)
+        assert payload.rec_headers.get_header('WARC-Target-URI') == 'http://example.iana.org/'
+        payload.raw_stream.close()
+        headers.raw_stream.close()
+
+    def no_query(_):
+        raise AssertionError('unexpected index query')
+
+    load(load_orig_cdx)
+    assert list(resolve_loader.digest_cache.values()) == [('example-url-agnostic-orig.warc.gz', '353', '1001')]
+
+    # original loaded from cached location
+    load(no_query)
+
+    # original location from digest lookup
+    resolve_loader.digest_cache.clear()
+    orig = CDXObject(URL_AGNOSTIC_ORIG_CDX.encode('utf-8'))
+    load(no_query, lambda digest: orig if digest == 'B2LTWWPUOYAH7UIPQ7ZUPQ4VMBSVC36A' else None)
+
+    # invalid cached location, fallback to index query
+    resolve_loader.digest_cache.clear()
+    load(load_orig_cdx, lambda digest: CDXObject(BAD_ORIG_CDX))
+    assert list(resolve_loader.digest_cache.values()) == [('example-url-agnostic-orig.warc.gz', '353', '1001')]
+
+    # location of another payload, fallback to index query
+    resolve_loader.digest_cache.clear()
+    load(load_orig_cdx, lambda digest: CDXObject(OTHER_PAYLOAD_CDX))
+    assert list(resolve_loader.digest_cache.values()) == [('example-url-agnostic-orig.warc.gz', '353', '1001')]
+
+    # cached per collection, even if served by the same loader
+    resolve_loader.digest_cache.clear()
+    load(load_orig_cdx, coll='coll-a')
+    load(load_orig_cdx, coll='coll-b')
+    assert len(resolve_loader.digest_cache) == 2
+
+    load(no_query, coll='coll-b')
+
+
+#==============================================================================
+def test_video_info_cache(tmpdir):
+    cache_dir = os.path.join(str(tmpdir), 'video')
+    cache = VideoInfoCache(cache_dir=cache_dir, timeout=5)
+
+    calls = []
+
+    def extract(url):
+        calls.append(url)
+        time.sleep(0.2)
+        return ('{"url": "' + url + '"}').encode('utf-8')
+
+    # concurrent requests share one extraction
+    jobs = [gevent.spawn(cache.load, 'http://example.com/v', extract) for _ in range(3)]
+    gevent.joinall(jobs)
+
+    assert [job.value for job in jobs] == [b'{"url": "http://example.com/v"}'] * 3
+    assert calls == ['http://example.com/v']
+    assert cache.stats()['coalesced'] == 2
+
+    # cached
+    assert cache.load('http://example.com/v', extract) == b'{"url": "http://example.com/v"}'
+    assert len(calls) == 1
+
+    # persisted
+    cache = VideoInfoCache(cache_dir=cache_dir, timeout=0.05)
+    assert cache.load('http://example.com/v', extract) == b'{"url": "http://example.com/v"}'
+    assert cache.stats()['disk_hits'] == 1
+    assert len(calls) == 1
+
+    # timeout, but still cached when done
+    with pytest.raises(LiveResourceException):
+        cache.load('http://example.com/v2', extract)
+
+    gevent.sleep(0.3)
+    assert cache.load('http://example.com/v2', extract) == b'{"url": "http://example.com/v2"}'
+    assert len(calls) == 2
+
+
 #==============================================================================
 def print_strs(strings):
     return list(map(lambda string: string.encode('utf-8') if six.PY2 else string, strings))
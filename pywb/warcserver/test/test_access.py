@@ -140,3 +140,74 @@ class TestAccess(TempDirTests, BaseTestClass):
         edx = access.find_access_rule('https://www.lonesome-rule.org/')
         assert edx['urlkey'] == 'org,lonesome-rule)/###'
         assert edx['access'] == 'allow'
+
+    def test_user_rules(self):
+        agg = SimpleAggregator({'source': FileAccessIndexSource(TEST_EXCL_PATH + 'pywb.aclj')})
+        access = AccessChecker(agg)
+
+        edx = access.find_access_rule('https://www.iana.org/about')
+        assert edx['urlkey'] == 'org,iana)/about'
+        assert edx['access'] == 'block'
+
+        edx = access.find_access_rule('https://www.iana.org/about', acl_user='staff')
+        assert edx['urlkey'] == 'org,iana)/about'
+        assert edx['access'] == 'allow'
+
+        edx = access.find_access_rule('https://www.iana.org/about', acl_user='other')
+        assert edx['access'] == 'block'
+
+        assert access.compiled
+
+    def test_compiled_matches_query(self):
+        access = AccessChecker(DirectoryAccessSource(TEST_EXCL_PATH), default_access='block')
+
+        for url in ['http://example.com/', 'http://example.bo', 'https://example.com/foo/path',
+                    'https://example.net/abc/path/other', 'https://www.iana.org/',
+                    'https://www.iana.org/x', 'https://www.iana.org/about',
+                    'https://www.iana.org/_css/2013.1/fonts/opensans-semibold.ttf',
+                    'https://www.lonesome-rule.org/', 'http://foo.net/']:
+            for user in [None, 'staff']:
+                assert access.find_access_rule(url, acl_user=user) == access._query_access_rule(url, acl_user=user)
+
+        assert access.compiled
+
+    def test_reload_on_change(self):
+        filename = os.path.join(self.root_dir, 'reload.aclj')
+        with open(filename, 'wt') as fh:
+            fh.write('com,example)/ - {"access": "block"}\n')
+
+        access = AccessChecker(filename)
+
+        edx = access.find_access_rule('http://example.com/path')
+        assert edx['access'] == 'block'
+
+        with open(filename, 'wt') as fh:
+            fh.write('com,example)/path - {"access": "exclude"}\n')
+            fh.write('com,example)/ - {"access": "block"}\n')
+
+        # ensure mtime changes
+        os.utime(filename, (0, 0))
+
+        edx = access.find_access_rule('http://example.com/path')
+        assert edx['urlkey'] == 'com,example)/path'
+        assert edx['access'] == 'exclude'
+
+        os.remove(filename)
+
+        edx = access.find_access_rule('http://example.com/path')
+        assert edx['urlkey'] == ''
+        assert edx['access'] == 'allow'
+
+    def test_embargo_range(self):
+        access = AccessChecker(TEST_EXCL_PATH + 'allows.aclj', embargo={'before': '20140126'})
+
+        assert access.get_embargo_range() == ('<', '20140126235959')
+
+        assert access.check_embargo('http://example.com/', '20140127201054') == None
+        assert access.check_embargo('http://example.com/', '20140126201054') == 'exclude'
+        assert access.check_embargo('http://example.com/', '2013') == 'exclude'
+
+        access = AccessChecker(TEST_EXCL_PATH + 'allows.aclj', embargo={'newer': {'days': 1}, 'access': 'block'})
+
+        assert access.check_embargo('http://example.com/', '20140126201054') == None
+        assert access.check_embargo('http://example.com/', '29990101000000') == 'block'
@@ -27,7 +27,10 @@ from pywb.warcserver.index.aggregator import GeventTimeoutAggregator, SimpleAggr
 from pywb.warcserver.index.aggregator import DirectoryIndexSource
 
 from pywb.warcserver.basewarcserver import BaseWarcServer
+from pywb.warcserver.access_checker import AccessChecker, FileAccessIndexSource
 from pywb.utils.memento import MementoUtils
+from pywb.utils.wbexception import AccessException
+from pywb import get_test_dir
 
 
 sources = {
@@ -505,3 +508,47 @@ host: www.youtube.com\
         assert resp.text == resp.headers['ResErrors']
 
 
+
+    def test_live_only_load_cdx(self):
+        handler = DefaultResourceHandler(SimpleAggregator({'live': LiveIndexSource()}))
+        assert handler.live_source[0] == 'live'
+
+        cdx_iter, errs = handler._load_live_cdx({'url': 'http://example.com/path',
+                                                 'content_type': 'text/html'})
+        cdxlist = list(cdx_iter)
+        assert errs == {}
+        assert len(cdxlist) == 1
+        assert cdxlist[0]['urlkey'] == 'com,example)/path'
+        assert cdxlist[0]['mime'] == 'text/html'
+        assert cdxlist[0]['source'] == 'live'
+        assert cdxlist[0]['source-coll'] == 'live'
+
+        cdx_iter, errs = handler._load_live_cdx({})
+        assert cdx_iter is None
+        assert 'last_exc' in errs
+
+        multi = DefaultResourceHandler(SimpleAggregator(sources))
+        assert multi.live_source is None
+
+    def test_live_only_access_checker(self):
+        acl_source = FileAccessIndexSource(get_test_dir() + 'access/pywb.aclj')
+        access_checker = AccessChecker(SimpleAggregator({'acl': acl_source}))
+
+        handler = DefaultResourceHandler(SimpleAggregator({'live': LiveIndexSource()}),
+                                         access_checker=access_checker)
+        assert handler.live_source[0] == 'live'
+
+        cdx_iter, errs = handler._load_live_cdx({'url': 'https://www.iana.org/about'})
+        cdxlist = list(cdx_iter)
+        assert errs == {}
+        assert len(cdxlist) == 1
+        assert cdxlist[0]['access'] == 'block'
+
+        # blocked before any live load
+        with pytest.raises(AccessException) as exc:
+            handler({'url': 'https://www.iana.org/about'})
+
+        assert exc.value.msg['access'] == 'block'
+
+        cdx_iter, errs = handler._load_live_cdx({'url': 'https://www.iana.org/_css/2013.1/fonts/opensans-semibold.ttf'})
+        assert [cdx['access'] for cdx in cdx_iter] == ['allow']
@@ -1,7 +1,9 @@
 from pywb.warcserver.inputrequest import DirectWSGIInputRequest, POSTInputRequest, MethodQueryCanonicalizer
+from pywb.utils.io import ChainedReader
 from werkzeug.routing import Map, Rule
 
 import webtest
+import json
 from six.moves.urllib.parse import parse_qsl
 from io import BytesIO
 from pyamf import AMF3
@@ -79,6 +81,45 @@ Foo: Bar\r\n\
 '
 
 
+    def test_post_stream_large_body(self):
+        body = b'A' * (DirectWSGIInputRequest.MAX_BUFFERED_BODY_SIZE + 10)
+        env = {'REQUEST_METHOD': 'POST',
+               'SERVER_PROTOCOL': 'HTTP/1.1',
+               'PATH_INFO': '/upload',
+               'CONTENT_LENGTH': str(len(body)),
+               'CONTENT_TYPE': 'application/octet-stream',
+               'wsgi.input': BytesIO(body)}
+
+        inputreq = DirectWSGIInputRequest(env)
+        url = inputreq.include_method_query('http://example.com/upload')
+        assert url.startswith('http://example.com/upload?__wb_method=POST&__wb_post_data=QUFB')
+
+        stream, length = inputreq.reconstruct_request_stream('http://example.com/upload')
+        assert isinstance(stream, ChainedReader)
+        assert len(stream) == length
+
+        data = stream.read(length)
+        while True:
+            buff = stream.read()
+            if not buff:
+                break
+            data += buff
+
+        assert len(data) == length
+        assert data.startswith(b'POST /upload HTTP/1.1\r\n')
+        assert data.endswith(b'\r\n\r\n' + body)
+
+    def test_post_method_query_no_body(self):
+        env = {'REQUEST_METHOD': 'POST',
+               'CONTENT_LENGTH': '3',
+               'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+               'wsgi.input': BytesIO(b'a=b')}
+
+        inputreq = DirectWSGIInputRequest(env)
+        assert inputreq.include_method_query('http://example.com/', read_body=False) == 'http://example.com/?__wb_method=POST'
+        assert inputreq.get_req_body().read() == b'a=b'
+
+
 class TestPostQueryExtract(object):
     @classmethod
     def setup_class(cls):
@@ -144,6 +185,38 @@ class TestPostQueryExtract(object):
 
         assert mq.append_query('http://example.com/') == 'http://example.com/?__wb_method=POST&foo=bar&dir=/baz'
 
+    def test_post_extract_bounded_read(self):
+        post_data = b'a=' + b'b' * (MethodQueryCanonicalizer.MAX_POST_SIZE * 2)
+        stream = BytesIO(post_data)
+        mq = MethodQueryCanonicalizer('POST', 'application/x-www-form-urlencoded',
+                                len(post_data), stream,
+                                max_read=MethodQueryCanonicalizer.MAX_POST_SIZE)
+
+        assert mq.read_len == MethodQueryCanonicalizer.MAX_POST_SIZE
+        assert stream.tell() == MethodQueryCanonicalizer.MAX_POST_SIZE
+        assert len(mq.query) == MethodQueryCanonicalizer.MAX_QUERY_LENGTH
+
+        # same query as a full read, as when indexing
+        full = MethodQueryCanonicalizer('POST', 'application/x-www-form-urlencoded',
+                                  len(post_data), BytesIO(post_data))
+
+        assert full.read_len == len(post_data)
+        assert full.query == mq.query
+
+    def test_post_extract_bounded_read_json(self):
+        post_data = json.dumps({'a': 'b' * MethodQueryCanonicalizer.MAX_POST_SIZE,
+                                'c': 'd'}).encode('utf-8')
+
+        stream = BytesIO(post_data)
+        mq = MethodQueryCanonicalizer('POST', 'application/json',
+                                len(post_data), stream,
+                                max_read=MethodQueryCanonicalizer.MAX_POST_SIZE)
+
+        # json is parsed whole
+        assert mq.read_len == len(post_data)
+        assert mq.query == MethodQueryCanonicalizer('POST', 'application/json',
+                                              len(post_data), BytesIO(post_data)).query
+
     def test_post_extract_malformed_form_data(self):
         mq = MethodQueryCanonicalizer('POST', 'application/x-www-form-urlencoded',
                                 len(self.binary_post_data), BytesIO(self.binary_post_data))
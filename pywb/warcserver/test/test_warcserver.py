@@ -6,6 +6,7 @@ from pywb.warcserver.index.indexsource import RemoteIndexSource, LiveIndexSource
 from pywb.warcserver.index.indexsource import WBMementoIndexSource, FileIndexSource
 from pywb.warcserver.index.aggregator import BaseSourceListAggregator, DirectoryIndexSource
 from pywb.warcserver.handlers import ResourceHandler, HandlerSeq
+from pywb.warcserver.index.resultcache import CDXResultCache
 
 
 # ============================================================================
@@ -125,3 +126,16 @@ class TestWarcServer(TempDirTests, BaseTestClass):
         assert len(sources) == 1
         assert isinstance(sources['live'], LiveIndexSource)
 
+
+    def test_cache_stats(self):
+        # cdx result cache not enabled in config
+        assert 'cdx_cache' not in self.loader.cache_stats()
+
+        self.loader.cdx_cache = CDXResultCache()
+        try:
+            stats = self.loader.cache_stats()
+        finally:
+            self.loader.cdx_cache = None
+
+        assert stats['cdx_cache']['hits'] == 0
+        assert stats['cdx_cache']['size'] == 0
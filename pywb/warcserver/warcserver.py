@@ -1,4 +1,4 @@
-from pywb.utils.loaders import load_yaml_config, load_overlay_config
+from pywb.utils.loaders import load_yaml_config, load_overlay_config, BlockLoader
 
 from pywb.warcserver.basewarcserver import BaseWarcServer
 
@@ -9,6 +9,7 @@ from pywb.warcserver.index.aggregator import CacheDirectoryIndexSource, RedisMul
 from pywb.warcserver.index.aggregator import GeventTimeoutAggregator, SimpleAggregator
 
 from pywb.warcserver.handlers import DefaultResourceHandler, HandlerSeq
+from pywb.warcserver.resource.responseloader import VideoLoader
 
 from pywb.warcserver.index.indexsource import FileIndexSource, RemoteIndexSource
 from pywb.warcserver.index.indexsource import MementoIndexSource, RedisIndexSource
@@ -16,6 +17,7 @@ from pywb.warcserver.index.indexsource import LiveIndexSource, WBMementoIndexSou
 from pywb.warcserver.index.indexsource import XmlQueryIndexSource
 
 from pywb.warcserver.index.zipnum import ZipNumIndexSource
+from pywb.warcserver.index.resultcache import CDXResultCache
 
 from pywb.warcserver.access_checker import AccessChecker, CacheDirectoryAccessSource
 
@@ -102,6 +104,14 @@ class WarcServer(BaseWarcServer):
                                                              cert_reqs=certs_config.get('cert_reqs', 'CERT_NONE'),
                                                              ca_cert_dir=certs_config.get('ca_cert_dir'))
 
+        self.cdx_cache = CDXResultCache.init_from_config(self.config.get('cdx_cache'))
+
+        if 'remote_block_cache' in self.config:
+            BlockLoader.init_range_cache(self.config['remote_block_cache'])
+
+        if 'video_info_cache' in self.config:
+            VideoLoader.init_info_cache(self.config['video_info_cache'])
+
         self.auto_handler = None
 
         if self.config.get('enable_auto_colls', True):
@@ -154,6 +164,8 @@ class WarcServer(BaseWarcServer):
         else:
             source = dir_source
 
+        source.result_cache = self.cdx_cache
+
         return DefaultResourceHandler(source, self.archive_paths,
                                       rules_file=self.rules_file,
                                       access_checker=access_checker)
@@ -180,6 +192,18 @@ class WarcServer(BaseWarcServer):
         except (IOError, OSError):
             return []
 
+    def cache_stats(self):
+        """ return the stats of each cache used to load indexes and
+        resources, by cache name
+        """
+        caches = {'cdx_cache': self.cdx_cache,
+                  'zipnum_block_cache': ZipNumIndexSource.shared_block_cache,
+                  'remote_block_cache': BlockLoader.range_cache,
+                  'video_info_cache': VideoLoader.info_cache}
+
+        return dict((name, cache.stats()) for name, cache in iteritems(caches)
+                    if cache is not None)
+
     def load_colls(self):
         routes = {}
 
@@ -241,6 +265,10 @@ class WarcServer(BaseWarcServer):
             timeout = int(coll_config.get('timeout', 0))
             agg = init_index_agg(index_group, True, timeout)
 
+        # live results are never cached
+        if not agg.is_live_only():
+            agg.result_cache = self.cdx_cache
+
         # ARCHIVE CONFIG
         if not archive_paths:
             archive_paths = self.config.get('archive_paths')